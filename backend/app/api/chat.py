@@ -1,16 +1,61 @@
 # app/api/chat.py
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from app.services.vectorstore import search_index, load_or_create_index
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.services.shards import DEFAULT_COLLECTION, collection_manager
+from app.services.vectorstore import normalize_vec
+from app.services.embedding_cache import embedding_cache
+from app.services.embeddings import get_embedding
+from app.services.answer_cache import answer_cache
+from app.services.chunking import approx_tokens
+from app.services.context import assemble_context
+from app.services.generation import get_generation_backend
+from app.services import metrics
+from app.services.metrics import observe_stage, span
 from app.config import settings
-import google.generativeai as genai
+import asyncio
+import json
 import logging
+import numpy as np
+import time
 
 router = APIRouter()
-genai.configure(api_key=settings.GEMINI_API_KEY)
+
+FIRST_TOKEN_SECONDS = metrics.histogram("chat_first_token_seconds", "Time to the first streamed token of a /chat/stream answer.")
+PROMPT_TOKENS = metrics.histogram("chat_prompt_tokens", "Approximate tokens per chat prompt, and in its retrieved chunks before context assembly.",
+                                  ["part"], buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000))
 
 class QueryRequest(BaseModel):
     query: str
+    search_mode: Optional[str] = None  # "vector" | "hybrid"; defaults to settings.SEARCH_MODE
+    # per-request rerank overrides; unset values use the RERANK_* settings
+    alpha: Optional[float] = None
+    beta: Optional[float] = None
+    gamma: Optional[float] = None
+    recency_halflife_days: Optional[float] = None
+    overfetch: Optional[int] = Field(default=None, ge=1, le=100)
+    # per-request context assembly overrides (CONTEXT_MAX_TOKENS / MMR_LAMBDA)
+    max_context_tokens: Optional[int] = Field(default=None, ge=100, le=100000)
+    mmr_lambda: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    # collection(s) to search: one name, several (fanned out and merged), or "*" for all;
+    # defaults to the "default" collection
+    collection: Optional[str] = None
+    collections: Optional[List[str]] = None
+    # include the per-stage timings of this request in the response
+    trace: bool = False
+
+def target_collections(req: QueryRequest) -> List[str]:
+    names = list(req.collections or [])
+    if req.collection:
+        names.insert(0, req.collection)
+    try:
+        return collection_manager.resolve(names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {e.args[0]}")
 
 def build_prompt(context: str, query: str) -> str:
     return f"""
@@ -28,54 +73,208 @@ Answer factually and conversationally.
 End with: Sources: [file1, file2]
 """
 
+def retrieve(req: QueryRequest, names: List[str]):
+    """
+    Search the target collections and build the prompt. Returns (prompt, sources, usage),
+    or (None, answer, None) when there is nothing to send to the model.
+    """
+    logging.info(f"User query: {req.query} (collections: {', '.join(names)})")
+    if collection_manager.is_empty(names):
+        return None, "No indexed documents available.", None
+
+    # CONTEXT_CANDIDATES hits for context assembly, from a rerank pool still sized by TOP_K * overfetch
+    candidates = max(settings.CONTEXT_CANDIDATES, settings.TOP_K)
+    overfetch = -(-settings.TOP_K * (req.overfetch or settings.RERANK_OVERFETCH) // candidates)
+    with span("retrieve"):
+        hits = collection_manager.search(
+            req.query, names, top_k=candidates, mode=req.search_mode,
+            alpha=req.alpha, beta=req.beta, gamma=req.gamma,
+            recency_halflife_days=req.recency_halflife_days, overfetch=overfetch, with_vectors=True,
+        )
+    if not hits:
+        return None, "No relevant content found.", None
+
+    with span("prompt_build"):
+        prompt, sources, usage = assemble_prompt(req, hits)
+    logging.info(f"Prompt: ~{usage['prompt_tokens']} tokens ({usage['passages']} passages from "
+                 f"{usage['chunks']} chunks; ~{usage['retrieved_tokens']} tokens in the top {settings.TOP_K} hits)")
+    return prompt, sources, usage
+
+def assemble_prompt(req: QueryRequest, hits: list):
+    """
+    Drop exact duplicates, then pick, merge and pack the hits into the context budget
+    (see app.services.context). Returns (prompt, sources, usage); usage counts are
+    approximate tokens, `retrieved_tokens` being the top TOP_K hits pasted as they are.
+    """
+    seen_texts = set()
+    unique_hits = []
+    for h in hits:
+        t = h["text"].strip()
+        if t and t not in seen_texts:
+            unique_hits.append(h)
+            seen_texts.add(t)
+
+    max_tokens = req.max_context_tokens or settings.CONTEXT_MAX_TOKENS
+    mmr_lambda = settings.MMR_LAMBDA if req.mmr_lambda is None else req.mmr_lambda
+    passages, context, chunks = assemble_context(unique_hits, settings.TOP_K, max_tokens, mmr_lambda)
+    prompt = build_prompt(context, req.query)
+
+    usage = {
+        "prompt_tokens": approx_tokens(prompt),
+        "context_tokens": approx_tokens(context),
+        "retrieved_tokens": sum(approx_tokens(h["text"]) for h in unique_hits[:settings.TOP_K]),
+        "chunks": chunks,
+        "passages": len(passages),
+    }
+    PROMPT_TOKENS.observe(usage["prompt_tokens"], part="prompt")
+    PROMPT_TOKENS.observe(usage["retrieved_tokens"], part="retrieved")
+
+    sources = [{"filename": p["filename"], "preview": p["text"][:400], "timestamp": p["timestamp"], "page": p.get("page") or None, "document_id": p.get("document_id"), "collection": p.get("collection"), "char_start": p.get("char_start"), "char_end": p.get("char_end")} for p in passages]
+    return prompt, sources, usage
+
+def lookup_answer(req: QueryRequest, names: List[str]):
+    """
+    Check the answer cache. Returns (hit or None, cache key) where the key is what
+    store_answer needs to cache a fresh answer for this request.
+    """
+    if not answer_cache.enabled:
+        return None, None
+    for name in names:
+        collection_manager.get(name).snapshot()  # make sure the indexes (and their versions) are loaded
+    version = collection_manager.generation()
+    options = json.dumps(req.model_dump(exclude={"query", "trace"}), sort_keys=True)
+    # search_index embeds the query again on a miss; the embedding cache makes that free
+    vec = get_embedding(req.query)
+    qvec = normalize_vec(np.array(vec, dtype="float32")) if vec is not None else None
+    key = (req.query, qvec, options, version)
+    with span("answer_cache"):
+        return answer_cache.get(*key), key
+
+def store_answer(key, answer: str, sources: list):
+    if key is not None:
+        answer_cache.put(*key, answer, sources)
+
+def with_trace(body: dict, t) -> dict:
+    return {**body, "trace": t.to_dict()} if t is not None else body
+
 @router.post("/chat")
 def chat(req: QueryRequest):
+    names = target_collections(req)
     try:
-        logging.info(f"User query: {req.query}")
-        index, metadata = load_or_create_index()
-        if index is None or index.ntotal == 0:
-            return {"answer": "No indexed documents available.", "sources": []}
-
-        hits = search_index(req.query, index, metadata, top_k=min(settings.TOP_K, 10))
-        if not hits:
-            return {"answer": "No relevant content found.", "sources": []}
-
-        # deduplicate
-        seen_texts = set()
-        unique_hits = []
-        for h in hits:
-            t = h["text"].strip()
-            if t and t not in seen_texts:
-                unique_hits.append(h)
-                seen_texts.add(t)
-
-        # Build context prioritizing recency (search_index already uses recency in final_score)
-        context_parts = []
-        for h in unique_hits[:settings.TOP_K]:
-            context_parts.append(f"[Source: {h['filename']} | ts: {h['timestamp']}]\n{h['text']}")
-
-        context = "\n\n---\n".join(context_parts)
-        prompt = build_prompt(context, req.query)
-        logging.info(f"Prompt length: {len(prompt)} chars")
-
-        model = genai.GenerativeModel(settings.GEMINI_MODEL)
-        response = model.generate_content(prompt)
-        answer_text = ""
-        if response:
-            # adapt depending on response shape
-            if hasattr(response, "text"):
-                answer_text = response.text.strip()
-            elif isinstance(response, dict) and "candidates" in response:
-                # fallback: pick first candidate text
-                answer_text = response["candidates"][0].get("content", "").strip()
-            else:
-                answer_text = str(response)[:1000]
-        else:
-            answer_text = "No response from the model."
-
-        sources = [{"filename": h["filename"], "preview": h["text"][:400], "timestamp": h["timestamp"]} for h in unique_hits[:settings.TOP_K]]
-        return {"answer": answer_text, "sources": sources}
+        with metrics.trace(req.trace) as t:
+            hit, key = lookup_answer(req, names)
+            if hit is not None:
+                return with_trace(hit, t)
+
+            prompt, result, usage = retrieve(req, names)
+            if prompt is None:
+                return with_trace({"answer": result, "sources": [], "cached": None}, t)
+
+            with span("generate"):
+                answer_text = get_generation_backend().generate(prompt)
+            store_answer(key, answer_text, result)
+            return with_trace({"answer": answer_text, "sources": result, "cached": None, "usage": usage}, t)
 
     except Exception as e:
         logging.exception("Chat endpoint failed")
         raise HTTPException(status_code=500, detail=f"Chat endpoint failed: {type(e).__name__}: {e}")
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(req: QueryRequest, request: Request):
+    """
+    Same retrieval as /chat, but the answer is streamed as Server-Sent Events:
+    `token` events with {"text"} as the model produces them, then one `sources`
+    event and a final `done` (with the prompt's token usage). Generation stops when
+    the client disconnects.
+    A cached answer is sent as a single token event. With "trace": true the `done`
+    event carries the request's stage timings.
+    """
+    names = await run_in_threadpool(target_collections, req)
+    # run_in_threadpool copies the context, so spans in the worker threads land in this trace
+    t = metrics.Trace() if req.trace else None
+    with metrics.activate(t):
+        try:
+            # embedding and search do blocking work; keep them off the event loop
+            prompt, result, usage = None, None, None
+            hit, key = await run_in_threadpool(lookup_answer, req, names)
+            if hit is None:
+                prompt, result, usage = await run_in_threadpool(retrieve, req, names)
+        except Exception as e:
+            logging.exception("Chat stream retrieval failed")
+            raise HTTPException(status_code=500, detail=f"Chat endpoint failed: {type(e).__name__}: {e}")
+
+    async def events():
+        start = time.perf_counter()
+        if hit is not None:
+            yield sse("token", {"text": hit["answer"]})
+            yield sse("sources", hit["sources"])
+            yield sse("done", with_trace({"tokens": 1, "seconds": 0.0, "cached": hit["cached"]}, t))
+            return
+        if prompt is None:
+            yield sse("token", {"text": result})
+            yield sse("sources", [])
+            yield sse("done", with_trace({"tokens": 1, "seconds": 0.0}, t))
+            return
+
+        tokens, first_token, parts = 0, None, []
+        stream = get_generation_backend().stream(prompt)
+        try:
+            async for text in stream:
+                if await request.is_disconnected():
+                    logging.info("Chat stream client disconnected; stopping generation")
+                    return
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    FIRST_TOKEN_SECONDS.observe(first_token)
+                tokens += 1
+                parts.append(text)
+                yield sse("token", {"text": text})
+            seconds = time.perf_counter() - start
+            observe_stage("generate", seconds)
+            if t is not None:
+                t.add("generate", seconds)
+            store_answer(key, "".join(parts).strip(), result)
+            yield sse("sources", result)
+            yield sse("done", with_trace({
+                "tokens": tokens,
+                "first_token_seconds": round(first_token or 0.0, 4),
+                "seconds": round(seconds, 4),
+                "cached": None,
+                "usage": usage,
+            }, t))
+        except asyncio.CancelledError:
+            logging.info("Chat stream cancelled; stopping generation")
+            raise
+        except Exception as e:
+            logging.exception("Chat stream generation failed")
+            yield sse("error", {"detail": f"{type(e).__name__}: {e}"})
+        finally:
+            # closes the model stream so an abandoned generation does not keep running
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/index/stats")
+def index_stats(collection: str = Query(DEFAULT_COLLECTION)):
+    try:
+        return collection_manager.get(collection).stats()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {collection}")
+
+@router.get("/collections")
+def list_collections():
+    return {"collections": collection_manager.stats()}
+
+@router.get("/embeddings/cache/stats")
+def embedding_cache_stats():
+    return embedding_cache.stats()
+
+@router.get("/chat/cache/stats")
+def answer_cache_stats():
+    return answer_cache.stats()
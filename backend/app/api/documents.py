@@ -0,0 +1,70 @@
+# app/api/documents.py
+import logging
+from fastapi import APIRouter, HTTPException, Query
+from pymongo.errors import PyMongoError
+from typing import Optional
+from app.models.db_models import document_repository
+from app.services.shards import DEFAULT_COLLECTION, CollectionManager, collection_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _validate(collection: str):
+    try:
+        CollectionManager.validate(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/documents")
+def list_documents(collection: Optional[str] = Query(None, description="all collections when unset"),
+                   status: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                   cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                   include_text: bool = False):
+    """Stored document records in upload order, a page at a time; bodies and entities are left out unless include_text."""
+    if collection:
+        _validate(collection)
+    try:
+        docs, next_cursor = document_repository.list(collection, status, limit, cursor, include_text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PyMongoError as e:
+        raise HTTPException(status_code=503, detail=f"Document store unavailable: {type(e).__name__}")
+    return {"documents": docs, "next_cursor": next_cursor}
+
+@router.get("/documents/{document_id}")
+def get_document(document_id: str, collection: str = Query(DEFAULT_COLLECTION), include_text: bool = False):
+    """One document record; with include_text, its full extracted text (what chunk char_start / char_end index into)."""
+    _validate(collection)
+    try:
+        doc = document_repository.get(document_id, collection, include_text)
+    except PyMongoError as e:
+        raise HTTPException(status_code=503, detail=f"Document store unavailable: {type(e).__name__}")
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+@router.delete("/documents/{document_id}")
+def delete_document(document_id: str, collection: str = Query(DEFAULT_COLLECTION)):
+    """Remove a document from search right away; its chunks are reclaimed by background compaction."""
+    try:
+        manager = collection_manager.get(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {collection}")
+    filename = manager.find_document(document_id)
+    if filename is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        deleted = manager.delete_document(filename)
+    except Exception as e:
+        logger.exception(f"Deleting {filename} from {collection} failed")
+        raise HTTPException(status_code=500, detail=f"Internal error: {type(e).__name__}: {e}")
+
+    try:
+        document_repository.delete_by_filename(filename, collection)
+    except Exception as e:
+        logger.warning(f"Could not delete stored metadata for {filename}: {type(e).__name__}: {e}")
+
+    return {"document_id": document_id, "filename": filename, "collection": collection, "chunks_deleted": deleted}
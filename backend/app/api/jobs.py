@@ -0,0 +1,17 @@
+# app/api/jobs.py
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.workers.processor import ingestion_queue
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = ingestion_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs")
+def list_jobs(limit: int = Query(50, ge=1, le=500), status: Optional[str] = None):
+    return {"queue": ingestion_queue.stats(), "jobs": ingestion_queue.store.list(limit=limit, status=status)}
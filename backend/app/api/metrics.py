@@ -0,0 +1,75 @@
+# app/api/metrics.py
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.services.answer_cache import answer_cache
+from app.services.embedding_cache import embedding_cache
+from app.services.metrics import REGISTRY, gauge
+from app.services.profiler import profiler
+from app.services.shards import collection_manager
+from app.workers.processor import ingestion_queue
+
+# /metrics at the root, where scrapers look by default; the profiler lives under /api
+router = APIRouter()
+profiler_router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _cache_stats(cache, *fields):
+    def read():
+        stats = cache.stats()
+        return {(f,): stats[f] for f in fields}
+    return read
+
+
+def _collection_stats(field):
+    def read():
+        return {(c["collection"],): c[field] for c in collection_manager.stats()}
+    return read
+
+
+# read at scrape time
+gauge("embedding_cache_events", "Embedding cache lookups since start, by outcome.", ["result"],
+      callback=_cache_stats(embedding_cache, "memory_hits", "disk_hits", "misses", "evictions"))
+gauge("embedding_cache_entries", "Entries in the embedding cache.", ["tier"],
+      callback=_cache_stats(embedding_cache, "memory_entries", "disk_entries"))
+gauge("answer_cache_events", "Answer cache lookups since start, by outcome.", ["result"],
+      callback=_cache_stats(answer_cache, "exact_hits", "semantic_hits", "misses", "evictions", "invalidations"))
+gauge("answer_cache_entries", "Entries in the answer cache.", callback=lambda: answer_cache.stats()["entries"])
+gauge("index_vectors", "Live vectors per collection.", ["collection"], callback=_collection_stats("vectors"))
+gauge("index_segments", "Segment files per collection.", ["collection"], callback=_collection_stats("segments"))
+gauge("collection_loaded", "1 when the collection's index is in memory.", ["collection"],
+      callback=lambda: {(c["collection"],): int(c["loaded"]) for c in collection_manager.stats()})
+gauge("ingest_jobs", "Ingestion jobs by status (queued = queue depth).", ["status"],
+      callback=lambda: {(status,): n for status, n in ingestion_queue.store.counts().items()})
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@profiler_router.post("/profiler/start")
+def start_profiler(interval_ms: float = Query(5.0, gt=0, le=1000),
+                   duration_s: float = Query(None, gt=0, description="stop by itself after this long"),
+                   reset: bool = True):
+    if not profiler.start(interval_ms / 1000.0, duration_s, reset):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.stats()
+
+
+@profiler_router.post("/profiler/stop")
+def stop_profiler():
+    profiler.stop()
+    return profiler.stats()
+
+
+@profiler_router.get("/profiler")
+def profiler_report(top: int = Query(20, ge=1, le=500)):
+    return {**profiler.stats(), "top": profiler.top(top)}
+
+
+@profiler_router.get("/profiler/collapsed", response_class=PlainTextResponse)
+def profiler_collapsed():
+    """Collapsed stacks, one "frame;frame;frame count" line each (flamegraph.pl / speedscope)."""
+    return PlainTextResponse(profiler.collapsed())
@@ -1,59 +1,108 @@
 # app/api/upload.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+import hashlib
+import logging
 import os
+import tempfile
 from app.config import settings
-from app.services.embeddings import embed_document
-from app.services.ocr import extract_text_from_pdf, extract_text_from_image
-from app.services.vectorstore import load_or_create_index, add_to_index, save_index
-import traceback
+from app.services.metrics import counter, span
+from app.services.shards import DEFAULT_COLLECTION, CollectionManager
+from app.workers.processor import QueueFullError, ingestion_queue
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    try:
-        os.makedirs(settings.STORAGE_PATH, exist_ok=True)
-        os.makedirs(os.path.dirname(settings.VECTOR_PATH) or ".", exist_ok=True)
-
-        file_path = os.path.join(settings.STORAGE_PATH, file.filename)
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-
-        ext = file.filename.lower()
-        if ext.endswith(".pdf"):
-            text = extract_text_from_pdf(file_path)
-        elif ext.endswith((".png", ".jpg", ".jpeg")):
-            text = extract_text_from_image(file_path)
-        else:
-            try:
-                text = content.decode(errors="ignore")
-            except Exception:
-                text = ""
+UPLOADS = counter("uploads_total", "Upload requests, by outcome.", ["result"])
+UPLOAD_BYTES = counter("upload_bytes_total", "Bytes received in accepted uploads.")
 
-        if not text or not text.strip():
-            raise HTTPException(status_code=400, detail="No extractable text in file.")
+# room for the multipart boundary and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
 
-        print(f"[DEBUG] Extracted {len(text)} chars from {file.filename}")
+class UploadTooLarge(Exception):
+    pass
 
-        index, metadata = load_or_create_index()
-        chunks, embeddings = embed_document(text, chunk_size=settings.CHUNK_SIZE, overlap=settings.CHUNK_OVERLAP)
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No chunks created from document.")
+def blob_path(sha256: str, filename: str) -> str:
+    """Content-addressed location of an upload; the extension is kept so extraction can dispatch on it."""
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(settings.STORAGE_PATH, "blobs", sha256[:2], sha256 + ext)
 
-        # keep embeddings aligned with chunks; embeddings may include None
-        valid_embeds = [e for e in embeddings if e is not None]
-        if not valid_embeds:
-            raise HTTPException(status_code=400, detail="Embedding failed for all chunks.")
+async def save_upload(file: UploadFile, filename: str):
+    """
+    Stream the upload to a temporary file in UPLOAD_CHUNK_BYTES pieces, hashing as it goes,
+    then move it to its content-addressed path. Returns (path, sha256, size).
+    """
+    tmp_dir = os.path.join(settings.STORAGE_PATH, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    digest, size = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_BYTES:
+                    raise UploadTooLarge(f"Upload exceeds {settings.UPLOAD_MAX_BYTES} bytes")
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+        sha256 = digest.hexdigest()
+        path = blob_path(sha256, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # same bytes already stored
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return path, sha256, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-        add_to_index(chunks, index, metadata, embeddings=embeddings, filename=file.filename)
-        # save_index is called inside add_to_index; but call again to be safe
-        save_index(index, metadata)
+@router.post("/upload", status_code=202)
+async def upload_file(request: Request, file: UploadFile = File(...), collection: str = Form(DEFAULT_COLLECTION)):
+    """
+    Persist the file and queue it for ingestion into `collection` (created on first
+    upload); poll /api/jobs/{job_id} for progress. Content that is already indexed
+    (or queued) in the collection is not processed again: the response is 200 with
+    the existing job and "duplicate": true.
+    """
+    try:
+        CollectionManager.validate(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Missing filename")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD:
+        UPLOADS.inc(result="too_large")
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.UPLOAD_MAX_BYTES} bytes")
 
-        return {"message": "File uploaded and indexed successfully", "filename": file.filename, "chunks_indexed": len(valid_embeds)}
+    try:
+        with span("upload_write"):
+            file_path, sha256, size = await save_upload(file, filename)
+        UPLOAD_BYTES.inc(size)
+        job = ingestion_queue.submit(filename, file_path, collection, sha256)
+        body = {"job_id": job["id"], "status": job["status"], "filename": job["filename"],
+                "collection": collection, "sha256": sha256, "duplicate": job["duplicate"]}
+        UPLOADS.inc(result="duplicate" if job["duplicate"] else "queued")
+        if job["duplicate"]:
+            logger.debug(f"{filename} matches job {job['id']} ({job['filename']}); not re-ingesting")
+            return JSONResponse(status_code=200, content=body)
+        logger.debug(f"Queued job {job['id']} for {filename} ({size} bytes) in collection {collection}")
+        return body
 
-    except HTTPException:
-        raise
+    except UploadTooLarge as e:
+        UPLOADS.inc(result="too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        UPLOADS.inc(result="queue_full")
+        return JSONResponse(status_code=429, content={"detail": f"Ingestion queue is full: {e}"},
+                            headers={"Retry-After": "30"})
     except Exception as e:
-        traceback.print_exc()
+        logger.exception(f"Upload of {filename} failed")
         raise HTTPException(status_code=500, detail=f"Internal error: {type(e).__name__}: {e}")
@@ -10,19 +10,155 @@ class Settings(BaseSettings):
     STORAGE_PATH: str = os.getenv("STORAGE_PATH", "./storage")
     VECTOR_PATH: str = os.getenv("VECTOR_INDEX_PATH", "./vectorstore/faiss_index.bin")
     METADATA_PATH: str = os.getenv("METADATA_PATH", "./vectorstore/metadata.pkl")
+    SEGMENTS_DIR: str = os.getenv("SEGMENTS_DIR", "./vectorstore/segments")
 
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
     DB_NAME: str = os.getenv("DB_NAME", "idp_db")
+    # document records: bodies of DOCUMENT_TEXT_COMPRESS_BYTES or more are stored zlib-compressed,
+    # and in GridFS once compressed to DOCUMENT_TEXT_GRIDFS_BYTES or more; ingestion writes are sent
+    # as bulk_write batches of MONGO_BULK_SIZE, flushed at least every MONGO_BULK_INTERVAL_SECONDS.
+    # "mongomock://" as MONGO_URI uses the in-process mongomock stand-in (tests, offline runs)
+    DOCUMENT_TEXT_COMPRESS_BYTES: int = int(os.getenv("DOCUMENT_TEXT_COMPRESS_BYTES", 1024))
+    DOCUMENT_TEXT_GRIDFS_BYTES: int = int(os.getenv("DOCUMENT_TEXT_GRIDFS_BYTES", 8 * 1024 * 1024))
+    MONGO_BULK_SIZE: int = int(os.getenv("MONGO_BULK_SIZE", 100))
+    MONGO_BULK_INTERVAL_SECONDS: float = float(os.getenv("MONGO_BULK_INTERVAL_SECONDS", 1.0))
 
     # API keys - must be in .env, do NOT hardcode in code
     COHERE_API_KEY: str = os.getenv("COHERE_API_KEY", "")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "models/gemini-2.5-pro")
     GEMINI_EMBEDDING_MODEL: str = os.getenv("GEMINI_EMBEDDING_MODEL", "models/gemini-embedding-001")
+    # answer generation: "gemini" or "fake" (local extractive stand-in for tests / offline runs)
+    GENERATION_BACKEND: str = os.getenv("GENERATION_BACKEND", "gemini")
 
-    # chunking
+    # chunking: sizes in approximate tokens (about 4 characters each), chunks never span a
+    # heading line or a page break
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", 1000))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", 200))
     TOP_K: int = int(os.getenv("TOP_K", 5))
 
+    # ANN index: "flat" (exact), "hnsw" or "ivf" (trained automatically once
+    # IVF_MIN_TRAIN_POINTS / 39*nlist vectors exist; flat until then). IVF_NLIST=0 means ~4*sqrt(n)
+    INDEX_TYPE: str = os.getenv("INDEX_TYPE", "flat")
+    HNSW_M: int = int(os.getenv("HNSW_M", 32))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", 80))
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", 64))
+    IVF_NLIST: int = int(os.getenv("IVF_NLIST", 0))
+    IVF_NPROBE: int = int(os.getenv("IVF_NPROBE", 16))
+    IVF_MIN_TRAIN_POINTS: int = int(os.getenv("IVF_MIN_TRAIN_POINTS", 10000))
+
+    # vector compression inside the index: "none", "sq8" (1 byte/dim) or "pq" (PQ_M bytes).
+    # Full-precision vectors stay in the memory-mapped segment files and the top
+    # RESCORE_FACTOR * top_k candidates are re-scored exactly against them.
+    VECTOR_COMPRESSION: str = os.getenv("VECTOR_COMPRESSION", "none")
+    # PQ_M=0 means dim/4 sub-quantizers (4 dims each). Fewer, wider ones give smaller codes at a
+    # steep recall cost: 16 dims per sub-quantizer measured recall@10 of only ~0.4-0.5 before rescoring
+    PQ_M: int = int(os.getenv("PQ_M", 0))
+    PQ_NBITS: int = int(os.getenv("PQ_NBITS", 8))
+    COMPRESSION_MIN_TRAIN_POINTS: int = int(os.getenv("COMPRESSION_MIN_TRAIN_POINTS", 10000))
+    RESCORE_FACTOR: int = int(os.getenv("RESCORE_FACTOR", 4))
+
+    # retrieval: "vector" or "hybrid" (vector + BM25 candidates merged with "rrf" or "weighted" fusion)
+    SEARCH_MODE: str = os.getenv("SEARCH_MODE", "vector")
+    HYBRID_FUSION: str = os.getenv("HYBRID_FUSION", "rrf")
+    HYBRID_LEXICAL_WEIGHT: float = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 0.4))
+    RRF_K: int = int(os.getenv("RRF_K", 60))
+
+    # rerank: top_k * RERANK_OVERFETCH candidates scored by
+    # alpha * relevance + beta * recency + gamma * query-token overlap
+    RERANK_OVERFETCH: int = int(os.getenv("RERANK_OVERFETCH", 10))
+    RERANK_ALPHA: float = float(os.getenv("RERANK_ALPHA", 0.5))
+    RERANK_BETA: float = float(os.getenv("RERANK_BETA", 0.2))
+    RERANK_GAMMA: float = float(os.getenv("RERANK_GAMMA", 0.3))
+    RECENCY_HALFLIFE_DAYS: float = float(os.getenv("RECENCY_HALFLIFE_DAYS", 7.0))
+
+    # chat context: CONTEXT_CANDIDATES hits are retrieved, TOP_K of them picked by maximal marginal
+    # relevance (MMR_LAMBDA 1.0 = relevance only, 0.0 = novelty only), consecutive chunks of a file
+    # merged, and the passages packed into CONTEXT_MAX_TOKENS approximate tokens
+    CONTEXT_CANDIDATES: int = int(os.getenv("CONTEXT_CANDIDATES", 20))
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", 0.7))
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", 3000))
+
+    # segment store: compact once there are more than SEGMENT_MAX_COUNT segments,
+    # merging runs of segments smaller than SEGMENT_SMALL_ROWS rows
+    SEGMENT_MAX_COUNT: int = int(os.getenv("SEGMENT_MAX_COUNT", 16))
+    SEGMENT_SMALL_ROWS: int = int(os.getenv("SEGMENT_SMALL_ROWS", 4096))
+    # segments with at least this fraction of rows deleted are rewritten without them
+    SEGMENT_PURGE_RATIO: float = float(os.getenv("SEGMENT_PURGE_RATIO", 0.2))
+
+    # multi-process serving (uvicorn --workers N, app.ingest next to the API): writers hold the store's
+    # file lock and publish every change as an index generation file, which each process memory-maps
+    # read-only; readers look for a newer generation at most every INDEX_REFRESH_SECONDS.
+    # INDEX_GENERATIONS_KEPT generation files stay on disk
+    INDEX_SHARED: bool = os.getenv("INDEX_SHARED", "0").lower() in ("1", "true", "yes")
+    INDEX_REFRESH_SECONDS: float = float(os.getenv("INDEX_REFRESH_SECONDS", 1.0))
+    INDEX_GENERATIONS_KEPT: int = int(os.getenv("INDEX_GENERATIONS_KEPT", 2))
+
+    # named collections: each one is its own segment store under COLLECTIONS_DIR/<name>
+    # ("default" stays at SEGMENTS_DIR), unloaded after COLLECTION_IDLE_SECONDS without use
+    # (0 = never); multi-collection queries search SHARD_SEARCH_WORKERS shards in parallel
+    COLLECTIONS_DIR: str = os.getenv("COLLECTIONS_DIR", "./vectorstore/collections")
+    COLLECTION_IDLE_SECONDS: float = float(os.getenv("COLLECTION_IDLE_SECONDS", 900))
+    SHARD_SEARCH_WORKERS: int = int(os.getenv("SHARD_SEARCH_WORKERS", 4))
+
+    # embedding pipeline: "gemini" or "fake" (deterministic offline embedder)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "gemini")
+    EMBEDDING_FAKE_DIM: int = int(os.getenv("EMBEDDING_FAKE_DIM", 768))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", 50))
+    EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+    EMBEDDING_REQUESTS_PER_SEC: float = float(os.getenv("EMBEDDING_REQUESTS_PER_SEC", 5))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", 4))
+
+    # embedding cache (set EMBEDDING_CACHE_PATH to "" to keep it memory-only)
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./vectorstore/embedding_cache.sqlite")
+    EMBEDDING_CACHE_MEMORY_SIZE: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", 10000))
+    EMBEDDING_CACHE_DISK_MAX_ROWS: int = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", 200000))
+
+    # background ingestion: durable SQLite job queue, INGEST_WORKERS dispatcher threads sharing
+    # a pool of INGEST_PROCESSES extraction processes; uploads get 429 past INGEST_MAX_QUEUE queued jobs
+    JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", "./storage/jobs.sqlite")
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", 2))
+    INGEST_PROCESSES: int = int(os.getenv("INGEST_PROCESSES", 2))
+    INGEST_MAX_QUEUE: int = int(os.getenv("INGEST_MAX_QUEUE", 100))
+    # every uvicorn worker runs its own queue on the shared JOBS_DB_PATH: a claimed job records its
+    # owner (host:pid), refreshed every INGEST_HEARTBEAT_SECONDS, and is only re-queued once that
+    # process is gone or its heartbeat is INGEST_STALE_SECONDS old
+    INGEST_HEARTBEAT_SECONDS: float = float(os.getenv("INGEST_HEARTBEAT_SECONDS", 10))
+    INGEST_STALE_SECONDS: float = float(os.getenv("INGEST_STALE_SECONDS", 60))
+
+    # uploads are streamed to STORAGE_PATH/blobs/<sha256> in UPLOAD_CHUNK_BYTES pieces;
+    # anything larger than UPLOAD_MAX_BYTES is rejected with 413
+    UPLOAD_CHUNK_BYTES: int = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", 100 * 1024 * 1024))
+
+    # PDF extraction: page ranges of PDF_PAGES_PER_TASK fanned out to PDF_WORKERS processes (0 = all cores);
+    # pages with fewer than PDF_OCR_MIN_CHARS characters of text layer are rasterised and OCR'd
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", 0))
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", 4))
+    PDF_OCR_FALLBACK: bool = os.getenv("PDF_OCR_FALLBACK", "1").lower() in ("1", "true", "yes")
+    PDF_OCR_MIN_CHARS: int = int(os.getenv("PDF_OCR_MIN_CHARS", 20))
+    PDF_OCR_RESOLUTION: int = int(os.getenv("PDF_OCR_RESOLUTION", 200))
+    TESSERACT_CMD: str = os.getenv("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+
+    # entity extraction: SPACY_MODEL is loaded on first use with only the NER components;
+    # text is split into NER_CHUNK_CHARS pieces and run through nlp.pipe in batches of
+    # NER_BATCH_SIZE on NER_PROCESSES processes. SPACY_AUTO_DOWNLOAD fetches a missing model
+    SPACY_MODEL: str = os.getenv("SPACY_MODEL", "en_core_web_sm")
+    SPACY_AUTO_DOWNLOAD: bool = os.getenv("SPACY_AUTO_DOWNLOAD", "1").lower() in ("1", "true", "yes")
+    NER_CHUNK_CHARS: int = int(os.getenv("NER_CHUNK_CHARS", 20000))
+    NER_BATCH_SIZE: int = int(os.getenv("NER_BATCH_SIZE", 16))
+    NER_PROCESSES: int = int(os.getenv("NER_PROCESSES", 1))
+
+    # /api/chat answer cache: exact normalized-query hits, or a past query whose embedding has
+    # cosine >= ANSWER_CACHE_SIMILARITY; cleared whenever the index version changes (0 entries = off)
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+    # observability: Prometheus metrics at /metrics; the sampling profiler (/api/profiler)
+    # can also be started at boot with PROFILER_AUTOSTART, sampling every PROFILER_INTERVAL_MS
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    PROFILER_AUTOSTART: bool = os.getenv("PROFILER_AUTOSTART", "0").lower() in ("1", "true", "yes")
+    PROFILER_INTERVAL_MS: float = float(os.getenv("PROFILER_INTERVAL_MS", 5))
+
 settings = Settings()
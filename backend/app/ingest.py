@@ -0,0 +1,315 @@
+# app/ingest.py
+"""
+Bulk ingestion of a directory tree, without going through /api/upload. Run from backend/:
+
+    python -m app.ingest /data/backlog
+    python -m app.ingest /data/backlog --collection contracts --processes 8 --commit-every 200
+
+Files are extracted (OCR, text layer) and analysed (entities) in a process pool, chunked
+as they come back, embedded in large cross-document batches and added to the index
+`--commit-every` documents at a time, each batch as one segment and one persist.
+After every commit the files it covered are appended to a checkpoint log, so an
+interrupted run started again with the same arguments picks up where it stopped
+(a file changed since, by size or mtime, is done again). Ctrl-C commits the files
+already extracted before exiting.
+
+Documents are named by their path relative to the directory, so re-running over the
+same tree replaces rather than duplicates them. Index writes take the store's writer
+lock, so the API can keep serving and ingesting meanwhile; with INDEX_SHARED set (as
+for the server) each commit is published as a new index generation that the running
+workers pick up without a restart.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from app.config import settings
+from app.workers import stages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ".pdf,.png,.jpg,.jpeg,.txt,.md"
+
+
+def walk_files(root: str, extensions):
+    """(relative path, absolute path, stat) of matching files under root, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in sorted(filenames):
+            if name.startswith(".") or not name.lower().endswith(extensions):
+                continue
+            path = os.path.join(dirpath, name)
+            yield os.path.relpath(path, root).replace(os.sep, "/"), path, os.stat(path)
+
+
+def default_checkpoint(root: str, collection: str) -> str:
+    key = hashlib.sha1(f"{root}\0{collection}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(settings.STORAGE_PATH, "ingest", f"{os.path.basename(root) or 'root'}-{key}.jsonl")
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines log of the files each commit covered ({"path", "size", "mtime",
+    "status", ...}); the last line for a path wins. Appending keeps a multi-hour run's
+    checkpoint cost proportional to the files committed, and a line torn by a crash is skipped.
+    """
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.entries = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path) and not restart:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[rec["path"]] = rec
+        self._file = open(path, "w" if restart else "a", encoding="utf-8")
+
+    def is_done(self, rel: str, st: os.stat_result, retry_failed: bool = False) -> bool:
+        rec = self.entries.get(rel)
+        if rec is None or (retry_failed and rec["status"] == "failed"):
+            return False
+        return rec["size"] == st.st_size and rec["mtime"] == st.st_mtime_ns
+
+    def record(self, records):
+        for rec in records:
+            self.entries[rec["path"]] = rec
+            self._file.write(json.dumps(rec) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total: int, every: float):
+        self.total = total
+        self.every = every
+        self.start = self.last = time.perf_counter()
+        self.docs = self.chunks = self.failed = 0
+
+    def rates(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return self.docs / elapsed, self.chunks / elapsed
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self.last < self.every:
+            return
+        self.last = now
+        docs_s, chunks_s = self.rates()
+        left = self.total - self.docs - self.failed
+        eta = f" | eta {left / docs_s / 60:.1f} min" if docs_s > 0 and left > 0 else ""
+        print(f"[ingest] {self.docs + self.failed}/{self.total} files ({self.failed} failed) | "
+              f"{docs_s:.2f} docs/s | {chunks_s:.1f} chunks/s{eta}", file=sys.stderr, flush=True)
+
+
+class Batch:
+    """Files extracted since the last commit, with their chunks and (once embedded) vectors."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.docs = []      # dicts: rel, path, stat, prepared, chunks, embeddings
+        self.failed = []    # checkpoint records
+        self.embedded = 0   # docs[:embedded] have their vectors
+
+    def __len__(self):
+        return len(self.docs) + len(self.failed)
+
+    def pending_chunks(self) -> int:
+        return sum(len(d["chunks"]) for d in self.docs[self.embedded:])
+
+    def embed(self):
+        """One embed_texts call for every chunk not embedded yet (it batches and parallelises the requests)."""
+        from app.services.embeddings import embed_texts
+
+        todo = self.docs[self.embedded:]
+        if not todo:
+            return
+        vectors = embed_texts([c.text for d in todo for c in d["chunks"]])
+        pos = 0
+        for d in todo:
+            d["embeddings"] = vectors[pos:pos + len(d["chunks"])]
+            pos += len(d["chunks"])
+        self.embedded = len(self.docs)
+
+
+def _record(rel: str, st: os.stat_result, status: str, **extra) -> dict:
+    return {"path": rel, "size": st.st_size, "mtime": st.st_mtime_ns, "status": status, **extra}
+
+
+def commit(batch: Batch, manager, collection: str, checkpoint: Checkpoint, progress: Progress):
+    """Embed what is left, add the batch to the index as one segment, queue its records and checkpoint it."""
+    from app.models.db_models import document_repository
+
+    batch.embed()
+    records, docs = list(batch.failed), []
+    for d in batch.docs:
+        indexed = sum(e is not None for e in d["embeddings"])
+        if not indexed:
+            records.append(_record(d["rel"], d["stat"], "failed", error="Embedding failed for all chunks."))
+            progress.failed += 1
+            continue
+        docs.append(d)
+        records.append(_record(d["rel"], d["stat"], "done", sha256=d["prepared"]["sha256"], chunks=indexed))
+    if docs:
+        manager.add_documents([(d["rel"], d["chunks"], d["embeddings"]) for d in docs])
+        for d in docs:
+            prepared = d["prepared"]
+            analysis = prepared["analysis"] or {}
+            document_repository.queue({
+                "filename": d["rel"],
+                "collection": collection,
+                "sha256": prepared["sha256"],
+                "source_path": d["path"],
+                "status": "done",
+                "metadata": analysis.get("metadata", {}),
+                "entities": analysis.get("entities", []),
+                "analysis_error": prepared["analysis_error"],
+                "text": prepared["text"],
+                "chunk_count": len(d["chunks"]),
+            })
+        try:
+            document_repository.flush()
+        except Exception as e:
+            # the documents are indexed; their records are retried with the next commit
+            logger.warning(f"Could not store document records: {type(e).__name__}: {e}")
+    checkpoint.record(records)
+    progress.docs += len(docs)
+    progress.chunks += sum(len(d["chunks"]) for d in docs)
+    batch.clear()
+    progress.report()
+
+
+def new_pool(processes: int) -> ProcessPoolExecutor:
+    # spawn, as the ingestion queue does: the parent holds FAISS and thread-pool state
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+
+def run(args) -> int:
+    from app.services.chunking import iter_chunks
+    from app.services.shards import collection_manager
+
+    root = os.path.abspath(args.directory)
+    extensions = tuple(e.strip().lower() for e in args.extensions.split(",") if e.strip())
+    checkpoint = Checkpoint(args.checkpoint or default_checkpoint(root, args.collection), restart=args.restart)
+    files = list(walk_files(root, extensions))
+    todo = [f for f in files if not checkpoint.is_done(f[0], f[2], args.retry_failed)]
+    print(f"[ingest] {len(files)} files under {root}; {len(files) - len(todo)} already done, {len(todo)} to go "
+          f"(checkpoint {checkpoint.path})", file=sys.stderr, flush=True)
+
+    manager = collection_manager.get(args.collection, create=True)
+    progress = Progress(len(todo), args.report_every)
+    batch = Batch()
+    processes = max(1, args.processes)
+    pool = new_pool(processes)
+    pending = iter(todo)
+    in_flight = {}
+
+    def fill():
+        nonlocal pool
+        while len(in_flight) < 2 * processes:
+            item = next(pending, None)
+            if item is None:
+                return
+            try:
+                fut = pool.submit(stages.prepare_file, item[1], item[0])
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM in OCR); what was in flight on it fails, the rest gets a new pool
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool(processes)
+                fut = pool.submit(stages.prepare_file, item[1], item[0])
+            in_flight[fut] = item
+
+    def fail(rel, st, error: str):
+        logger.warning(f"{rel}: {error}")
+        batch.failed.append(_record(rel, st, "failed", error=error))
+        progress.failed += 1
+
+    try:
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel, path, st = in_flight.pop(fut)
+                try:
+                    prepared = fut.result()
+                except Exception as e:
+                    fail(rel, st, f"{type(e).__name__}: {e}")
+                    continue
+                chunks = list(iter_chunks(prepared["pages"], settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+                if not chunks:
+                    fail(rel, st, "No extractable text in file.")
+                    continue
+                if prepared["analysis_error"]:
+                    logger.warning(f"{rel}: entity analysis failed: {prepared['analysis_error']}")
+                batch.docs.append({"rel": rel, "path": path, "stat": st, "prepared": prepared, "chunks": chunks})
+                if batch.pending_chunks() >= args.embed_batch:
+                    batch.embed()
+            if len(batch) >= args.commit_every:
+                commit(batch, manager, args.collection, checkpoint, progress)
+            fill()
+            progress.report()
+        commit(batch, manager, args.collection, checkpoint, progress)
+        status = 0
+    except KeyboardInterrupt:
+        print("[ingest] interrupted; committing the files already extracted", file=sys.stderr, flush=True)
+        pool.shutdown(wait=False, cancel_futures=True)
+        commit(batch, manager, args.collection, checkpoint, progress)
+        status = 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        checkpoint.close()
+
+    from app.models.db_models import document_repository
+    document_repository.stop()
+    # background compaction / index rebuilds work on the files just written
+    while manager.busy():
+        time.sleep(0.1)
+    progress.report(force=True)
+    docs_s, chunks_s = progress.rates()
+    print(f"[ingest] done: {progress.docs} documents, {progress.chunks} chunks, {progress.failed} failed "
+          f"in {time.perf_counter() - progress.start:.1f}s ({docs_s:.2f} docs/s, {chunks_s:.1f} chunks/s)",
+          file=sys.stderr, flush=True)
+    return status
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--collection", default="default")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="extraction processes")
+    parser.add_argument("--commit-every", type=int, default=100, help="documents per index commit (one segment each)")
+    parser.add_argument("--embed-batch", type=int, default=2048, help="embed once this many chunks are waiting")
+    parser.add_argument("--extensions", default=DEFAULT_EXTENSIONS, help="comma list of file extensions to ingest")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: under STORAGE_PATH/ingest)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and ingest everything again")
+    parser.add_argument("--retry-failed", action="store_true", help="also retry files that failed last time")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    try:
+        from app.services.shards import CollectionManager
+        CollectionManager.validate(args.collection)
+    except ValueError as e:
+        parser.error(str(e))
+    logging.basicConfig(level=settings.LOG_LEVEL.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
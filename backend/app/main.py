@@ -1,9 +1,43 @@
-from fastapi import FastAPI
+import logging
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import upload, chat
+from app.api import upload, chat, jobs, documents, metrics
+from app.config import settings
+from app.models.db_models import document_repository
+from app.services.metrics import histogram
+from app.services.profiler import profiler
+from app.services.shards import collection_manager
+from app.services.vectorstore import index_manager
+from app.workers.processor import ingestion_queue
+
+logging.basicConfig(level=settings.LOG_LEVEL.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI(title="IDP & Knowledge Assistant")
 
+HTTP_SECONDS = histogram("http_request_seconds", "HTTP request latency.", ["method", "route", "status"])
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                         route=route_label(request), status=response.status_code)
+    return response
+
+def route_label(request: Request) -> str:
+    """
+    The matched route template ("/api/jobs/{job_id}"), not the raw path, so the label set
+    stays bounded. Some FastAPI versions report the template without the router prefix;
+    the prefix is then taken from the leading segments of the request path.
+    """
+    template = getattr(request.scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    segments = request.url.path.rstrip("/").split("/")
+    extra = len(segments) - len(template.rstrip("/").split("/"))
+    return "/".join(segments[:extra + 1]) + template if extra > 0 else template
+
 # Enable CORS for React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -13,6 +47,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def load_vector_index():
+    # load FAISS index + metadata once; /api/chat and /api/upload share it
+    index_manager.load()
+
+@app.on_event("startup")
+def start_collection_eviction():
+    # other collections load on first use; idle ones are unloaded in the background
+    collection_manager.start()
+
+@app.on_event("shutdown")
+def stop_collection_eviction():
+    collection_manager.stop()
+
+@app.on_event("startup")
+def start_ingestion_queue():
+    # resumes any jobs left queued or interrupted by the last shutdown
+    ingestion_queue.start()
+
+@app.on_event("shutdown")
+def stop_ingestion_queue():
+    ingestion_queue.stop()
+
+@app.on_event("startup")
+def start_document_writer():
+    # document records from ingestion are written to MongoDB in batches
+    document_repository.start()
+
+@app.on_event("shutdown")
+def stop_document_writer():
+    # after the ingestion queue, so the last jobs' records are flushed too
+    document_repository.stop()
+
+@app.on_event("startup")
+def autostart_profiler():
+    if settings.PROFILER_AUTOSTART:
+        profiler.start(settings.PROFILER_INTERVAL_MS / 1000.0)
+
+@app.on_event("shutdown")
+def stop_profiler():
+    profiler.stop()
+
 # Register API routers
 app.include_router(upload.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(documents.router, prefix="/api")
+app.include_router(metrics.profiler_router, prefix="/api")
+app.include_router(metrics.router)
@@ -1,16 +1,319 @@
-from pymongo import MongoClient
-from app.config import settings
+from pymongo import ASCENDING, MongoClient, ReplaceOne
+from pymongo.errors import PyMongoError
+from bson.binary import Binary
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
+from app.config import settings
+from app.services.chunk_store import document_id
+import gridfs
+import logging
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# queued writes kept for a retry while MongoDB is unreachable, in batches; older ones are dropped
+MAX_PENDING_BATCHES = 10
+# never returned unless the text is asked for
+BODY_FIELDS = ("text", "text_z", "text_file_id")
+# left out of listings: bodies plus the per-entity offset lists
+LIST_PROJECTION = {**{f: 0 for f in BODY_FIELDS}, "entities": 0}
+GET_PROJECTION = {f: 0 for f in BODY_FIELDS}
+
+
+def make_client(uri: str):
+    """MongoClient for `uri`; "mongomock://" gives the in-process stand-in (tests, offline runs)."""
+    if uri.startswith("mongomock://"):
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        return mongomock.MongoClient()
+    return MongoClient(uri)
+
+
+def _collection_filter(filename: str, collection: str = "default") -> dict:
+    # records written before named collections have no "collection" field and belong to "default"
+    if collection == "default":
+        return {"filename": filename, "collection": {"$in": [None, "default"]}}
+    return {"filename": filename, "collection": collection}
+
+
+def _collection_query(collection: str) -> dict:
+    return {"collection": {"$in": [None, "default"]}} if collection == "default" else {"collection": collection}
+
+
+class DocumentRepository:
+    """
+    Document records in MongoDB, one per filename and collection. Bodies are stored
+    zlib-compressed (`text_z`) once they reach `compress_min_bytes`, and in GridFS once the
+    compressed body reaches `gridfs_min_bytes`; reads leave them out unless asked for.
+    Ingestion writes are queued and sent as unordered bulk_write batches of up to
+    `bulk_size` records, by a background flush every `bulk_interval` seconds or as soon
+    as a batch is full. Reads and deletes flush first, so they see every queued write.
+    """
+
+    def __init__(self, uri: str, db_name: str, bulk_size: int = 100, bulk_interval: float = 1.0,
+                 compress_min_bytes: int = 1024, gridfs_min_bytes: int = 8 * 1024 * 1024):
+        self.uri = uri
+        self.db_name = db_name
+        self.bulk_size = max(1, bulk_size)
+        self.bulk_interval = bulk_interval
+        self.compress_min_bytes = compress_min_bytes
+        self.gridfs_min_bytes = gridfs_min_bytes
+        self._client = None
+        self._fs = None
+        self._indexed = False
+        self._pending = {}  # (collection, filename) -> record, oldest first
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def db(self):
+        if self._client is None:
+            self._client = make_client(self.uri)
+        return self._client[self.db_name]
+
+    @property
+    def collection(self):
+        coll = self.db["documents"]
+        if not self._indexed:
+            self.ensure_indexes(coll)
+        return coll
+
+    @property
+    def fs(self):
+        if self._fs is None:
+            self._fs = gridfs.GridFS(self.db, collection="document_text")
+        return self._fs
+
+    def ensure_indexes(self, coll=None):
+        coll = coll if coll is not None else self.db["documents"]
+        coll.create_index([("collection", ASCENDING), ("filename", ASCENDING)], name="collection_filename")
+        coll.create_index([("collection", ASCENDING), ("_id", ASCENDING)], name="collection_id")
+        coll.create_index([("document_id", ASCENDING)], name="document_id")
+        coll.create_index([("sha256", ASCENDING)], name="sha256")
+        coll.create_index([("status", ASCENDING)], name="status")
+        self._indexed = True
+
+    # ---- bodies ----------------------------------------------------------
+
+    def _encode(self, doc: dict) -> dict:
+        """Copy of `doc` with its "text" moved to the configured storage."""
+        doc = dict(doc)
+        text = doc.pop("text", None)
+        if text is None:
+            return doc
+        data = text.encode("utf-8")
+        doc["text_bytes"] = len(data)
+        if len(data) < self.compress_min_bytes:
+            doc["text"] = text
+            return doc
+        packed = zlib.compress(data, 6)
+        if len(packed) >= self.gridfs_min_bytes:
+            doc["text_file_id"] = self.fs.put(packed, filename=doc.get("filename"), compression="zlib")
+        else:
+            doc["text_z"] = Binary(packed)
+        return doc
+
+    def _decode(self, doc: dict, include_text: bool = False) -> dict:
+        if doc is None:
+            return None
+        packed = doc.pop("text_z", None)
+        file_id = doc.pop("text_file_id", None)
+        if include_text and "text" not in doc:
+            if packed is not None:
+                doc["text"] = zlib.decompress(packed).decode("utf-8")
+            elif file_id is not None:
+                doc["text"] = zlib.decompress(self.fs.get(file_id).read()).decode("utf-8")
+        doc["id"] = str(doc.pop("_id"))
+        return doc
+
+    def _drop_files(self, file_ids):
+        for file_id in file_ids:
+            try:
+                self.fs.delete(file_id)
+            except PyMongoError as e:
+                logger.warning(f"Could not delete stored text {file_id}: {type(e).__name__}: {e}")
+
+    def _file_ids(self, query: dict) -> list:
+        query = {**query, "text_file_id": {"$exists": True}}
+        return [d["text_file_id"] for d in self.collection.find(query, {"text_file_id": 1})]
+
+    # ---- writes ------------------------------------------------------------
+
+    def queue(self, doc: dict):
+        """Queue a replace-or-insert of `doc` (keyed by filename and collection) for the next bulk write."""
+        doc = {**doc, "collection": doc.get("collection") or "default"}
+        doc.setdefault("document_id", document_id(doc["filename"]))
+        with self._lock:
+            key = (doc["collection"], doc["filename"])
+            # a newer version of a queued record replaces it rather than costing another write
+            self._pending.pop(key, None)
+            self._pending[key] = doc
+            full = len(self._pending) >= self.bulk_size
+        if full:
+            self.flush()
+
+    def replace_many(self, docs) -> int:
+        """Write `docs` right away as one unordered bulk_write; returns the number of records written."""
+        docs = list(docs)
+        if not docs:
+            return 0
+        encoded = [self._encode(d) for d in docs]
+        filters = [_collection_filter(d["filename"], d.get("collection") or "default") for d in docs]
+        coll = self.collection
+        # GridFS bodies of the records being replaced are dropped once the new ones are in
+        old_files = self._file_ids({"$or": filters})
+        if self.uri.startswith("mongomock://"):
+            # mongomock's bulk builder does not take current pymongo operation objects
+            for f, d in zip(filters, encoded):
+                coll.replace_one(f, d, upsert=True)
+        else:
+            coll.bulk_write([ReplaceOne(f, d, upsert=True) for f, d in zip(filters, encoded)], ordered=False)
+        self._drop_files(old_files)
+        logger.debug(f"Wrote {len(docs)} document records")
+        return len(docs)
+
+    def flush(self) -> int:
+        """
+        Send every queued write. On failure the batch is put back for the next flush (unless
+        newer versions arrived, or the queue is past MAX_PENDING_BATCHES) and the error raised.
+        """
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return written
+                    keys = list(self._pending)[:self.bulk_size]
+                    batch = [self._pending.pop(k) for k in keys]
+                try:
+                    self.replace_many(batch)
+                except Exception:
+                    with self._lock:
+                        retry = dict(zip(keys, batch))
+                        retry.update(self._pending)
+                        excess = len(retry) - MAX_PENDING_BATCHES * self.bulk_size
+                        for key in list(retry)[:max(excess, 0)]:
+                            del retry[key]
+                        self._pending = retry
+                    if excess > 0:
+                        logger.warning(f"Dropped {excess} queued document records that could not be written")
+                    raise
+                written += len(batch)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def insert(self, doc: dict):
+        return self.collection.insert_one(self._encode(doc))
+
+    def replace(self, doc: dict):
+        """Write one record right away (queued writes for other records stay queued)."""
+        doc = {**doc, "collection": doc.get("collection") or "default"}
+        doc.setdefault("document_id", document_id(doc["filename"]))
+        with self._lock:
+            self._pending.pop((doc["collection"], doc["filename"]), None)
+        return self.replace_many([doc])
+
+    def delete_by_filename(self, filename: str, collection: str = "default"):
+        with self._lock:
+            self._pending.pop((collection, filename), None)
+        query = _collection_filter(filename, collection)
+        old_files = self._file_ids(query)
+        result = self.collection.delete_many(query)
+        self._drop_files(old_files)
+        return result
+
+    # ---- reads -------------------------------------------------------------
+
+    def get(self, doc_id: str = None, collection: str = "default", include_text: bool = False, **query):
+        """One record by stable document id (or any other field given as a keyword), without its body unless asked."""
+        self.flush()
+        if doc_id is not None:
+            query["document_id"] = doc_id
+        if collection:
+            query.update(_collection_query(collection))
+        return self._decode(self.collection.find_one(query, None if include_text else GET_PROJECTION), include_text)
+
+    def list(self, collection: str = None, status: str = None, limit: int = 50, after: str = None,
+             include_text: bool = False):
+        """
+        One page of records in insertion (_id) order. `after` is the cursor returned with
+        the previous page; returns (records, next cursor or None when this is the last page).
+        Raises ValueError for a malformed cursor.
+        """
+        self.flush()
+        query = _collection_query(collection) if collection else {}
+        if status:
+            query["status"] = status
+        if after:
+            try:
+                query["_id"] = {"$gt": ObjectId(after)}
+            except (InvalidId, TypeError):
+                raise ValueError(f"Invalid cursor: {after!r}")
+        projection = {"entities": 0} if include_text else LIST_PROJECTION
+        docs = list(self.collection.find(query, projection).sort("_id", ASCENDING).limit(limit + 1))
+        more = len(docs) > limit
+        docs = [self._decode(d, include_text) for d in docs[:limit]]
+        return docs, (docs[-1]["id"] if more else None)
+
+    # ---- background flush ----------------------------------------------------
+
+    def _run(self):
+        while not self._stop.wait(self.bulk_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not write {self.pending()} queued document records: {type(e).__name__}: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="document-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"Dropping {self.pending()} queued document records: {type(e).__name__}: {e}")
+
+
+document_repository = DocumentRepository(
+    settings.MONGO_URI, settings.DB_NAME,
+    bulk_size=settings.MONGO_BULK_SIZE,
+    bulk_interval=settings.MONGO_BULK_INTERVAL_SECONDS,
+    compress_min_bytes=settings.DOCUMENT_TEXT_COMPRESS_BYTES,
+    gridfs_min_bytes=settings.DOCUMENT_TEXT_GRIDFS_BYTES,
+)
 
-client = MongoClient(settings.MONGO_URI)
-db = client[settings.DB_NAME]
-documents_collection = db["documents"]
 
 def insert_document(doc: dict):
-    return documents_collection.insert_one(doc)
+    # kept for older callers; upserts like replace_document so a filename never gets two records
+    return document_repository.replace(doc)
 
 def get_all_documents():
-    return list(documents_collection.find())
+    """Every record, without bodies, paged through so no single query pulls the whole collection."""
+    docs, cursor = document_repository.list(limit=500)
+    while cursor:
+        page, cursor = document_repository.list(limit=500, after=cursor)
+        docs.extend(page)
+    return docs
+
+def find_document_by_id(doc_id, include_text: bool = False):
+    return document_repository.get(collection=None, include_text=include_text, _id=ObjectId(doc_id))
+
+def replace_document(doc: dict):
+    # one record per filename and collection: a re-upload replaces the previous version
+    return document_repository.replace(doc)
 
-def find_document_by_id(doc_id):
-    return documents_collection.find_one({"_id": ObjectId(doc_id)})
+def delete_documents_by_filename(filename: str, collection: str = "default"):
+    return document_repository.delete_by_filename(filename, collection)
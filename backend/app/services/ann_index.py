@@ -0,0 +1,168 @@
+# app/services/ann_index.py
+import math
+import faiss
+import numpy as np
+from app.config import settings
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+COMPRESSIONS = ("none", "sq8", "pq")
+
+
+def ivf_nlist(ntotal: int, floor: bool = True) -> int:
+    """
+    nlist from settings, or ~4*sqrt(n) when IVF_NLIST is 0. With floor=False it is capped
+    at n/39 so that even a small store has enough points to train every centroid.
+    """
+    nlist = settings.IVF_NLIST if settings.IVF_NLIST > 0 else max(1, min(65536, int(4 * math.sqrt(max(ntotal, 1)))))
+    return nlist if floor else max(1, min(nlist, ntotal // 39))
+
+
+def ivf_min_train(ntotal: int, floor: bool = True) -> int:
+    # faiss wants ~39 points per centroid; below that k-means is unreliable.
+    # floor=False drops the IVF_MIN_TRAIN_POINTS safety margin and keeps only that minimum
+    need = 39 * ivf_nlist(ntotal, floor)
+    return max(settings.IVF_MIN_TRAIN_POINTS, need) if floor else need
+
+
+def pq_m(dim: int) -> int:
+    """
+    Number of PQ sub-quantizers: PQ_M if it divides dim, else ~4 dims per sub-vector
+    (dim/4 bytes per vector, 16x smaller than float32). Wider sub-vectors shrink the codes
+    further but cost recall fast: ~16 dims each measured recall@10 of 0.39-0.50.
+    """
+    if settings.PQ_M > 0 and dim % settings.PQ_M == 0:
+        return settings.PQ_M
+    for sub in (4, 3, 2, 6, 8, 1):
+        if dim % sub == 0:
+            return dim // sub
+    return dim
+
+
+def compression_min_train(floor: bool = True) -> int:
+    need = 39 * (1 << settings.PQ_NBITS)
+    return max(settings.COMPRESSION_MIN_TRAIN_POINTS, need) if floor else need
+
+
+def effective_type(index_type: str, ntotal: int, floor: bool = True) -> str:
+    """IVF falls back to flat until enough vectors exist to train it."""
+    index_type = (index_type or "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {INDEX_TYPES}")
+    if index_type == "ivf" and ntotal < ivf_min_train(ntotal, floor):
+        return "flat"
+    return index_type
+
+
+def effective_compression(compression: str, ntotal: int, floor: bool = True) -> str:
+    """SQ8/PQ fall back to full float32 storage until enough vectors exist to train the quantizer."""
+    compression = (compression or "none").lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown VECTOR_COMPRESSION {compression!r}; expected one of {COMPRESSIONS}")
+    if compression != "none" and ntotal < compression_min_train(floor):
+        return "none"
+    return compression
+
+
+def index_kind(index) -> str:
+    if index is None:
+        return "none"
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def index_compression(index) -> str:
+    if index is None:
+        return "none"
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def bytes_per_vector(index) -> float:
+    """Resident bytes per stored vector: code size plus HNSW links / IVF ids."""
+    if index is None or index.ntotal == 0:
+        return 0.0
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        links = faiss.vector_to_array(base.hnsw.neighbors).nbytes / base.ntotal
+        return faiss.downcast_index(base.storage).sa_code_size() + links
+    if isinstance(base, faiss.IndexIVF):
+        return base.code_size + 8  # + int64 id per list entry
+    return base.sa_code_size()
+
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """Apply query-time knobs (nprobe / efSearch) from settings or explicit overrides."""
+    if index is None:
+        return index
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search or settings.HNSW_EF_SEARCH
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe or settings.IVF_NPROBE, base.nlist)
+    return index
+
+
+def new_index(index_type: str, dim: int, ntotal: int = 0, compression: str = "none", floor: bool = True):
+    """Empty inner-product index of the requested kind and vector encoding (may still need train())."""
+    if index_type == "flat" and compression == "none":
+        return faiss.IndexFlatIP(dim)  # inner product for cosine if normalized
+    storage = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_m(dim)}x{settings.PQ_NBITS}"}[compression]
+    if index_type == "hnsw":
+        index = faiss.index_factory(dim, f"HNSW{settings.HNSW_M},{storage}", faiss.METRIC_INNER_PRODUCT)
+        faiss.downcast_index(index).hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        index = faiss.index_factory(dim, f"IVF{ivf_nlist(ntotal, floor)},{storage}", faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.index_factory(dim, storage, faiss.METRIC_INNER_PRODUCT)
+    return index
+
+
+def _as_parts(vectors):
+    return [vectors] if isinstance(vectors, np.ndarray) else list(vectors)
+
+
+def _training_sample(parts, n: int, max_train: int) -> np.ndarray:
+    if n <= max_train:
+        return np.ascontiguousarray(np.concatenate(parts, axis=0), dtype="float32")
+    rng = np.random.default_rng(0)
+    picks = np.sort(rng.choice(n, max_train, replace=False))
+    out, start = [], 0
+    for part in parts:
+        stop = start + len(part)
+        lo, hi = np.searchsorted(picks, [start, stop])
+        if hi > lo:
+            out.append(np.asarray(part[picks[lo:hi] - start], dtype="float32"))
+        start = stop
+    return np.ascontiguousarray(np.concatenate(out, axis=0))
+
+
+def build_index(vectors, dim: int, index_type: str = None, compression: str = None, floor: bool = True):
+    """
+    Build an index of INDEX_TYPE / VECTOR_COMPRESSION (or the explicit overrides) over
+    `vectors`, an array or a list of arrays such as memory-mapped segments. IVF centroids
+    and SQ/PQ quantizers are trained on a sample first when the index needs it.
+    With floor=False the *_MIN_TRAIN_POINTS settings are ignored and only faiss's own
+    minimum decides whether IVF / compression fall back.
+    """
+    parts = _as_parts(vectors)
+    n = sum(len(p) for p in parts)
+    kind = effective_type(index_type or settings.INDEX_TYPE, n, floor)
+    comp = effective_compression(compression or settings.VECTOR_COMPRESSION, n, floor)
+    index = new_index(kind, dim, n, comp, floor)
+    if not index.is_trained:
+        nlist = faiss.downcast_index(index).nlist if kind == "ivf" else 0
+        index.train(_training_sample(parts, n, max(256 * nlist, 100000)))
+    for part in parts:
+        if len(part):
+            index.add(np.ascontiguousarray(part, dtype="float32"))
+    return configure_search(index)
@@ -0,0 +1,126 @@
+# app/services/ann_report.py
+"""
+Recall@k, latency and memory per vector of each ANN index type and vector
+compression mode against the exact flat baseline, measured on the vectors
+already stored in the segment store.
+
+    python -m app.services.ann_report --k 10 --queries 200 --compressions none,sq8,pq
+"""
+import argparse
+import json
+import time
+import numpy as np
+from app.config import settings
+from app.services.ann_index import (
+    COMPRESSIONS, INDEX_TYPES, build_index, bytes_per_vector, compression_min_train, configure_search,
+    effective_compression, effective_type, index_compression, index_kind, ivf_min_train,
+)
+from app.services.segment_store import SegmentStore
+
+
+def _time_queries(index, queries: np.ndarray, k: int, vectors: np.ndarray = None, rescore_factor: int = 1):
+    """Search every query; with `vectors`, over-fetch k * rescore_factor and re-score exactly like search_index."""
+    latencies, raw_ids, ids = [], [], []
+    fetch_k = k * rescore_factor if vectors is not None else k
+    for q in queries:
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], fetch_k)
+        found = I[0]
+        if vectors is not None:
+            cand = found[found >= 0]
+            exact = vectors[cand] @ q
+            found = cand[np.argsort(-exact)[:k]]
+            found = np.pad(found, (0, k - len(found)), constant_values=-1)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        raw_ids.append(I[0][:k])
+        ids.append(found)
+    return np.array(latencies), np.stack(raw_ids), np.stack(ids)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    total = sum(int((t >= 0).sum()) for t in truth)
+    return hits / total if total else 0.0
+
+
+def run_report(vectors: np.ndarray, k: int = 10, n_queries: int = 200, types=INDEX_TYPES, compressions=("none",),
+               nprobe: int = None, ef_search: int = None, rescore_factor: int = None, seed: int = 0) -> list:
+    n, dim = vectors.shape
+    rng = np.random.default_rng(seed)
+    # queries are stored vectors with a little noise, re-normalised like real query embeddings
+    picks = rng.choice(n, min(n_queries, n), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.01, (len(picks), dim)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    rescore_factor = max(rescore_factor or settings.RESCORE_FACTOR, 1)
+    baseline = build_index(vectors, dim, "flat", "none")
+    _, _, truth = _time_queries(baseline, queries, k)
+
+    rows = []
+    for t in types:
+        for c in compressions:
+            # the report ignores the *_MIN_TRAIN_POINTS margins, but a type faiss cannot train
+            # at all gets a "skipped" row instead of silently measuring the flat fallback
+            if effective_type(t, n, floor=False) != t:
+                rows.append({"type": t, "compression": c, "vectors": n,
+                             "skipped": f"not trained ({n} < {ivf_min_train(n, floor=False)})"})
+                continue
+            if effective_compression(c, n, floor=False) != c:
+                rows.append({"type": t, "compression": c, "vectors": n,
+                             "skipped": f"not trained ({n} < {compression_min_train(floor=False)})"})
+                continue
+            start = time.perf_counter()
+            index = configure_search(build_index(vectors, dim, t, c, floor=False), nprobe=nprobe, ef_search=ef_search)
+            build_s = time.perf_counter() - start
+            compressed = index_compression(index) != "none"
+            lat, raw, found = _time_queries(index, queries, k, vectors if compressed else None, rescore_factor)
+            rows.append({
+                "type": index_kind(index),
+                "compression": index_compression(index),
+                "vectors": n,
+                "bytes/vector": round(bytes_per_vector(index), 1),
+                "build_s": round(build_s, 3),
+                f"recall@{k}": round(recall_at_k(truth, raw), 4),
+                f"rescored@{k}": round(recall_at_k(truth, found), 4),
+                "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--compressions", default="none", help=f"comma list of {','.join(COMPRESSIONS)}")
+    parser.add_argument("--rescore-factor", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+
+    _, chunks = SegmentStore(settings.SEGMENTS_DIR).read_all()
+    if len(chunks) == 0:
+        print("No stored vectors in", settings.SEGMENTS_DIR)
+        return
+    vectors = np.concatenate(chunks.vector_parts(), axis=0)
+    rows = run_report(vectors, k=args.k, n_queries=args.queries, types=args.types.split(","),
+                      compressions=args.compressions.split(","), nprobe=args.nprobe, ef_search=args.ef_search,
+                      rescore_factor=args.rescore_factor)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    measured = [r for r in rows if "skipped" not in r]
+    if measured:
+        cols = list(measured[0].keys())
+        print("  ".join(f"{c:>14}" for c in cols))
+        for r in measured:
+            print("  ".join(f"{r[c]!s:>14}" for c in cols))
+    for r in rows:
+        if "skipped" in r:
+            print(f"{r['type']}/{r['compression']}: {r['skipped']}, skipped")
+
+
+if __name__ == "__main__":
+    main()
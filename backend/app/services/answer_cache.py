@@ -0,0 +1,146 @@
+# app/services/answer_cache.py
+import re
+import time
+import numpy as np
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from app.config import settings
+
+_PUNCT_RE = re.compile(r"[\s?!.,;:]+$")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question."""
+    return _PUNCT_RE.sub("", _SPACE_RE.sub(" ", query.strip().lower()))
+
+
+class AnswerCache:
+    """
+    Answers to past /api/chat questions. A lookup first tries the normalized query text,
+    then the most similar cached query embedding (cosine >= `similarity`) among entries
+    asked with the same retrieval options. Entries expire after `ttl` seconds, the
+    least recently used ones are evicted past `max_entries`, and everything is dropped
+    when the vector store version moves on, since the answers may no longer hold.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # (normalized query, options) -> {"answer", "sources", "vector", "created"}
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._version = None
+        # stacked query vectors of the current entries, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_keys = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._matrix = None
+
+    def _nearest(self, vector: np.ndarray, options: str, now: float):
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e["vector"] is not None]
+            self._matrix = (np.stack([self._entries[k]["vector"] for k in self._matrix_keys])
+                            if self._matrix_keys else np.zeros((0, len(vector)), dtype="float32"))
+        if not len(self._matrix_keys) or self._matrix.shape[1] != len(vector):
+            return None
+        sims = self._matrix @ vector
+        for pos in np.argsort(-sims):
+            if sims[pos] < self.similarity:
+                break
+            key = self._matrix_keys[pos]
+            entry = self._entries.get(key)
+            if key[1] == options and entry is not None and not self._expired(entry, now):
+                return key
+        return None
+
+    def get(self, query: str, vector: Optional[np.ndarray], options: str, version) -> Optional[dict]:
+        """Cached {"answer", "sources", "cached": "exact" | "semantic"} or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        key = (normalize_query(query), options)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._drop(key)
+                entry = None
+            kind = "exact"
+            if entry is None and vector is not None:
+                near = self._nearest(vector, options, now)
+                if near is not None:
+                    key, entry, kind = near, self._entries[near], "semantic"
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            return {"answer": entry["answer"], "sources": entry["sources"], "cached": kind}
+
+    def put(self, query: str, vector: Optional[np.ndarray], options: str, version, answer: str, sources: list):
+        if not self.enabled:
+            return
+        key = (normalize_query(query), options)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = {"answer": answer, "sources": sources, "vector": vector, "created": time.time()}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "index_version": self._version,
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
@@ -0,0 +1,266 @@
+# app/services/chunk_store.py
+import hashlib
+import json
+import mmap
+import os
+import numpy as np
+from typing import List
+from app.services.lexical_index import LexicalIndex, LexicalSegment, build_postings
+
+# per-chunk fixed-width columns; text lives in a separate utf-8 blob addressed by (offset, length).
+# page is 1-based, 0 when unknown (non-paged files, segments written before pages were tracked);
+# cid is the stable chunk id (older segments derive it from the manifest's first_id);
+# cs/ce are the [start, end) character span of the chunk in its document's text, -1 when unknown
+CHUNK_DTYPE = np.dtype([("doc", "<i4"), ("ts", "<f8"), ("off", "<i8"), ("len", "<i4"), ("page", "<i4"), ("cid", "<i8"),
+                        ("cs", "<i8"), ("ce", "<i8")])
+
+
+def chunk_paths(base: str):
+    return base + ".cols.npy", base + ".text.bin", base + ".docs.json", base + ".lex.npz"
+
+
+def document_id(filename: str) -> str:
+    """Stable document id: derived from the filename, so a re-upload keeps the id of the copy it replaces."""
+    return hashlib.sha1((filename or "unknown").encode("utf-8")).hexdigest()[:16]
+
+
+def rows_for_filenames(base: str, filenames) -> np.ndarray:
+    """Local rows of a segment whose chunks came from any of `filenames`, without opening text or postings."""
+    cols_path, _, docs_path, _ = chunk_paths(base)
+    with open(docs_path, "r") as f:
+        names = json.load(f)
+    wanted = np.array([n in filenames for n in names] or [False], dtype=bool)
+    doc = np.load(cols_path, mmap_mode="r", allow_pickle=False)["doc"]
+    return np.flatnonzero(wanted[np.asarray(doc)]) if len(doc) else np.zeros(0, dtype="int64")
+
+
+def build_chunk_columns(records: List[dict]):
+    """
+    Turn chunk metadata records ({"filename", "text", "timestamp", "page", "chunk_id", "char_start", "char_end"})
+    into columnar form:
+    a structured array of fixed-width columns, the utf-8 text blob and the interned filename table.
+    """
+    filenames, name_to_id = [], {}
+    cols = np.zeros(len(records), dtype=CHUNK_DTYPE)
+    blobs, offset = [], 0
+    for i, rec in enumerate(records):
+        name = rec.get("filename") or "unknown"
+        doc = name_to_id.get(name)
+        if doc is None:
+            doc = name_to_id[name] = len(filenames)
+            filenames.append(name)
+        data = (rec.get("text") or "").encode("utf-8")
+        cols[i] = (doc, rec.get("timestamp") or 0.0, offset, len(data), rec.get("page") or 0, rec.get("chunk_id", -1),
+                   rec.get("char_start", -1), rec.get("char_end", -1))
+        blobs.append(data)
+        offset += len(data)
+    return cols, b"".join(blobs), filenames
+
+
+def build_chunk_postings(records: List[dict]) -> dict:
+    """BM25 token statistics for a segment, computed once at write time."""
+    return build_postings([rec.get("text") or "" for rec in records])
+
+
+class ChunkSegment:
+    """
+    One segment's chunks: columns, text blob and (optionally) the full-precision
+    vectors are memory-mapped; the filename table is tiny and read eagerly.
+    """
+
+    def __init__(self, base: str, vectors: np.ndarray = None, first_id: int = 0):
+        self.name = os.path.basename(base)
+        self.vectors = vectors
+        cols_path, text_path, docs_path, lex_path = chunk_paths(base)
+        self.cols = np.load(cols_path, mmap_mode="r", allow_pickle=False)
+        if "page" in self.cols.dtype.names:
+            self.pages = self.cols["page"]
+        else:
+            self.pages = np.zeros(len(self.cols), dtype="int32")
+        if "cid" in self.cols.dtype.names:
+            self.chunk_ids = self.cols["cid"]
+        else:
+            self.chunk_ids = np.arange(first_id, first_id + len(self.cols), dtype="int64")
+        with open(docs_path, "r") as f:
+            self.filenames = json.load(f)
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+        self.lexical = LexicalSegment.load(lex_path, texts_fn=lambda: [self.text(i) for i in range(len(self))])
+
+    def __len__(self):
+        return len(self.cols)
+
+    def text(self, i: int) -> str:
+        off, ln = int(self.cols["off"][i]), int(self.cols["len"][i])
+        return self._blob[off:off + ln].decode("utf-8", errors="ignore")
+
+    def char_span(self, i: int):
+        if "cs" not in self.cols.dtype.names:
+            return -1, -1
+        return int(self.cols["cs"][i]), int(self.cols["ce"][i])
+
+    def records(self, rows=None) -> List[dict]:
+        """Chunk records of `rows` (default: every row), chunk ids included so rewrites keep them."""
+        rows = range(len(self)) if rows is None else rows
+        return [
+            {"filename": self.filenames[int(self.cols["doc"][i])], "text": self.text(i),
+             "timestamp": float(self.cols["ts"][i]), "page": int(self.pages[i]), "chunk_id": int(self.chunk_ids[i]),
+             "char_start": self.char_span(i)[0], "char_end": self.char_span(i)[1]}
+            for i in rows
+        ]
+
+
+class ChunkStore:
+    """
+    Read-only, columnar view over the chunk metadata of every loaded segment, aligned with
+    FAISS row order. Filenames are interned into one document table; doc ids and timestamps
+    are contiguous numpy arrays; text is only decoded for the rows that are asked for.
+    Indexing returns the {"filename", "text", "timestamp"} dict the old pickle held, plus "page".
+    Exact float32 vectors are served from the segments' memory-mapped vector files, and
+    `lexical` is the BM25 inverted index over the same rows.
+    Deleted rows stay in place until compaction rewrites their segment; `live` masks
+    them out (None when nothing is deleted). `layout` is the manifest layout counter
+    the row positions belong to.
+    """
+
+    def __init__(self, filenames=None, doc_ids=None, timestamps=None, segments=None, lexical=None, pages=None,
+                 chunk_ids=None, live=None, layout: int = 0):
+        self.filenames = filenames or []
+        self._name_to_id = {n: i for i, n in enumerate(self.filenames)}
+        self.doc_ids = doc_ids if doc_ids is not None else np.zeros(0, dtype="int32")
+        self.timestamps = timestamps if timestamps is not None else np.zeros(0, dtype="float64")
+        self.pages = pages if pages is not None else np.zeros(0, dtype="int32")
+        self.chunk_ids = chunk_ids if chunk_ids is not None else np.zeros(0, dtype="int64")
+        self.live = live
+        self.n_deleted = 0 if live is None else int(len(live) - np.count_nonzero(live))
+        self.layout = layout
+        # (first global row, ChunkSegment), sorted by first row
+        self._segments = segments or []
+        self._starts = np.array([s for s, _ in self._segments], dtype="int64")
+        self.lexical = lexical if lexical is not None else LexicalIndex()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def with_segment(self, seg: ChunkSegment, deleted=None) -> "ChunkStore":
+        """
+        Return a new store with `seg` appended (`deleted`: its tombstoned local rows);
+        the current store is left untouched for readers.
+        """
+        filenames = list(self.filenames)
+        name_to_id = dict(self._name_to_id)
+        remap = np.empty(len(seg.filenames), dtype="int32")
+        for local, name in enumerate(seg.filenames):
+            gid = name_to_id.get(name)
+            if gid is None:
+                gid = name_to_id[name] = len(filenames)
+                filenames.append(name)
+            remap[local] = gid
+        doc_ids = np.concatenate([self.doc_ids, remap[np.asarray(seg.cols["doc"])]]) if len(seg) else self.doc_ids
+        timestamps = np.concatenate([self.timestamps, np.asarray(seg.cols["ts"], dtype="float64")])
+        pages = np.concatenate([self.pages, np.asarray(seg.pages, dtype="int32")])
+        chunk_ids = np.concatenate([self.chunk_ids, np.asarray(seg.chunk_ids, dtype="int64")])
+        live = self.live
+        if live is not None or (deleted is not None and len(deleted)):
+            seg_live = np.ones(len(seg), dtype=bool)
+            if deleted is not None:
+                seg_live[np.asarray(deleted, dtype="int64")] = False
+            live = np.concatenate([self.live if self.live is not None else np.ones(len(self), dtype=bool), seg_live])
+        return ChunkStore(filenames, doc_ids, timestamps, self._segments + [(len(self), seg)],
+                          self.lexical.with_segment(seg.lexical), pages, chunk_ids, live, self.layout)
+
+    def with_tombstones(self, deleted: dict) -> "ChunkStore":
+        """Return a new store with the local rows in `deleted` ({segment name: rows}) masked out."""
+        live = self.live.copy() if self.live is not None else np.ones(len(self), dtype=bool)
+        for start, seg in self._segments:
+            rows = deleted.get(seg.name)
+            if rows is not None and len(rows):
+                live[start + np.asarray(rows, dtype="int64")] = False
+        return ChunkStore(self.filenames, self.doc_ids, self.timestamps, self._segments, self.lexical,
+                          self.pages, self.chunk_ids, live, self.layout)
+
+    def segment_names(self) -> List[str]:
+        return [seg.name for _, seg in self._segments]
+
+    def open_segments(self) -> dict:
+        """{segment name: ChunkSegment} of the loaded segments, for a reload to reuse."""
+        return {seg.name: seg for _, seg in self._segments}
+
+    def is_live(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        if self.live is None:
+            return np.ones(len(ids), dtype=bool)
+        return self.live[ids]
+
+    def live_rows_of(self, filename: str) -> np.ndarray:
+        doc = self._name_to_id.get(filename)
+        if doc is None:
+            return np.zeros(0, dtype="int64")
+        rows = np.flatnonzero(self.doc_ids == doc)
+        return rows[self.is_live(rows)]
+
+    def document_id(self, idx: int) -> str:
+        return document_id(self.filename(idx))
+
+    def live_documents(self) -> List[str]:
+        """Filenames that still have at least one live chunk."""
+        doc_ids = self.doc_ids if self.live is None else self.doc_ids[self.live]
+        return [self.filenames[int(d)] for d in np.unique(doc_ids)]
+
+    def _locate(self, idx: int):
+        pos = int(np.searchsorted(self._starts, idx, side="right")) - 1
+        start, seg = self._segments[pos]
+        return seg, idx - start
+
+    def text(self, idx: int) -> str:
+        seg, local = self._locate(idx)
+        return seg.text(local)
+
+    def filename(self, idx: int) -> str:
+        return self.filenames[int(self.doc_ids[idx])]
+
+    def char_span(self, idx: int):
+        """(start, end) of the chunk in its document's text; (-1, -1) for chunks indexed without offsets."""
+        seg, local = self._locate(idx)
+        return seg.char_span(local)
+
+    def __getitem__(self, idx: int) -> dict:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return {"filename": self.filename(idx), "text": self.text(idx), "timestamp": float(self.timestamps[idx]),
+                "page": int(self.pages[idx]), "chunk_id": int(self.chunk_ids[idx]), "document_id": self.document_id(idx)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def vector_parts(self) -> List[np.ndarray]:
+        """Per-segment vector arrays in row order (memory-mapped; nothing is read until used)."""
+        return [seg.vectors for _, seg in self._segments]
+
+    def vectors(self, ids) -> np.ndarray:
+        """Gather exact vectors for arbitrary row ids, touching only the pages that hold them."""
+        ids = np.asarray(ids, dtype="int64")
+        parts = self.vector_parts()
+        dim = parts[0].shape[1] if parts else 0
+        out = np.empty((len(ids), dim), dtype="float32")
+        pos = np.searchsorted(self._starts, ids, side="right") - 1
+        for p in np.unique(pos):
+            mask = pos == p
+            start, seg = self._segments[p]
+            out[mask] = seg.vectors[ids[mask] - start]
+        return out
+
+    def vector_rows(self, start: int, stop: int) -> np.ndarray:
+        """Contiguous rows [start, stop) as one float32 array."""
+        return self.vectors(np.arange(start, stop))
+
+    def nbytes(self) -> int:
+        live = self.live.nbytes if self.live is not None else 0
+        return int(self.doc_ids.nbytes + self.timestamps.nbytes + self.pages.nbytes + self.chunk_ids.nbytes
+                   + live + self.lexical.lengths.nbytes)
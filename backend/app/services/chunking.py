@@ -0,0 +1,113 @@
+# app/services/chunking.py
+"""
+Streaming, section-aware chunker. One pass over each page's raw text: heading lines
+(detected before any whitespace normalization) close the current section unless it is
+still shorter than a quarter of the chunk budget, and the section is cut at word boundaries into chunks of at most `max_tokens` approximate tokens, consecutive chunks
+of a section sharing about `overlap_tokens`. Each chunk is a Chunk record carrying its
+whitespace-normalized text and the [char_start, char_end) span it covers in the
+document text (the pages joined with "\\n", as the ingestion pipeline stores it).
+"""
+import re
+from typing import Iterable, Iterator, NamedTuple, Tuple
+
+# rough size of a token for the embedding / generation models
+CHARS_PER_TOKEN = 4
+# longer lines are body text even if they are upper case or end with a colon
+HEADING_MAX_CHARS = 80
+# a section shorter than this share of the chunk budget is merged into the next one
+MIN_SECTION_FRACTION = 0.25
+
+# candidate heading lines (short ones only); is_heading has the final say
+HEADING_LINE_RE = re.compile(r"^(?=[^\n]{3,%d}$)[^\n]*(?:[A-Z][^a-z\n]*|:[^\S\n]*)$" % HEADING_MAX_CHARS, re.M)
+# upper-case words, digits only inside or after them: "PAYMENT TERMS", "SECTION 4", not "INV-0042" or "(A)"
+CAPS_HEADING_RE = re.compile(r"[A-Z][A-Z0-9]*(?: +[A-Z0-9]+)*")
+WORD_RE = re.compile(r"\S+")
+WORD_START_RE = re.compile(r"(?<!\S)\S")
+
+
+class Chunk(NamedTuple):
+    text: str
+    char_start: int
+    char_end: int
+    page: int = 0
+
+
+def approx_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def is_heading(line: str) -> bool:
+    """
+    ALL CAPS lines of letters, spaces and in-word digits ("PAYMENT TERMS", "SECTION 4")
+    with at least two words or five letters, and short label lines ending with a colon.
+    Codes, amounts and acronyms ("INV-0042", "USD 1,200.00", "NASA") are body text.
+    """
+    line = line.strip()
+    if len(line) < 3 or len(line) > HEADING_MAX_CHARS:
+        return False
+    if line.endswith(":"):
+        return True
+    if CAPS_HEADING_RE.fullmatch(line) is None:
+        return False
+    letters = sum(c.isalpha() for c in line)
+    return letters >= 5 or (" " in line and letters >= 4)
+
+
+def sections(text: str, min_chars: int = 1):
+    """
+    [start, end) spans of the text between heading lines; each heading opens its section.
+    A heading less than `min_chars` after the previous one does not cut, so short sections
+    (label lines on invoices and forms) are merged into the next one.
+    """
+    start = 0
+    for m in HEADING_LINE_RE.finditer(text):
+        if m.start() - start >= min_chars and is_heading(m.group()):
+            yield start, m.start()
+            start = m.start()
+    yield start, len(text)
+
+
+def _last_space(text: str, start: int, end: int) -> int:
+    return max(text.rfind(" ", start, end), text.rfind("\n", start, end), text.rfind("\t", start, end))
+
+
+def chunk_page(text: str, page: int = 0, offset: int = 0, max_tokens: int = 512,
+               overlap_tokens: int = 64) -> Iterator[Chunk]:
+    """
+    Chunks of one page; `offset` is where the page starts in the document text. The
+    budget is applied to the raw span, which whitespace normalization only shrinks,
+    and chunks are cut at the last whitespace that fits (mid-word only for a word
+    longer than the whole budget). Work is per chunk, not per word.
+    """
+    budget = max(1, max_tokens * CHARS_PER_TOKEN)
+    overlap = min(overlap_tokens, max_tokens) * CHARS_PER_TOKEN
+    for sec_start, sec_end in sections(text, max(1, int(budget * MIN_SECTION_FRACTION))):
+        first = WORD_RE.search(text, sec_start, sec_end)
+        pos = first.start() if first else sec_end
+        while pos < sec_end:
+            end = min(pos + budget, sec_end)
+            if end < sec_end and not text[end].isspace():
+                cut = _last_space(text, pos, end)
+                end = cut if cut > pos else end
+            raw = text[pos:end].rstrip()
+            yield Chunk(" ".join(raw.split()), offset + pos, offset + pos + len(raw), page)
+            nxt = WORD_RE.search(text, end, sec_end)
+            if nxt is None:
+                break
+            # step back to the first word that starts within `overlap` chars of the cut
+            back = WORD_START_RE.search(text, max(end - overlap, pos + 1), end) if overlap else None
+            pos = back.start() if back else nxt.start()
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], max_tokens: int = 512, overlap_tokens: int = 64,
+                offset: int = 0) -> Iterator[Chunk]:
+    """
+    Chunk (page number, text) pairs as they arrive; nothing is kept beyond the current
+    page. Chunks never cross pages. Empty pages are skipped and take no room in the
+    document text; `offset` is where the first page starts.
+    """
+    for page, text in pages:
+        if not text:
+            continue
+        yield from chunk_page(text, page, offset, max_tokens, overlap_tokens)
+        offset += len(text) + 1
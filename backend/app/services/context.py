@@ -0,0 +1,140 @@
+# app/services/context.py
+"""
+Context assembly for /api/chat. From the retrieved hits it picks a diverse subset by
+maximal marginal relevance, using the exact vectors search_index attaches (no extra
+embedding calls). Consecutive chunks of the same file are merged back into one passage
+without the words their windows share, and the passages are packed, best first, into a
+token budget.
+"""
+import numpy as np
+from typing import List, Tuple
+from app.services.chunking import CHARS_PER_TOKEN, approx_tokens
+
+PASSAGE_SEPARATOR = "\n\n---\n"
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_: float = 0.7) -> List[int]:
+    """
+    Indices of up to k rows, picked greedily by
+    lambda * relevance - (1 - lambda) * (max cosine to the rows already picked).
+    Relevance is rescaled to [0, 1] first; `vectors` must be L2-normalized. One n x n
+    product up front, then O(n) numpy work per pick.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    rel = np.asarray(relevance, dtype="float64")
+    spread = rel.max() - rel.min()
+    rel = (rel - rel.min()) / spread if spread > 0 else np.ones(n)
+    vectors = np.asarray(vectors, dtype="float32")
+    sims = vectors @ vectors.T
+    redundancy = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    picked = []
+    for _ in range(k):
+        score = np.where(available, lambda_ * rel - (1.0 - lambda_) * redundancy, -np.inf)
+        i = int(np.argmax(score))
+        picked.append(i)
+        available[i] = False
+        redundancy = np.maximum(redundancy, sims[i])
+    return picked
+
+
+def _overlap_words(a: List[str], b: List[str]) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    if not a or not b:
+        return 0
+    first = b[0]
+    for j in range(max(0, len(a) - len(b)), len(a)):
+        if a[j] == first and a[j:] == b[:len(a) - j]:
+            return len(a) - j
+    return 0
+
+
+def _join(run: List[Tuple[int, dict]]) -> dict:
+    """One passage from consecutive chunks of a file, ordered by chunk id."""
+    rank = min(r for r, _ in run)
+    first, last = run[0][1], run[-1][1]
+    passage = {k: v for k, v in first.items() if k != "vector"}
+    passage.update(rank=rank, chunk_ids=[h.get("chunk_id") for _, h in run],
+                   final_score=max(h.get("final_score", 0.0) for _, h in run))
+    if len(run) == 1:
+        return passage
+    words, prev = first["text"].split(), first
+    for _, h in run[1:]:
+        nxt = h["text"].split()
+        # known spans that do not overlap mean no shared words, even if the boundary words repeat
+        disjoint = prev.get("char_end") is not None and h.get("char_start") is not None and h["char_start"] >= prev["char_end"]
+        words.extend(nxt[0 if disjoint else _overlap_words(words, nxt):])
+        prev = h
+    passage["text"] = " ".join(words)
+    if first.get("char_start") is not None and last.get("char_end") is not None:
+        passage["char_start"], passage["char_end"] = first["char_start"], last["char_end"]
+    return passage
+
+
+def merge_adjacent(hits: List[dict]) -> List[dict]:
+    """
+    Merge hits that are consecutive chunks (chunk ids n, n+1, ...) of the same file and
+    collection into one passage, dropping the words each chunk repeats from the one
+    before (the chunking overlap). Passages keep the rank of their best-placed hit.
+    """
+    groups = {}
+    for rank, h in enumerate(hits):
+        groups.setdefault((h.get("collection"), h["filename"]), []).append((rank, h))
+    passages = []
+    for members in groups.values():
+        members.sort(key=lambda m: m[1].get("chunk_id", -1))
+        run = [members[0]]
+        for m in members[1:]:
+            prev_id = run[-1][1].get("chunk_id", -1)
+            if prev_id >= 0 and m[1].get("chunk_id") == prev_id + 1:
+                run.append(m)
+            else:
+                passages.append(_join(run))
+                run = [m]
+        passages.append(_join(run))
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def format_passage(p: dict) -> str:
+    page = f" | page {p['page']}" if p.get("page") else ""
+    return f"[Source: {p['filename']}{page} | ts: {p['timestamp']}]\n{p['text']}"
+
+
+def pack(passages: List[dict], max_tokens: int) -> List[dict]:
+    """
+    Passages, in order, that fit into `max_tokens` with their source headers and separators;
+    one that does not fit is skipped in favour of later, shorter ones. If not even the first
+    fits, it is cut at a word boundary to the budget.
+    """
+    packed, used = [], 0
+    sep = approx_tokens(PASSAGE_SEPARATOR)
+    for p in passages:
+        cost = approx_tokens(format_passage(p)) + (sep if packed else 0)
+        if used + cost <= max_tokens:
+            packed.append(p)
+            used += cost
+    if not packed and passages:
+        p = dict(passages[0])
+        room = max_tokens - approx_tokens(format_passage({**p, "text": ""}))
+        p["text"] = p["text"][:max(room, 0) * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+        packed.append(p)
+    return packed
+
+
+def assemble_context(hits: List[dict], max_chunks: int, max_tokens: int, lambda_: float = 0.7):
+    """
+    Pick up to `max_chunks` hits by MMR (falling back to their order when a hit has no
+    "vector"), merge adjacent chunks and pack them into `max_tokens`.
+    Returns (passages, context text, chunks picked).
+    """
+    if hits and all(h.get("vector") is not None for h in hits):
+        relevance = np.array([h.get("final_score", 0.0) for h in hits])
+        picked = [hits[i] for i in mmr(relevance, np.stack([h["vector"] for h in hits]), max_chunks, lambda_)]
+    else:
+        picked = hits[:max_chunks]
+    passages = pack(merge_adjacent(picked), max_tokens)
+    return passages, PASSAGE_SEPARATOR.join(format_passage(p) for p in passages), len(picked)
@@ -0,0 +1,162 @@
+# app/services/embedding_backends.py
+import hashlib
+import logging
+import random
+import re
+import time
+import numpy as np
+from threading import Lock
+from typing import List, Optional
+import google.generativeai as genai
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBackend:
+    """
+    Turns a batch of cleaned texts into vectors, one entry per input (None on failure).
+    model_name is used as part of the embedding cache key; remote backends are
+    throttled by the shared rate limiter, local ones opt out with rate_limited = False.
+    """
+    model_name = "base"
+    rate_limited = True
+
+    def embed_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        raise NotImplementedError
+
+
+def _to_vector(values) -> Optional[np.ndarray]:
+    if values is None:
+        return None
+    arr = np.array(values, dtype="float32")
+    if arr.size == 0 or np.all(arr == 0):
+        return None
+    return arr
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model: str = None):
+        self.model_name = model or settings.GEMINI_EMBEDDING_MODEL
+
+    def embed_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        # a list content is sent as one batchEmbedContents request
+        response = genai.embed_content(model=self.model_name, content=list(texts))
+        vectors = None
+        if isinstance(response, dict):
+            # some SDKs put embedding under 'embedding' or 'embeddings'
+            vectors = response.get("embedding") or response.get("embeddings")
+        elif hasattr(response, "embedding"):
+            vectors = response.embedding
+        elif hasattr(response, "embeddings"):
+            vectors = response.embeddings
+
+        if not isinstance(vectors, list):
+            raise ValueError(f"Unexpected embedding response shape: {type(response).__name__}")
+        if len(texts) == 1 and vectors and isinstance(vectors[0], (int, float)):
+            vectors = [vectors]
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding response has {len(vectors)} vectors for {len(texts)} inputs")
+        return [_to_vector(v) for v in vectors]
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic offline embedder for tests and benchmarks. Tokens are feature-hashed
+    into `dim` buckets so texts sharing words land close together, like a real model would.
+    """
+
+    rate_limited = False
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_name = f"fake-hash-{dim}"
+
+    def embed_one(self, text: str) -> Optional[np.ndarray]:
+        vec = np.zeros(self.dim, dtype="float32")
+        for tok in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        if not np.any(vec):
+            return None
+        return vec / np.linalg.norm(vec)
+
+    def embed_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.embed_one(t) for t in texts]
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_transient(e: Exception) -> bool:
+    """
+    Whether an embedding call error is worth retrying: timeouts, dropped connections,
+    rate limiting (408/429) and server errors (5xx). Other 4xx responses and bad input
+    (ValueError, TypeError) fail the same way on every attempt.
+    """
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    # google.api_core errors carry the HTTP status as .code; other clients as .status_code
+    code = getattr(e, "code", None)
+    if code is None:
+        code = getattr(e, "status_code", None)
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return False
+    return code in (408, 429) or code >= 500
+
+
+def call_with_retries(fn, *args, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                      rate_limiter: "TokenBucket" = None):
+    """
+    Call fn(*args), retrying transient errors (see is_transient) with exponential backoff +
+    jitter. Every attempt, retries included, first takes a token from `rate_limiter` if given.
+    Re-raises permanent errors at once and the last transient one when retries run out.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt >= max_retries or not is_transient(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+            logger.warning(f"Embedding call failed ({type(e).__name__}: {e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def make_backend(name: str = None) -> EmbeddingBackend:
+    name = (name or settings.EMBEDDING_BACKEND).lower()
+    if name == "fake":
+        return FakeEmbeddingBackend(dim=settings.EMBEDDING_FAKE_DIM)
+    if name == "gemini":
+        return GeminiEmbeddingBackend()
+    raise ValueError(f"Unknown embedding backend: {name}")
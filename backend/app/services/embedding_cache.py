@@ -0,0 +1,145 @@
+# app/services/embedding_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import numpy as np
+from collections import OrderedDict
+from threading import Lock
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by sha256(model + cleaned text).
+    Tier 1 is a bounded in-process LRU, tier 2 a SQLite table of float32 blobs.
+    Rows written under a different embedding model are dropped on open.
+    """
+
+    def __init__(self, path: str, model: str, memory_size: int = 10000, disk_max_rows: int = 200000):
+        self.path = path
+        self.model = model
+        self.memory_size = memory_size
+        self.disk_max_rows = disk_max_rows
+        self._mem = OrderedDict()
+        self._lock = Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._disk_rows = 0
+        if path:
+            self._open()
+
+    def _open(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        # invalidate everything produced by a previous embedding model
+        cur = self._conn.execute("DELETE FROM embeddings WHERE model != ?", (self.model,))
+        if cur.rowcount:
+            logger.debug(f"Embedding cache dropped {cur.rowcount} entries from a previous model")
+        self._conn.commit()
+        (self._disk_rows,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get(self, text: str):
+        key = cache_key(self.model, text)
+        with self._lock:
+            vec = self._mem.get(key)
+            if vec is not None:
+                self._mem.move_to_end(key)
+                self.memory_hits += 1
+                return vec
+            if self._conn is not None:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vec = np.frombuffer(row[0], dtype="float32").copy()
+                    self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._conn.commit()
+                    self._remember(key, vec)
+                    self.disk_hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vec: np.ndarray):
+        key = cache_key(self.model, text)
+        vec = np.asarray(vec, dtype="float32")
+        with self._lock:
+            self._remember(key, vec)
+            if self._conn is not None:
+                # same key means same model + text, so an existing row already holds this vector
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, self.model, int(vec.shape[0]), vec.tobytes(), time.time()),
+                )
+                self._conn.commit()
+                self._disk_rows += cur.rowcount
+                self._prune_disk()
+
+    def _remember(self, key, vec):
+        self._mem[key] = vec
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_size:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _prune_disk(self):
+        if self.disk_max_rows <= 0:
+            return
+        # prune in 10% steps so we don't run a DELETE on every insert once full
+        overflow = self._disk_rows - self.disk_max_rows
+        if overflow > 0:
+            n = overflow + self.disk_max_rows // 10
+            cur = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (n,)
+            )
+            self._conn.commit()
+            self._disk_rows -= cur.rowcount
+            self.evictions += cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+                self._disk_rows = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model,
+                "memory_entries": len(self._mem),
+                "disk_entries": self._disk_rows,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(
+    settings.EMBEDDING_CACHE_PATH,
+    settings.GEMINI_EMBEDDING_MODEL,
+    memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+    disk_max_rows=settings.EMBEDDING_CACHE_DISK_MAX_ROWS,
+)
@@ -1,90 +1,122 @@
 import google.generativeai as genai
 import numpy as np
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from app.config import settings
+from app.services.chunking import Chunk, iter_chunks
 from app.services.preprocessing import clean_text
-import re
+from app.services.embedding_cache import EmbeddingCache, embedding_cache
+from app.services.embedding_backends import (
+    EmbeddingBackend, GeminiEmbeddingBackend, TokenBucket, call_with_retries, make_backend,
+)
+from app.services.metrics import counter, span, timed
+import logging
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
 
-def chunk_text(text: str, chunk_size_words: int = 180, overlap: int = 40) -> List[str]:
+EMBEDDED_TEXTS = counter("embedded_texts_total", "Texts sent to the embedding backend, by outcome.", ["result"])
+
+def chunk_text(text: str, max_tokens: int = None, overlap_tokens: int = None) -> List[str]:
+    """Texts of the section-aware, token-budgeted chunks of `text` (see app.services.chunking)."""
+    return [c.text for c in chunk_document(text, max_tokens, overlap_tokens)]
+
+@timed("chunk")
+def chunk_document(text: str, max_tokens: int = None, overlap_tokens: int = None, page: int = 0) -> List[Chunk]:
+    """Chunk records of a whole document; offsets index into `text` as given (not cleaned)."""
+    chunks = list(iter_chunks([(page, text)], max_tokens or settings.CHUNK_SIZE,
+                              settings.CHUNK_OVERLAP if overlap_tokens is None else overlap_tokens))
+    logger.debug(f"chunk_document created {len(chunks)} chunks")
+    return chunks
+
+_backend = make_backend()
+# the shared cache is keyed by the Gemini model; other backends run uncached unless given one
+_cache = embedding_cache if isinstance(_backend, GeminiEmbeddingBackend) else None
+_rate_limiter = TokenBucket(settings.EMBEDDING_REQUESTS_PER_SEC)
+
+def set_embedding_backend(backend: EmbeddingBackend, cache: Optional[EmbeddingCache] = None):
+    """Swap the backend used by get_embedding/embed_texts (e.g. FakeEmbeddingBackend for offline runs)."""
+    global _backend, _cache
+    _backend = backend
+    _cache = cache
+
+def get_embedding_backend() -> EmbeddingBackend:
+    return _backend
+
+def _embed_with_retries(batch: List[str]) -> List[Optional[np.ndarray]]:
+    with span("embed_batch"):
+        return call_with_retries(_backend.embed_batch, batch, max_retries=settings.EMBEDDING_MAX_RETRIES,
+                                 rate_limiter=_rate_limiter if _backend.rate_limited else None)
+
+def _embed_batch_with_retries(batch: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Embed one batch; if it still fails after retries, embed its texts one at a time so a
+    single bad input or a request too large for the API only loses its own vector.
+    """
+    try:
+        vectors = _embed_with_retries(batch)
+        EMBEDDED_TEXTS.inc(len(batch), result="ok")
+        return vectors
+    except Exception as e:
+        if len(batch) == 1:
+            logger.error(f"Embedding failed after retries: {e!r}")
+            EMBEDDED_TEXTS.inc(1, result="failed")
+            return [None]
+        logger.warning(f"Embedding batch of {len(batch)} failed ({e!r}); retrying its texts one by one")
+    return [_embed_batch_with_retries([t])[0] for t in batch]
+
+def embed_texts(texts: List[str], batch_size: int = None, concurrency: int = None) -> List[Optional[np.ndarray]]:
     """
-    Split text into overlapping word chunks.
-    Additionally, respects sections based on headings.
+    Embed many texts, returning vectors in input order (None where embedding failed).
+    Cache hits are served locally; misses are deduplicated, grouped into multi-content
+    requests and sent through a bounded thread pool under the shared rate limiter.
     """
-    # Normalize headings (lines in ALL CAPS or ending with colon)
-    lines = text.split("\n")
-    sections = []
-    current_section = ""
-    for line in lines:
-        if re.match(r'^[A-Z ]{3,}$', line.strip()) or line.strip().endswith(":"):
-            if current_section.strip():
-                sections.append(current_section.strip())
-            current_section = line.strip() + "\n"
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    concurrency = concurrency or settings.EMBEDDING_CONCURRENCY
+
+    cleaned = [clean_text(t) for t in texts]
+    results: List[Optional[np.ndarray]] = [None] * len(cleaned)
+    pending = {}  # cleaned text -> positions waiting on it
+    for i, t in enumerate(cleaned):
+        if not t:
+            continue
+        vec = _cache.get(t) if _cache is not None else None
+        if vec is not None:
+            results[i] = vec
         else:
-            current_section += line.strip() + " "
-    if current_section.strip():
-        sections.append(current_section.strip())
+            pending.setdefault(t, []).append(i)
 
-    # Break sections into overlapping word chunks
-    chunks = []
-    for sec in sections:
-        words = sec.split()
-        if len(words) <= chunk_size_words:
-            chunks.append(sec)
+    if pending:
+        todo = list(pending)
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        if len(batches) == 1:
+            batch_vectors = [_embed_batch_with_retries(batches[0])]
         else:
-            step = chunk_size_words - overlap
-            for i in range(0, len(words), step):
-                chunk = " ".join(words[i:i + chunk_size_words])
-                if chunk.strip():
-                    chunks.append(chunk)
-    print(f"[DEBUG] chunk_text created {len(chunks)} chunks")
-    return chunks
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+                batch_vectors = list(pool.map(_embed_batch_with_retries, batches))
+        for batch, vectors in zip(batches, batch_vectors):
+            for t, vec in zip(batch, vectors):
+                if vec is None:
+                    continue
+                if _cache is not None:
+                    _cache.put(t, vec)
+                for i in pending[t]:
+                    results[i] = vec
+    return results
 
 def get_embedding(text: str):
-    text = clean_text(text)
-    if not text:
-        return None
-    try:
-        response = genai.embed_content(model=settings.GEMINI_EMBEDDING_MODEL, content=text)
-        # inspect possible shapes
-        vector = None
-        if isinstance(response, dict):
-            # some SDKs put embedding under 'embedding' or 'embeddings'
-            vector = response.get("embedding") or response.get("embeddings")
-            if isinstance(vector, list) and len(vector)>0 and isinstance(vector[0], (int, float)):
-                # vector is the embedding list
-                pass
-            elif isinstance(vector, list) and len(vector)>0 and isinstance(vector[0], list):
-                # maybe embeddings is list of lists; choose first
-                vector = vector[0]
-        elif hasattr(response, "embedding"):
-            vector = response.embedding
-        elif hasattr(response, "embeddings"):
-            vector = response.embeddings
+    return embed_texts([text])[0]
 
-        if vector is None:
-            return None
-        arr = np.array(vector, dtype="float32")
-        if arr.size == 0 or np.all(arr == 0):
-            return None
-        return arr
-    except Exception as e:
-        print("[ERROR] Embedding failed:", repr(e))
-        return None
-def embed_document(document_text: str, chunk_size: int = 180, overlap: int = 40) -> Tuple[List[str], List[np.ndarray]]:
+def embed_document(document_text: str, chunk_size: int = None, overlap: int = None) -> Tuple[List[Chunk], List[np.ndarray]]:
     """
-    Embed a full document with section-aware chunking.
-    Returns chunks and embeddings.
+    Embed a full document with section-aware chunking (chunk_size / overlap in approximate tokens).
+    Returns Chunk records and embeddings (same order; None where a chunk could not be embedded).
+    Pass the raw extracted text: headings are found on its line breaks and offsets point into it.
     """
-    chunks = chunk_text(document_text, chunk_size_words=chunk_size, overlap=overlap)
-    embeddings = []
-    for i, chunk in enumerate(chunks):
-        vec = get_embedding(chunk)
-        embeddings.append(vec)
-        if vec is not None:
-            print(f"[DEBUG] Embedded chunk {i+1}/{len(chunks)}")
-        else:
-            print(f"[WARN] Failed to embed chunk {i+1}/{len(chunks)}")
-    print(f"[DEBUG] Total chunks: {len(chunks)} | Successful embeddings: {sum(e is not None for e in embeddings)}")
+    chunks = chunk_document(document_text, chunk_size, overlap)
+    embeddings = embed_texts([c.text for c in chunks])
+    failed = sum(e is None for e in embeddings)
+    if failed:
+        logger.warning(f"Failed to embed {failed}/{len(chunks)} chunks")
+    logger.debug(f"Total chunks: {len(chunks)} | Successful embeddings: {len(chunks) - failed}")
     return chunks, embeddings
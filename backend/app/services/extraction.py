@@ -1,31 +1,135 @@
-import spacy, re, os
-try:
-    nlp = spacy.load("en_core_web_sm")
-except Exception:
-    # If model not present, download it
-    import subprocess, sys
-    subprocess.run([sys.executable, "-m", "spacy", "download", "en_core_web_sm"], check=True)
-    nlp = spacy.load("en_core_web_sm")
+# app/services/extraction.py
+"""
+Named-entity and pattern extraction for ingested documents.
 
-def extract_entities(text: str) -> dict:
-    doc = nlp(text)
+The spaCy model is loaded on first use rather than at import, with only the
+components NER needs. Long text is split into pieces well below nlp.max_length and
+streamed through nlp.pipe in batches; entities come back deduplicated with their
+character offsets in the original text.
+"""
+import logging
+import re
+import threading
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# components NER never reads; excluded at load so their weights are not even deserialized
+NON_NER_PIPES = ("parser", "tagger", "morphologizer", "lemmatizer", "attribute_ruler", "senter")
+# offsets kept per distinct entity; `count` still covers every mention
+MAX_OFFSETS = 100
+
+INVOICE_RE = re.compile(r"invoice\s*number[:\-\s]*([A-Za-z0-9\-\/]+)", re.IGNORECASE)
+DATE_RE = re.compile(r"\b\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4}\b")
+AMOUNT_RE = re.compile(r"\$\s*[0-9,]+(?:\.\d{1,2})?")
+_SPACE_RE = re.compile(r"\s+")
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def _load_model(name: str):
+    import spacy
+    try:
+        nlp = spacy.load(name, exclude=list(NON_NER_PIPES))
+    except OSError:
+        if not settings.SPACY_AUTO_DOWNLOAD:
+            raise
+        logger.warning(f"spaCy model {name} is not installed; downloading it")
+        from spacy.cli import download
+        download(name)
+        nlp = spacy.load(name, exclude=list(NON_NER_PIPES))
+    # shared embedding layers only matter if NER listens to them (e.g. transformer pipelines)
+    for pipe in ("tok2vec", "transformer"):
+        if pipe in nlp.pipe_names and "ner" not in getattr(nlp.get_pipe(pipe), "listening_components", []):
+            nlp.disable_pipe(pipe)
+    return nlp
+
+
+def get_nlp():
+    """The shared NER pipeline, loaded on first call."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = _load_model(settings.SPACY_MODEL)
+                logger.debug(f"Loaded spaCy {settings.SPACY_MODEL} with pipes {_nlp.pipe_names}")
+    return _nlp
+
+
+def split_text(text: str, max_chars: int) -> list:
+    """
+    (offset, piece) spans of at most max_chars characters, cut after a sentence end
+    or at whitespace in the second half of each window so entities are rarely split.
+    """
+    spans, start, n = [], 0, len(text)
+    while start < n:
+        end = min(start + max_chars, n)
+        if end < n:
+            cut = text.rfind(". ", start + max_chars // 2, end)
+            if cut < 0:
+                cut = text.rfind(" ", start + max_chars // 2, end)
+            if cut >= 0:
+                end = cut + 1
+        spans.append((start, text[start:end]))
+        start = end
+    return spans
+
+
+def extract_entity_records(text: str, batch_size: int = None, n_process: int = None) -> list:
+    """
+    Deduplicated entities as [{"label", "text", "count", "offsets": [[start, end], ...]}]
+    in order of first mention; offsets are character positions in `text`.
+    """
+    if not text or not text.strip():
+        return []
+    nlp = get_nlp()
+    pieces = split_text(text, min(settings.NER_CHUNK_CHARS, nlp.max_length - 1))
+    docs = nlp.pipe(
+        ((piece, offset) for offset, piece in pieces),
+        as_tuples=True,
+        batch_size=batch_size or settings.NER_BATCH_SIZE,
+        n_process=n_process or settings.NER_PROCESSES,
+    )
+    records = {}
+    for doc, offset in docs:
+        for ent in doc.ents:
+            value = _SPACE_RE.sub(" ", ent.text).strip()
+            if not value:
+                continue
+            rec = records.get((ent.label_, value))
+            if rec is None:
+                rec = records[(ent.label_, value)] = {"label": ent.label_, "text": value, "count": 0, "offsets": []}
+            rec["count"] += 1
+            if len(rec["offsets"]) < MAX_OFFSETS:
+                rec["offsets"].append([offset + ent.start_char, offset + ent.end_char])
+    return list(records.values())
+
+
+def group_entities(records: list) -> dict:
+    """{label: [distinct entity texts]} from extract_entity_records output."""
     entities = {}
-    for ent in doc.ents:
-        entities.setdefault(ent.label_, []).append(ent.text)
+    for rec in records:
+        entities.setdefault(rec["label"], []).append(rec["text"])
     return entities
 
+
+def extract_entities(text: str) -> dict:
+    return group_entities(extract_entity_records(text))
+
+
 def extract_custom_patterns(text: str) -> dict:
     patterns = {}
     # invoice number pattern (simple)
-    m = re.search(r"invoice\s*number[:\-\s]*([A-Za-z0-9\-\/]+)", text, re.IGNORECASE)
+    m = INVOICE_RE.search(text)
     if m:
         patterns["invoice_no"] = m.group(1)
     # date pattern
-    dates = re.findall(r'\b\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4}\b', text)
+    dates = DATE_RE.findall(text)
     if dates:
         patterns["dates"] = dates
     # amount (currency)
-    amounts = re.findall(r"\$\s*[0-9,]+(?:\.\d{1,2})?", text)
+    amounts = AMOUNT_RE.findall(text)
     if amounts:
         patterns["amounts"] = amounts
     return patterns
@@ -0,0 +1,168 @@
+# app/services/lexical_index.py
+import math
+import os
+import re
+import numpy as np
+from collections import Counter
+from typing import List, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_postings(texts: List[str]) -> dict:
+    """
+    Inverted index for one segment in CSR form: sorted `terms`, `indptr` into the
+    parallel `rows` (segment-local chunk row) / `tfs` arrays, plus per-chunk token `lengths`.
+    """
+    postings = {}
+    lengths = np.zeros(len(texts), dtype="int32")
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths[row] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, tf))
+    terms = sorted(postings)
+    indptr = np.zeros(len(terms) + 1, dtype="int64")
+    rows, tfs = [], []
+    for i, term in enumerate(terms):
+        plist = postings[term]
+        indptr[i + 1] = indptr[i] + len(plist)
+        rows.extend(r for r, _ in plist)
+        tfs.extend(tf for _, tf in plist)
+    return {
+        "terms": np.array(terms, dtype="U") if terms else np.zeros(0, dtype="U1"),
+        "indptr": indptr,
+        "rows": np.array(rows, dtype="int32"),
+        "tfs": np.minimum(np.array(tfs, dtype="int64"), np.iinfo("uint16").max).astype("uint16"),
+        "lengths": lengths,
+    }
+
+
+def save_postings(f, postings: dict):
+    np.savez(f, **postings)
+
+
+class LexicalSegment:
+    """Postings of one immutable segment."""
+
+    def __init__(self, postings: dict):
+        self.indptr = postings["indptr"]
+        self.rows = postings["rows"]
+        self.tfs = postings["tfs"]
+        self.lengths = postings["lengths"]
+        self._term_ids = {t: i for i, t in enumerate(postings["terms"].tolist())}
+
+    @classmethod
+    def load(cls, path: str, texts_fn=None):
+        """Load `path`; segments written before the lexical index existed are indexed from their texts."""
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                return cls({k: data[k] for k in data.files})
+        return cls(build_postings(texts_fn() if texts_fn else []))
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        tid = self._term_ids.get(term)
+        if tid is None:
+            return None, None
+        lo, hi = self.indptr[tid], self.indptr[tid + 1]
+        return self.rows[lo:hi], self.tfs[lo:hi]
+
+    def df(self, term: str) -> int:
+        tid = self._term_ids.get(term)
+        return 0 if tid is None else int(self.indptr[tid + 1] - self.indptr[tid])
+
+
+class LexicalIndex:
+    """
+    BM25 over every loaded segment, aligned with FAISS row order. Immutable like
+    ChunkStore: with_segment returns a new index so readers keep a consistent view.
+    """
+
+    def __init__(self, segments=None, lengths=None, k1: float = 1.2, b: float = 0.75):
+        self._segments = segments or []  # (first global row, LexicalSegment)
+        self.lengths = lengths if lengths is not None else np.zeros(0, dtype="int32")
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        # per-row BM25 length normalisation, precomputed once per snapshot
+        self._norm = (k1 * (1.0 - b + b * self.lengths / max(self.avgdl, 1e-6))).astype("float32")
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def with_segment(self, seg: LexicalSegment) -> "LexicalIndex":
+        lengths = np.concatenate([self.lengths, seg.lengths])
+        return LexicalIndex(self._segments + [(len(self), seg)], lengths, self.k1, self.b)
+
+    def _idf(self, term: str) -> float:
+        df = sum(seg.df(term) for _, seg in self._segments)
+        if df == 0:
+            return 0.0
+        n = len(self)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for `query` (dense float32 array, zeros for non-matching rows)."""
+        out = np.zeros(len(self), dtype="float32")
+        if not len(self):
+            return out
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            if idf <= 0.0:
+                continue
+            for start, seg in self._segments:
+                rows, tfs = seg.postings(term)
+                if rows is None:
+                    continue
+                ids = rows.astype("int64") + start
+                tf = tfs.astype("float32")
+                out[ids] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[ids])
+        return out
+
+    def match_fraction(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        For each row in `ids`, the fraction of query tokens (with repeats) that occur in it,
+        answered from the postings instead of re-tokenising the chunk text.
+        """
+        q_toks = tokenize(query)
+        out = np.zeros(len(ids), dtype="float32")
+        if not q_toks or not len(ids):
+            return out
+        ids = np.asarray(ids, dtype="int64")
+        for term, count in Counter(q_toks).items():
+            for start, seg in self._segments:
+                rows, _ = seg.postings(term)
+                if rows is None:
+                    continue
+                local = ids - start
+                in_seg = (local >= 0) & (local < len(seg))
+                # postings rows are sorted, so membership is a binary search
+                pos = np.searchsorted(rows, local[in_seg])
+                pos = np.minimum(pos, len(rows) - 1)
+                hit = np.zeros(len(ids), dtype=bool)
+                hit[in_seg] = rows[pos] == local[in_seg]
+                out[hit] += count
+        return out / len(q_toks)
+
+    def search(self, query: str, k: int, live: np.ndarray = None, scores: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (ids, scores) by BM25, best first; only rows with a positive score are returned.
+        `live` (bool per row) excludes deleted rows. Pass `scores` from scores(query) when the
+        caller needs them too, so the postings are only walked once; the array is not modified.
+        """
+        if scores is None:
+            scores = self.scores(query)
+        if live is not None:
+            scores = np.where(live, scores, 0.0)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        order = np.argsort(-scores[hits])
+        return hits[order], scores[hits][order]
@@ -0,0 +1,246 @@
+# app/services/metrics.py
+"""
+In-process instrumentation: counters, gauges and histograms with labels, rendered in
+the Prometheus text format at /metrics, and timing spans that feed the per-stage
+latency histogram and, when one is active, the per-request trace.
+
+    with span("faiss_search"):
+        ...
+
+Callback metrics read their values at scrape time (cache stats, index size, queue
+depth), so nothing on the hot path has to keep them up to date.
+"""
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "idp_"
+# seconds; covers a cache lookup up to a slow OCR'd PDF
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=(), callback=None):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # callback() -> value, or {label values tuple: value}; read at scrape time
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) rows for render()."""
+        if self.callback is not None:
+            values = self.callback()
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            if value is not None:
+                yield "", key, "", value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, key, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield "_bucket", key, f'le="{_number(bound)}"', cumulative
+            yield "_sum", key, "", total
+            yield "_count", key, "", count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # re-registering (e.g. a module reloaded in tests) keeps the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for m in metrics:
+            try:
+                blocks.append(m.render())
+            except Exception as e:
+                logger.warning(f"Metric {m.name} failed to collect: {type(e).__name__}: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames=(), callback=None) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames, callback))
+
+
+def gauge(name: str, help: str, labelnames=(), callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, callback))
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram("stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+
+
+# ---- per-request traces ---------------------------------------------------
+
+class Trace:
+    """Stage timings of one request, in the order the spans finished."""
+
+    def __init__(self, trace_id: str = None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.spans.append({"stage": stage, "ms": round(seconds * 1000.0, 3)})
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {"id": self.id, "total_ms": round((time.perf_counter() - self.started) * 1000.0, 3), "spans": spans}
+
+
+_current_trace = contextvars.ContextVar("idp_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def activate(t: Trace = None):
+    """Make `t` (or no trace) the current trace for the enclosed work, restoring the previous one after."""
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def trace(enabled: bool = True, trace_id: str = None):
+    """Collect the spans of the enclosed work (including thread-pool work run in a copied context)."""
+    with activate(Trace(trace_id) if enabled else None) as t:
+        yield t
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    t = _current_trace.get()
+    if t is not None:
+        t.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
@@ -1,3 +1,4 @@
+import bisect
 import re
 
 def clean_text(text: str) -> str:
@@ -7,3 +8,39 @@ def clean_text(text: str) -> str:
     text = text.replace("\n", " ")
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
+
+def clean_text_with_offsets(text: str):
+    """
+    clean_text(text) together with `anchors`, (clean_starts, raw_starts): from clean_starts[k]
+    up to the next anchor, clean positions map linearly onto text from raw_starts[k]. One anchor
+    pair per collapsed whitespace run, so the map stays small however long the text is.
+    """
+    if not text:
+        return "", ([0], [0])
+    pieces, clean_starts, raw_starts = [], [0], [0]
+    pos, size = 0, 0
+    for m in re.finditer(r'\s+', text):
+        size += m.start() - pos
+        pieces.append(text[pos:m.start()])
+        pieces.append(" ")
+        # the run becomes one space at its first character; the text after it resumes at m.end()
+        clean_starts += [size, size + 1]
+        raw_starts += [m.start(), m.end()]
+        size += 1
+        pos = m.end()
+    pieces.append(text[pos:])
+    clean = "".join(pieces)
+    # after collapsing, the leading / trailing run is at most one space
+    lead = 1 if clean.startswith(" ") else 0
+    trail = 1 if len(clean) > lead and clean.endswith(" ") else 0
+    return clean[lead:len(clean) - trail], ([c - lead for c in clean_starts], raw_starts)
+
+def to_raw_span(anchors, start: int, end: int) -> list:
+    """Map a [start, end) span of the clean text (see clean_text_with_offsets) to [start, end) in the raw text."""
+    clean_starts, raw_starts = anchors
+
+    def raw(pos: int) -> int:
+        k = bisect.bisect_right(clean_starts, pos) - 1
+        return raw_starts[k] + pos - clean_starts[k]
+
+    return [raw(start), raw(end - 1) + 1] if end > start else [raw(start), raw(start)]
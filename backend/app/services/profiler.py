@@ -0,0 +1,113 @@
+# app/services/profiler.py
+"""
+Sampling profiler that can be switched on and off at runtime (see /api/profiler).
+While running, a daemon thread snapshots every other thread's stack each `interval`
+seconds and counts collapsed stacks ("outer;inner;leaf N" lines, the input format of
+flamegraph.pl and speedscope). Stopped, it costs nothing.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 64
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = 0.005
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005, duration: float = None, reset: bool = True) -> bool:
+        """Start sampling every `interval` seconds, stopping by itself after `duration` seconds if given."""
+        with self._lock:
+            if self.running:
+                return False
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+            self.interval = max(interval, 0.001)
+            self.started, self.stopped = time.time(), None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.1f} ms interval)")
+        return True
+
+    def stop(self) -> bool:
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        self._stop.set()
+        thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+        return True
+
+    def _run(self, duration: float):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            batch = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                batch.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(batch)
+                self.samples += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self.stopped = time.time()
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {n}\n" for stack, n in self._stacks.most_common())
+
+    def top(self, n: int = 20) -> list:
+        """Functions by samples spent in them (self) and under them (total), hottest self time first."""
+        own, total = Counter(), Counter()
+        with self._lock:
+            stacks = list(self._stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for f in set(frames):
+                total[f] += count
+        return [{"function": f, "self": c, "total": total[f]} for f, c in own.most_common(n)]
+
+    def stats(self) -> dict:
+        end = self.stopped or time.time()
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "distinct_stacks": len(self._stacks),
+            "seconds": round(end - self.started, 3) if self.started else 0.0,
+        }
+
+
+profiler = SamplingProfiler()
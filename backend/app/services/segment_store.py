@@ -0,0 +1,388 @@
+# app/services/segment_store.py
+import json
+import os
+import numpy as np
+from threading import RLock
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers threads of one process
+    fcntl = None
+from app.services.chunk_store import (
+    ChunkSegment, ChunkStore, build_chunk_columns, build_chunk_postings, chunk_paths, rows_for_filenames,
+)
+from app.services.lexical_index import save_postings
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "writer.lock"
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, write_fn, mode: str = "wb"):
+    """Write via a temp file, fsync and rename so readers only ever see a complete file."""
+    tmp = path + ".tmp"
+    with open(tmp, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+class ProcessLock:
+    """
+    Re-entrant lock shared by the threads of this process and, through an fcntl lock on
+    `path`, with every other process using the same file (uvicorn workers, app.ingest).
+    The file lock is taken on the outermost acquire only: flock locks held through
+    different descriptors conflict even within one process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rlock = RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._fd is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class SegmentStore:
+    """
+    On-disk vector store made of immutable segments plus a manifest.
+
+    Each segment is a float32 `.npy` vector file plus columnar chunk metadata and
+    BM25 postings (see chunk_store / lexical_index). The
+    manifest lists live segments in row order and is the only file ever
+    rewritten, always atomically, so a crash mid-write leaves at worst an
+    orphaned segment that is not referenced and gets cleaned up on open.
+
+    Deleting chunks never touches segment files: the deleted local rows go into a
+    new `<segment>.del-<n>.npy` tombstone file named by the segment's manifest entry.
+    Compaction drops tombstoned rows when it rewrites a segment, and bumps the
+    manifest `layout` counter because global row positions change.
+
+    Every manifest update happens under `lock`, which is also held across processes,
+    so several processes can write one store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.lock = ProcessLock(os.path.join(root, LOCK_NAME))
+
+    # ---- manifest -------------------------------------------------------
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "dim": None, "next_segment": 1, "next_chunk_id": 0, "layout": 0, "segments": []}
+
+    def _write_manifest(self, manifest: dict):
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write(self.manifest_path, lambda f: json.dump(manifest, f, indent=1), mode="w")
+
+    def _upgrade_manifest(self, manifest: dict) -> bool:
+        """Give segments written before chunk ids existed a first_id, once. Returns True if changed."""
+        changed = "next_chunk_id" not in manifest
+        next_id = manifest.setdefault("next_chunk_id", 0)
+        manifest.setdefault("layout", 0)
+        for seg in manifest["segments"]:
+            if "first_id" not in seg:
+                seg["first_id"] = next_id
+                next_id += seg["count"]
+                changed = True
+        manifest["next_chunk_id"] = next_id
+        return changed
+
+    # ---- segments -------------------------------------------------------
+
+    def _paths(self, name: str):
+        base = os.path.join(self.root, name)
+        return (base + ".npy",) + chunk_paths(base)
+
+    def _write_segment(self, name: str, vectors: np.ndarray, metadata: list):
+        vec_path, cols_path, text_path, docs_path, lex_path = self._paths(name)
+        cols, blob, filenames = build_chunk_columns(metadata)
+        postings = build_chunk_postings(metadata)
+        atomic_write(vec_path, lambda f: np.save(f, vectors, allow_pickle=False))
+        atomic_write(text_path, lambda f: f.write(blob))
+        atomic_write(docs_path, lambda f: json.dump(filenames, f), mode="w")
+        atomic_write(lex_path, lambda f: save_postings(f, postings))
+        # columns last: a segment only counts as complete once they exist (and the manifest names it)
+        atomic_write(cols_path, lambda f: np.save(f, cols, allow_pickle=False))
+
+    def read_chunks(self, name: str, first_id: int = 0) -> ChunkSegment:
+        """Open one segment; its vectors are memory-mapped read-only."""
+        vectors = np.load(self._paths(name)[0], mmap_mode="r", allow_pickle=False)
+        return ChunkSegment(os.path.join(self.root, name), vectors=vectors, first_id=first_id)
+
+    def read_tombstones(self, entry: dict) -> np.ndarray:
+        """Sorted deleted local rows of a segment (empty if none)."""
+        if not entry.get("tombstones"):
+            return np.zeros(0, dtype="int64")
+        return np.load(os.path.join(self.root, entry["tombstones"]), allow_pickle=False)
+
+    def read_all(self, manifest: dict = None, reuse: ChunkStore = None):
+        """
+        Return (manifest, ChunkStore) over every live segment, in row order. With `manifest`
+        (e.g. the one an index generation was published with) that state is opened instead
+        of the current one, without the lock; raises FileNotFoundError if compaction or a
+        later delete has removed its files since. Segments already open in `reuse` are not
+        opened again (segment files never change).
+        """
+        if manifest is not None:
+            return manifest, self._open_chunks(manifest, reuse)
+        # hold the lock so compaction cannot unlink a segment between manifest read and file read
+        with self.lock:
+            manifest = self.read_manifest()
+            if self._upgrade_manifest(manifest) and manifest["segments"]:
+                self._write_manifest(manifest)
+            return manifest, self._open_chunks(manifest, reuse)
+
+    def _open_chunks(self, manifest: dict, reuse: ChunkStore = None) -> ChunkStore:
+        known = reuse.open_segments() if reuse is not None else {}
+        chunks = ChunkStore(layout=manifest.get("layout", 0))
+        for seg in manifest["segments"]:
+            chunk_seg = known.get(seg["name"]) or self.read_chunks(seg["name"], seg.get("first_id") or 0)
+            chunks = chunks.with_segment(chunk_seg, self.read_tombstones(seg))
+        return chunks
+
+    def append(self, vectors: np.ndarray, metadata: list) -> dict:
+        """Persist one new segment and publish it in the manifest (it becomes the last entry). Cost is O(new rows)."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self.lock:
+            manifest = self.read_manifest()
+            self._upgrade_manifest(manifest)
+            if manifest["dim"] is not None and manifest["dim"] != vectors.shape[1]:
+                raise ValueError(f"Vector dim {vectors.shape[1]} does not match store dim {manifest['dim']}")
+            name = f"seg-{manifest['next_segment']:08d}"
+            first_id = manifest["next_chunk_id"]
+            metadata = [{**rec, "chunk_id": first_id + i} for i, rec in enumerate(metadata)]
+            os.makedirs(self.root, exist_ok=True)
+            self._write_segment(name, vectors, metadata)
+            manifest["dim"] = int(vectors.shape[1])
+            manifest["next_segment"] += 1
+            manifest["next_chunk_id"] = first_id + len(metadata)
+            manifest["version"] += 1
+            manifest["segments"].append({"name": name, "count": int(vectors.shape[0]), "first_id": first_id})
+            self._write_manifest(manifest)
+        return manifest
+
+    # ---- deletes --------------------------------------------------------
+
+    def delete_filenames(self, filenames, exclude=()):
+        """
+        Tombstone every live chunk of `filenames` (skipping segments in `exclude`).
+        Returns (manifest, {segment name: newly deleted local rows}).
+        """
+        filenames = set(filenames)
+        deleted = {}
+        with self.lock:
+            manifest = self.read_manifest()
+            self._upgrade_manifest(manifest)
+            stale = []
+            for seg in manifest["segments"]:
+                if seg["name"] in exclude:
+                    continue
+                rows = rows_for_filenames(os.path.join(self.root, seg["name"]), filenames)
+                old = self.read_tombstones(seg)
+                rows = np.setdiff1d(rows, old)
+                if not len(rows):
+                    continue
+                tomb = f"{seg['name']}.del-{manifest['version'] + 1}.npy"
+                merged = np.union1d(old, rows).astype("int64")
+                atomic_write(os.path.join(self.root, tomb), lambda f: np.save(f, merged, allow_pickle=False))
+                if seg.get("tombstones"):
+                    stale.append(seg["tombstones"])
+                seg["tombstones"] = tomb
+                seg["deleted"] = int(len(merged))
+                deleted[seg["name"]] = rows
+            if deleted:
+                manifest["version"] += 1
+                self._write_manifest(manifest)
+                for tomb in stale:
+                    try:
+                        os.remove(os.path.join(self.root, tomb))
+                    except OSError:
+                        pass
+        return manifest, deleted
+
+    # ---- compaction -----------------------------------------------------
+
+    def _small_runs(self, manifest: dict, small_size: int):
+        """Consecutive runs (len >= 2) of small segments; merging a run keeps row order intact."""
+        runs, run = [], []
+        for seg in manifest["segments"]:
+            if seg["count"] - seg.get("deleted", 0) < small_size:
+                run.append(seg["name"])
+            else:
+                if len(run) > 1:
+                    runs.append(run)
+                run = []
+        if len(run) > 1:
+            runs.append(run)
+        return runs
+
+    def _rewrite_runs(self, manifest: dict, small_size: int, purge_ratio: float):
+        """Small-segment runs to merge, plus single segments with at least `purge_ratio` of their rows deleted."""
+        runs = self._small_runs(manifest, small_size)
+        in_runs = {name for run in runs for name in run}
+        for seg in manifest["segments"]:
+            if seg["name"] not in in_runs and seg.get("deleted", 0) >= max(purge_ratio * seg["count"], 1):
+                runs.append([seg["name"]])
+        return runs
+
+    def needs_compaction(self, max_segments: int, small_size: int, purge_ratio: float = 1.0) -> bool:
+        manifest = self.read_manifest()
+        if len(manifest["segments"]) > max_segments and self._small_runs(manifest, small_size):
+            return True
+        return any(seg.get("deleted", 0) >= max(purge_ratio * seg["count"], 1) for seg in manifest["segments"])
+
+    def _remove_segment_files(self, name: str):
+        for fname in os.listdir(self.root):
+            if fname.startswith(name + "."):
+                try:
+                    os.remove(os.path.join(self.root, fname))
+                except OSError:
+                    pass
+
+    def compact(self, small_size: int, purge_ratio: float = 1.0):
+        """
+        Rewrite each run of consecutive small segments as one segment, and each segment
+        with at least `purge_ratio` of its rows tombstoned on its own, dropping deleted rows.
+        Segments are immutable and appends only touch the manifest tail, so rewriting
+        happens outside the lock; only the manifest swap is locked, and it is skipped if
+        the run or its tombstones changed meanwhile. Returns (segments removed, rows dropped).
+        """
+        removed = dropped = 0
+        with self.lock:
+            # merged records carry chunk ids, so older segments need their first_id first
+            manifest = self.read_manifest()
+            if self._upgrade_manifest(manifest) and manifest["segments"]:
+                self._write_manifest(manifest)
+        for run in self._rewrite_runs(manifest, small_size, purge_ratio):
+            entries = {s["name"]: s for s in self.read_manifest()["segments"]}
+            if any(name not in entries for name in run):
+                continue
+            before = [(name, entries[name].get("tombstones")) for name in run]
+            parts, metadata = [], []
+            for name in run:
+                chunk_seg = self.read_chunks(name, entries[name].get("first_id") or 0)
+                keep = np.setdiff1d(np.arange(len(chunk_seg)), self.read_tombstones(entries[name]))
+                parts.append(np.asarray(chunk_seg.vectors)[keep])
+                metadata.extend(chunk_seg.records(keep))
+            merged = np.concatenate(parts, axis=0)
+            n_dropped = sum(entries[name]["count"] for name in run) - len(merged)
+
+            new_name = None
+            if len(merged):
+                with self.lock:
+                    # reserve a segment name so the merged files can be written without holding the lock;
+                    # the reservation (with our pid) keeps other processes' remove_orphans off them
+                    manifest = self.read_manifest()
+                    new_name = f"seg-{manifest['next_segment']:08d}"
+                    manifest["next_segment"] += 1
+                    manifest.setdefault("reserved", {})[new_name] = os.getpid()
+                    self._write_manifest(manifest)
+                try:
+                    self._write_segment(new_name, merged, metadata)
+                except Exception:
+                    with self.lock:
+                        manifest = self.read_manifest()
+                        manifest.get("reserved", {}).pop(new_name, None)
+                        self._write_manifest(manifest)
+                    raise
+
+            with self.lock:
+                manifest = self.read_manifest()
+                names = [s["name"] for s in manifest["segments"]]
+                start = names.index(run[0]) if run[0] in names else -1
+                current = [(s["name"], s.get("tombstones")) for s in manifest["segments"][start:start + len(run)]]
+                if new_name:
+                    manifest.get("reserved", {}).pop(new_name, None)
+                if start < 0 or current != before:
+                    # manifest changed underneath us; drop the merged copy and retry next round
+                    if new_name:
+                        self._write_manifest(manifest)
+                        self._remove_segment_files(new_name)
+                    continue
+                replacement = [{"name": new_name, "count": int(merged.shape[0]), "first_id": None}] if new_name else []
+                manifest["segments"][start:start + len(run)] = replacement
+                manifest["version"] += 1
+                if n_dropped:
+                    manifest["layout"] = manifest.get("layout", 0) + 1
+                self._write_manifest(manifest)
+
+            for name in run:
+                self._remove_segment_files(name)
+            removed += len(run) - len(replacement)
+            dropped += n_dropped
+        return removed, dropped
+
+    def remove_orphans(self):
+        """Delete segment/temp files the manifest does not reference (left behind by a crash)."""
+        if not os.path.isdir(self.root):
+            return
+        with self.lock:
+            manifest = self.read_manifest()
+            reserved = manifest.get("reserved", {})
+            live = {s["name"] for s in manifest["segments"]} | {n for n, pid in reserved.items() if _alive(pid)}
+            for fname in os.listdir(self.root):
+                if fname == MANIFEST_NAME:
+                    continue
+                base = fname.split(".", 1)[0]
+                if fname.endswith(".tmp") or (fname.startswith("seg-") and base not in live):
+                    try:
+                        os.remove(os.path.join(self.root, fname))
+                    except OSError:
+                        pass
@@ -0,0 +1,158 @@
+# app/services/shards.py
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from app.config import settings
+from app.services.embeddings import get_embedding
+from app.services.segment_store import MANIFEST_NAME, SegmentStore
+from app.services.vectorstore import IndexManager, index_manager, search_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+ALL_COLLECTIONS = "*"
+
+
+class CollectionManager:
+    """
+    Named collections (per team / tenant), each an independent shard: its own segment
+    store under COLLECTIONS_DIR/<name> and its own IndexManager. The default collection
+    is the original store at SEGMENTS_DIR. Shards load on first use and are unloaded
+    again after COLLECTION_IDLE_SECONDS without a query or write. Queries over several
+    collections search every shard in parallel and merge the hits by final score.
+    """
+
+    def __init__(self, root: str, idle_seconds: float, workers: int):
+        self.root = root
+        self.idle_seconds = idle_seconds
+        self._managers = {DEFAULT_COLLECTION: index_manager}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="shard-search")
+        self._stop = threading.Event()
+        self._evictor = None
+
+    @staticmethod
+    def validate(name: str) -> str:
+        if not name or not COLLECTION_NAME_RE.match(name):
+            raise ValueError(f"Invalid collection name {name!r}: use 1-64 letters, digits, '_' or '-'")
+        return name
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def exists(self, name: str) -> bool:
+        return name in self._managers or os.path.exists(os.path.join(self._path(name), MANIFEST_NAME))
+
+    def names(self) -> List[str]:
+        found = set(self._managers)
+        if os.path.isdir(self.root):
+            found.update(n for n in os.listdir(self.root)
+                         if COLLECTION_NAME_RE.match(n) and os.path.exists(os.path.join(self._path(n), MANIFEST_NAME)))
+        return sorted(found, key=lambda n: (n != DEFAULT_COLLECTION, n))
+
+    def get(self, name: str = None, create: bool = False) -> IndexManager:
+        """The collection's IndexManager; unknown names raise KeyError unless `create` is set."""
+        name = self.validate(name or DEFAULT_COLLECTION)
+        with self._lock:
+            manager = self._managers.get(name)
+            if manager is None:
+                if not create and not self.exists(name):
+                    raise KeyError(name)
+                manager = self._managers[name] = IndexManager(SegmentStore(self._path(name)), name)
+        return manager
+
+    def resolve(self, names: List[str]) -> List[str]:
+        """Expand "*" to every collection and validate / de-duplicate the rest (unknown names raise KeyError)."""
+        out = []
+        for name in names or [DEFAULT_COLLECTION]:
+            for n in (self.names() if name == ALL_COLLECTIONS else [name]):
+                if n not in out:
+                    self.get(n)
+                    out.append(n)
+        return out
+
+    def generation(self) -> int:
+        """Grows whenever any collection is written, compacted or (re)loaded; keys the answer cache."""
+        with self._lock:
+            return sum(m.version for m in self._managers.values())
+
+    def is_empty(self, names: List[str]) -> bool:
+        for n in names:
+            index, _ = self.get(n).snapshot()
+            if index is not None and index.ntotal > 0:
+                return False
+        return True
+
+    def _search_one(self, name: str, query: str, top_k: int, query_vec, kwargs: dict) -> list:
+        with self.get(name).searching() as (index, metadata):
+            hits = search_index(query, index, metadata, top_k=top_k, query_vec=query_vec, **kwargs)
+        for h in hits:
+            h["collection"] = name
+        return hits
+
+    def search(self, query: str, names: List[str], top_k: int = 5, **kwargs) -> list:
+        """search_index over each collection, fanned out on the shard pool, merged into one top-k by final_score."""
+        if len(names) == 1:
+            return self._search_one(names[0], query, top_k, None, kwargs)
+        # embed once for every shard
+        query_vec = get_embedding(query)
+        if query_vec is None:
+            logger.warning("Query embedding failed.")
+            return []
+        # each shard search runs in a copy of the caller's context so its spans reach the request trace
+        futures = [self._pool.submit(contextvars.copy_context().run, self._search_one, n, query, top_k, query_vec, kwargs)
+                   for n in names]
+        hits = [h for f in futures for h in f.result()]
+        hits.sort(key=lambda h: h["final_score"], reverse=True)
+        logger.debug(f"Fan-out search over {len(names)} collections merged {len(hits)} hits")
+        return hits[:top_k]
+
+    def evict_idle(self) -> int:
+        now = time.time()
+        with self._lock:
+            managers = list(self._managers.values())
+        return sum(1 for m in managers if m.loaded and now - m.last_used > self.idle_seconds and m.unload())
+
+    def _evict_loop(self):
+        interval = max(1.0, min(60.0, self.idle_seconds / 4))
+        while not self._stop.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"Collection eviction failed: {e!r}")
+
+    def start(self):
+        if self.idle_seconds <= 0 or (self._evictor is not None and self._evictor.is_alive()):
+            return
+        self._stop.clear()
+        self._evictor = threading.Thread(target=self._evict_loop, name="collection-evictor", daemon=True)
+        self._evictor.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> list:
+        """Per-collection residency and on-disk size, read from the manifests without loading anything."""
+        out = []
+        for name in self.names():
+            manager = self._managers.get(name)
+            store = manager.store if manager else SegmentStore(self._path(name))
+            segments = store.read_manifest()["segments"]
+            out.append({
+                "collection": name,
+                "loaded": bool(manager and manager.loaded),
+                "idle_seconds": round(time.time() - manager.last_used, 1) if manager else None,
+                "segments": len(segments),
+                "vectors": sum(seg["count"] - seg.get("deleted", 0) for seg in segments),
+            })
+        return out
+
+
+collection_manager = CollectionManager(settings.COLLECTIONS_DIR, settings.COLLECTION_IDLE_SECONDS,
+                                       settings.SHARD_SEARCH_WORKERS)
@@ -1,145 +1,807 @@
 # app/services/vectorstore.py
 import faiss
+import json
+import logging
 import os
 import pickle
+import time
 import numpy as np
-import re
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from threading import Lock
+from threading import Condition, Lock, RLock, Thread
 from app.services.embeddings import get_embedding
+from app.services.ann_index import (
+    build_index, bytes_per_vector, configure_search, effective_compression, effective_type, index_compression, index_kind,
+)
+from app.services.chunk_store import ChunkStore, document_id
+from app.services.chunking import Chunk
+from app.services.metrics import span
+from app.services.segment_store import SegmentStore, atomic_write
 from app.config import settings
 
-# use settings paths
+logger = logging.getLogger(__name__)
+
+# use settings paths; INDEX_FILE/META_FILE are the legacy single-file layout, migrated on first load
 INDEX_FILE = settings.VECTOR_PATH
 META_FILE = settings.METADATA_PATH
 
-# simple in-memory lock (works for single-process; for multi-process use file locking)
+# in-process only; across processes SegmentStore.lock serializes the manifest (and, with
+# INDEX_SHARED, whole writes)
 faiss_lock = Lock()
 
+segment_store = SegmentStore(settings.SEGMENTS_DIR)
+
+def _ann_cache_paths(store: SegmentStore):
+    # built HNSW/IVF index cached next to the segments so restarts don't rebuild the graph / retrain
+    cache_file = os.path.join(store.root, "ann.faiss")
+    return cache_file, cache_file + ".json"
+
 def normalize_vec(vec: np.ndarray) -> np.ndarray:
     norm = np.linalg.norm(vec)
     if norm == 0:
         return vec
     return vec / norm
 
-def _ensure_dirs():
-    p = os.path.dirname(INDEX_FILE)
-    if p and not os.path.exists(p):
-        os.makedirs(p, exist_ok=True)
+def _probe_dim() -> int:
+    test_vec = get_embedding("hello world")
+    if test_vec is None:
+        return 768
+    return int(test_vec.shape[0])
 
-def load_or_create_index(dim: int = None):
-    _ensure_dirs()
-    if dim is None:
-        test_vec = get_embedding("hello world")
-        if test_vec is None:
-            dim = 768
-        else:
-            dim = int(test_vec.shape[0])
-
-    if os.path.exists(INDEX_FILE) and os.path.exists(META_FILE):
-        index = faiss.read_index(INDEX_FILE)
-        with open(META_FILE, "rb") as f:
-            metadata = pickle.load(f)
-        print(f"[DEBUG] Loaded FAISS index with {index.ntotal} vectors and {len(metadata)} metadata entries")
-    else:
-        index = faiss.IndexFlatIP(dim)  # inner product for cosine if normalized
-        metadata = []
-        print("[DEBUG] Created new FAISS index (IP) with dim", dim)
+def _migrate_legacy_files():
+    """Import faiss_index.bin + metadata.pkl as the first segment if no manifest exists yet."""
+    if segment_store.exists() or not (os.path.exists(INDEX_FILE) and os.path.exists(META_FILE)):
+        return
+    index = faiss.read_index(INDEX_FILE)
+    with open(META_FILE, "rb") as f:
+        metadata = pickle.load(f)
+    if index.ntotal:
+        segment_store.append(index.reconstruct_n(0, index.ntotal), list(metadata[:index.ntotal]))
+    logger.debug(f"Migrated legacy FAISS index with {index.ntotal} vectors into {settings.SEGMENTS_DIR}")
+
+def _ann_params() -> dict:
+    return {
+        "type": settings.INDEX_TYPE.lower(),
+        "hnsw_m": settings.HNSW_M,
+        "hnsw_ef_construction": settings.HNSW_EF_CONSTRUCTION,
+        "ivf_nlist": settings.IVF_NLIST,
+        "compression": settings.VECTOR_COMPRESSION.lower(),
+        "pq_m": settings.PQ_M,
+        "pq_nbits": settings.PQ_NBITS,
+    }
+
+def _save_ann_cache(index, layout: int, store: SegmentStore = segment_store):
+    if index_kind(index) == "flat" and index_compression(index) == "none":
+        return  # rebuilding a flat index is a plain copy; not worth caching
+    cache_file, cache_info = _ann_cache_paths(store)
+    tmp = cache_file + ".tmp"
+    # under the store lock: another process's remove_orphans would take the .tmp away
+    with store.lock:
+        faiss.write_index(index, tmp)
+        os.replace(tmp, cache_file)
+        # layout: row positions are only comparable until compaction drops deleted rows
+        info = {"params": _ann_params(), "rows": int(index.ntotal), "dim": int(index.d), "layout": layout}
+        atomic_write(cache_info, lambda f: json.dump(info, f), mode="w")
+
+# ---- index generations (INDEX_SHARED) ----------------------------------------
+# generation.json names the current index-<n>.faiss and the manifest it was built from;
+# both are only replaced, atomically, by the process holding the store lock.
 
+def _generation_path(store: SegmentStore) -> str:
+    return os.path.join(store.root, "generation.json")
+
+def _generation_key(store: SegmentStore):
+    """Cheap change check: the pointer file is replaced by rename, so its inode changes with every generation."""
+    try:
+        st = os.stat(_generation_path(store))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+def _read_generation(store: SegmentStore):
+    try:
+        with open(_generation_path(store), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _publish_generation(index, manifest: dict, store: SegmentStore, index_file: str = None) -> dict:
+    """
+    Write `index` as the next generation file (or reuse `index_file`, still valid for
+    `manifest`) and point generation.json at it. Call with store.lock held.
+    """
+    current = _read_generation(store)
+    number = (current["generation"] if current else 0) + 1
+    name = index_file or (f"index-{number:08d}.faiss" if index is not None else None)
+    if index is not None and index_file is None:
+        path = os.path.join(store.root, name)
+        faiss.write_index(index, path + ".tmp")
+        os.replace(path + ".tmp", path)
+    gen = {"generation": number, "index": name, "manifest": manifest}
+    atomic_write(_generation_path(store), lambda f: json.dump(gen, f), mode="w")
+    # older generations go; processes that still have one mapped keep reading it until they move on
+    old = sorted(f for f in os.listdir(store.root) if f.startswith("index-") and f.endswith(".faiss") and f != name)
+    for fname in old[:max(len(old) - max(settings.INDEX_GENERATIONS_KEPT - 1, 0), 0)]:
+        try:
+            os.remove(os.path.join(store.root, fname))
+        except OSError:
+            pass
+    return gen
+
+def _same_rows(old: dict, new: dict) -> bool:
+    """True if two manifests put every row at the same position (no rows added or dropped in between)."""
+    return (old.get("layout", 0) == new.get("layout", 0)
+            and sum(s["count"] for s in old["segments"]) == sum(s["count"] for s in new["segments"]))
+
+def _map_generation(gen: dict, store: SegmentStore, reuse: ChunkStore = None):
+    """
+    (index, ChunkStore) of a generation, both memory-mapped read-only and shared with every
+    other process; segments already open in `reuse` are reused.
+    """
+    index = None
+    if gen["index"] is not None:
+        index = faiss.read_index(os.path.join(store.root, gen["index"]), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        index = configure_search(index)
+    _, metadata = store.read_all(gen["manifest"], reuse)
     return index, metadata
 
-def save_index(index, metadata):
-    _ensure_dirs()
-    with faiss_lock:
-        faiss.write_index(index, INDEX_FILE)
-        with open(META_FILE, "wb") as f:
-            pickle.dump(metadata, f)
-    print(f"[DEBUG] FAISS index saved. Total vectors: {index.ntotal}")
+def _owned_copy(index):
+    """Writable copy of an index; clone_index keeps mmapped codes as a view that cannot grow, a serialized round trip does not."""
+    return configure_search(faiss.deserialize_index(faiss.serialize_index(index)))
+
+def _matches_settings(index, ntotal: int) -> bool:
+    return (index_kind(index) == effective_type(settings.INDEX_TYPE, ntotal)
+            and index_compression(index) == effective_compression(settings.VECTOR_COMPRESSION, ntotal))
 
-def add_to_index(chunks, index, metadata, embeddings=None, filename=None):
+def _load_ann_cache(metadata: ChunkStore, dim: int, store: SegmentStore = segment_store):
+    """Reuse the cached ANN index if it matches the settings, topping it up with newer rows."""
+    cache_file, cache_info = _ann_cache_paths(store)
+    try:
+        with open(cache_info, "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    n = len(metadata)
+    if (info.get("params") != _ann_params() or info.get("dim") != dim or info.get("rows", 0) > n
+            or info.get("layout", 0) != metadata.layout):
+        return None
+    try:
+        index = faiss.read_index(cache_file)
+    except RuntimeError:
+        return None
+    if index.ntotal != info["rows"] or not _matches_settings(index, n):
+        return None
+    if n > index.ntotal:
+        index.add(metadata.vector_rows(index.ntotal, n))
+    return configure_search(index)
+
+def _read_from_disk(store: SegmentStore = segment_store):
+    """Return (index, ChunkStore) built from a segment store; index is None if it is empty."""
+    if store is segment_store:
+        _migrate_legacy_files()
+    store.remove_orphans()
+    manifest, metadata = store.read_all()
+    if manifest["dim"] is None:
+        return None, metadata
+    index = _load_ann_cache(metadata, manifest["dim"], store)
+    if index is None:
+        # also migrates a store built under a different INDEX_TYPE / VECTOR_COMPRESSION
+        index = build_index(metadata.vector_parts(), manifest["dim"])
+        _save_ann_cache(index, metadata.layout, store)
+    return index, metadata
+
+def load_or_create_index(dim: int = None):
+    index, metadata = _read_from_disk()
+    if index is not None:
+        logger.debug(f"Loaded FAISS index with {index.ntotal} vectors and {len(metadata)} metadata entries")
+        return index, metadata
+
+    if dim is None:
+        dim = _probe_dim()
+    index = build_index(np.zeros((0, dim), dtype="float32"), dim)
+    logger.debug(f"Created new FAISS index ({index_kind(index)}) with dim {dim}")
+    return index, metadata
+
+def _prepare_vectors(chunks, embeddings=None, filename=None, pages=None):
     now = datetime.now().timestamp()
     to_add = []
     added_meta = []
 
     for i, chunk in enumerate(chunks):
+        name = filename[i] if isinstance(filename, list) else filename
+        # plain strings, or Chunk records that also carry their page and character span
+        record = chunk if isinstance(chunk, Chunk) else None
+        if record is not None:
+            chunk = record.text
         vec = None
         if embeddings and i < len(embeddings):
             vec = embeddings[i]
         if vec is None:
             vec = get_embedding(chunk)
         if vec is None:
-            print(f"[WARN] Skipping chunk {i+1}/{len(chunks)} from {filename} because embedding failed.")
+            logger.warning(f"Skipping chunk {i+1}/{len(chunks)} from {name} because embedding failed.")
             continue
 
         arr = np.array(vec, dtype="float32")
         arr = normalize_vec(arr)
         to_add.append(arr)
-        added_meta.append({"filename": filename, "text": chunk, "timestamp": now})
+        page = pages[i] if pages and i < len(pages) else 0
+        meta = {"filename": name, "text": chunk, "timestamp": now, "page": page}
+        if record is not None:
+            meta.update(page=record.page or page, char_start=record.char_start, char_end=record.char_end)
+        added_meta.append(meta)
 
     if not to_add:
-        print("[WARN] No vectors to add to index for", filename)
-        return
+        return None, []
+    return np.stack(to_add, axis=0), added_meta
 
-    arr_stack = np.stack(to_add, axis=0)
+def _append_segment(arr_stack, added_meta, metadata: ChunkStore, store: SegmentStore = segment_store) -> ChunkStore:
     with faiss_lock:
-        index.add(arr_stack)
-        metadata.extend(added_meta)
-        faiss.write_index(index, INDEX_FILE)
-        with open(META_FILE, "wb") as f:
-            pickle.dump(metadata, f)
+        manifest = store.append(arr_stack, added_meta)
+    seg = manifest["segments"][-1]
+    return metadata.with_segment(store.read_chunks(seg["name"], seg["first_id"]))
+
+def add_to_index(chunks, index, metadata, embeddings=None, filename=None, pages=None) -> ChunkStore:
+    """
+    Add chunks to a caller-owned index, persist them as one new segment and
+    return the updated ChunkStore (ChunkStores are immutable snapshots).
+    """
+    arr_stack, added_meta = _prepare_vectors(chunks, embeddings, filename, pages)
+    if arr_stack is None:
+        logger.warning(f"No vectors to add to index for {filename}")
+        return metadata
+
+    metadata = _append_segment(arr_stack, added_meta, metadata)
+    index.add(arr_stack)
+    logger.debug(f"Added {len(added_meta)} vectors for {filename}. New total: {index.ntotal}")
+    return metadata
+
+class SearchGate:
+    """Many searches at once, or one writer growing the resident index in place; never both."""
+
+    def __init__(self):
+        self._cond = Condition()
+        self._readers = 0
+        self._writer = False
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            # claim first so new searches queue behind us, then wait out the running ones
+            self._writer = True
+            while self._readers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IndexManager:
+    """
+    Keeps a single FAISS index + metadata resident for the whole process.
+    Readers grab an immutable (index, metadata) snapshot; writers append a
+    segment to disk, build the new snapshot off to the side and swap the
+    reference in one step, so searches never wait on disk I/O.
+    Deletes only tombstone rows (masked out of search); compaction later drops
+    them from disk, after which the snapshot is reloaded with fresh row positions.
+    One manager serves one collection; `store` defaults to the default collection's.
+
+    With INDEX_SHARED (several processes on one store) every write holds the store's
+    cross-process lock, first catches up with what other processes wrote, and ends by
+    publishing an index generation file. Snapshots are memory-mapped read-only from the
+    current generation, so all processes share one copy of the index pages, and a
+    process notices a newer generation (one stat every INDEX_REFRESH_SECONDS) and swaps
+    to it without a restart.
+    """
+
+    def __init__(self, store: SegmentStore = None, name: str = "default", shared: bool = None):
+        self.store = store or segment_store
+        self.name = name
+        self.shared = settings.INDEX_SHARED if shared is None else shared
+        self._snapshot = (None, ChunkStore())
+        self._loaded = False
+        self.last_used = time.time()
+        # re-entrant: add() may trigger the first load() while already holding it
+        self._write_lock = RLock()
+        self._gate = SearchGate()
+        self._compaction_thread = None
+        self._rebuild_thread = None
+        self.version = 0
+        self.load_seconds = 0.0
+        # shared mode: generation mapped, manifest version the snapshot matches, last pointer check
+        self.generation = None
+        self._manifest_version = None
+        self._generation_key = None
+        self._checked = 0.0
+
+    def load(self):
+        start = time.perf_counter()
+        with self._write_lock:
+            if self.shared:
+                self._load_generation()
+            else:
+                self._snapshot = _read_from_disk(self.store)
+            index, _ = self._snapshot
+            self._loaded = True
+            self.version += 1
+        self.load_seconds = time.perf_counter() - start
+        ntotal = index.ntotal if index is not None else 0
+        logger.debug(f"IndexManager[{self.name}] loaded {ntotal} vectors in {self.load_seconds * 1000:.1f} ms")
+        return self._snapshot
 
-    print(f"[DEBUG] Added {len(to_add)} vectors for {filename}. New total: {index.ntotal}")
+    # ---- shared mode -----------------------------------------------------------
+
+    def _map(self, gen: dict, key=None):
+        self._snapshot = _map_generation(gen, self.store, self._snapshot[1])
+        self.generation = gen["generation"]
+        self._manifest_version = gen["manifest"]["version"]
+        self._generation_key = key or _generation_key(self.store)
+
+    def _load_generation(self):
+        """Map the current generation; fall back to catching up under the lock if it is missing, stale or gone."""
+        for attempt in range(3):
+            key = _generation_key(self.store)
+            gen = _read_generation(self.store)
+            if gen is None or gen["manifest"]["version"] != self.store.read_manifest()["version"]:
+                break  # none yet, or a writer has not published its change (yet, or ever)
+            try:
+                self._map(gen, key)
+                return
+            except FileNotFoundError:
+                # segment or tombstone files of that generation were replaced meanwhile; a newer one follows
+                time.sleep(0.05 * (attempt + 1))
+        with self.store.lock:
+            if self._sync():
+                self._publish()
+
+    def _sync(self) -> bool:
+        """
+        With the store lock held: bring the snapshot up to the store as it is on disk, from
+        the current generation when it matches, otherwise from the segments. True if the
+        snapshot was rebuilt from the segments and still needs publishing.
+        """
+        disk = self.store.read_manifest()
+        if self._loaded and self._manifest_version == disk["version"]:
+            return False
+        gen = _read_generation(self.store)
+        if gen is not None and gen["manifest"]["version"] != disk["version"] and _same_rows(gen["manifest"], disk):
+            # only tombstones or segment merges since (e.g. compaction in another process): every row is
+            # where the generation's index has it, so that file is published again with the new manifest
+            gen = _publish_generation(None, disk, self.store, index_file=gen["index"])
+        if gen is not None and gen["manifest"]["version"] == disk["version"]:
+            self._map(gen)
+            self.version += 1
+            return False
+        self._snapshot = _read_from_disk(self.store)
+        self._manifest_version = None
+        self.version += 1
+        return True
+
+    def _publish(self):
+        """With the store lock held: publish the snapshot as the next generation and serve it mapped."""
+        index, _ = self._snapshot
+        gen = _publish_generation(index, self.store.read_manifest(), self.store)
+        self._map(gen)
+        logger.debug(f"IndexManager[{self.name}] published generation {gen['generation']}")
+
+    def _writing(self):
+        """Held around every write, inside _write_lock: the store's cross-process lock in shared mode."""
+        return self.store.lock if self.shared else nullcontext()
+
+    def _current(self):
+        """The snapshot a write builds on; in shared mode first caught up with other processes' writes."""
+        self.snapshot()
+        if self.shared:
+            self._sync()
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        """Shared mode: swap to a generation another process published since. True if the snapshot changed."""
+        key = _generation_key(self.store)
+        if key is None or key == self._generation_key:
+            return False
+        with self._write_lock:
+            gen = _read_generation(self.store)
+            if gen is None or gen["generation"] == self.generation:
+                self._generation_key = key
+                return False
+            try:
+                self._map(gen, key)
+            except FileNotFoundError:
+                return False  # superseded while opening it; the next check picks up the newer one
+            self.version += 1
+        logger.debug(f"IndexManager[{self.name}] switched to generation {self.generation}")
+        return True
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def snapshot(self):
+        """Return the current (index, metadata) pair. index is None until the first document is added."""
+        self.last_used = time.time()
+        if not self._loaded:
+            with self._write_lock:
+                if not self._loaded:
+                    self.load()
+        elif self.shared and time.monotonic() - self._checked >= settings.INDEX_REFRESH_SECONDS:
+            self._checked = time.monotonic()
+            self.refresh()
+        return self._snapshot
+
+    @contextmanager
+    def searching(self):
+        """
+        snapshot() for a search: add() grows the resident index in place, and waits for
+        searches inside this block to finish first (faiss does not allow add during search).
+        """
+        snapshot = self.snapshot()
+        with self._gate.reading():
+            yield snapshot
+
+    def busy(self) -> bool:
+        return any(t is not None and t.is_alive() for t in (self._compaction_thread, self._rebuild_thread))
+
+    def unload(self) -> bool:
+        """
+        Drop the resident index and metadata; the next snapshot() loads them again.
+        Searches already holding a snapshot finish on it. Skipped while compaction
+        or a rebuild is running.
+        """
+        with self._write_lock:
+            if not self._loaded or self.busy():
+                return False
+            self._snapshot = (None, ChunkStore())
+            self._loaded = False
+        logger.debug(f"IndexManager[{self.name}] unloaded after {time.time() - self.last_used:.0f}s idle")
+        return True
+
+    def _with_deletions(self, index, metadata: ChunkStore, manifest: dict, deleted: dict):
+        """Apply freshly written tombstones to a snapshot, or reload it if compaction has moved rows on disk."""
+        if not deleted:
+            return index, metadata
+        if metadata.segment_names() == [s["name"] for s in manifest["segments"]]:
+            return index, metadata.with_tombstones(deleted)
+        return _read_from_disk(self.store)
+
+    def add(self, chunks, embeddings=None, filename=None, pages=None, replace: bool = True) -> int:
+        """
+        Index `chunks` as one segment; `pages` optionally gives each chunk's 1-based source page.
+        `filename` is one name for all chunks or a list with one per chunk (see add_documents).
+        With `replace`, chunks previously indexed for the same filename are deleted in the same
+        snapshot swap, so a re-upload never shows up twice.
+        """
+        arr_stack, added_meta = _prepare_vectors(chunks, embeddings, filename, pages)
+        if arr_stack is None:
+            logger.warning(f"No vectors to add to index for {filename}")
+            return 0
+
+        with self._write_lock, self._writing():
+            index, metadata = self._current()
+            new_metadata = _append_segment(arr_stack, added_meta, metadata, self.store)
+            if index is None:
+                new_index = build_index(np.zeros((0, arr_stack.shape[1]), dtype="float32"), arr_stack.shape[1])
+            elif self.shared:
+                new_index = _owned_copy(index)
+            else:
+                # grow the resident index in place; snapshots taken earlier only see rows their metadata has
+                new_index = index
+            with self._gate.writing() if new_index is index else nullcontext():
+                new_index.add(arr_stack)
+            if replace and filename:
+                new_segment = new_metadata.segment_names()[-1]
+                names = sorted(set(filename)) if isinstance(filename, list) else [filename]
+                manifest, deleted = self.store.delete_filenames(names, exclude=(new_segment,))
+                if deleted:
+                    logger.debug(f"Replaced {sum(len(r) for r in deleted.values())} older chunks of {filename}")
+                new_index, new_metadata = self._with_deletions(new_index, new_metadata, manifest, deleted)
+            self._snapshot = (new_index, new_metadata)
+            self.version += 1
+            if self.shared:
+                self._publish()
+
+        source = f"{len(set(filename))} documents" if isinstance(filename, list) else filename
+        logger.debug(f"Added {len(added_meta)} vectors for {source}. New total: {new_index.ntotal}")
+        self.maybe_compact()
+        self.maybe_rebuild()
+        return len(added_meta)
+
+    def add_documents(self, docs, replace: bool = True) -> int:
+        """
+        Index several documents, given as (filename, chunks, embeddings) triples, as a single
+        segment written and swapped in once: the bulk path, one persist per batch of documents.
+        """
+        chunks, embeddings, filenames = [], [], []
+        for filename, doc_chunks, doc_embeddings in docs:
+            chunks.extend(doc_chunks)
+            embeddings.extend(doc_embeddings)
+            filenames.extend([filename] * len(doc_chunks))
+        if not chunks:
+            return 0
+        return self.add(chunks, embeddings=embeddings, filename=filenames, replace=replace)
+
+    def delete_document(self, filename: str) -> int:
+        """Tombstone every chunk of `filename`; returns how many were deleted."""
+        with self._write_lock, self._writing():
+            index, metadata = self._current()
+            manifest, deleted = self.store.delete_filenames([filename])
+            if not deleted:
+                return 0
+            self._snapshot = self._with_deletions(index, metadata, manifest, deleted)
+            self.version += 1
+            if self.shared:
+                self._publish()
+        count = sum(len(r) for r in deleted.values())
+        logger.debug(f"Deleted {count} chunks of {filename}")
+        self.maybe_compact()
+        return count
+
+    def find_document(self, doc_id: str):
+        """Filename of the live document with id `doc_id`, or None."""
+        _, metadata = self.snapshot()
+        for name in metadata.live_documents():
+            if document_id(name) == doc_id:
+                return name
+        return None
+
+    def maybe_rebuild(self):
+        """
+        Rebuild in the background when the resident index is not the configured
+        type / compression, e.g. IVF or PQ has just crossed its training threshold.
+        """
+        index, _ = self._snapshot
+        if index is None or _matches_settings(index, index.ntotal):
+            return
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_thread = Thread(target=self._rebuild, name="index-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def _rebuild(self):
+        try:
+            start = time.perf_counter()
+            index, metadata = self.snapshot()
+            # always rebuild from the exact vectors on disk, never from (possibly lossy) index codes
+            built = build_index(metadata.vector_parts(), index.d)
+            with self._write_lock, self._writing():
+                current, latest = self._current() if self.shared else self._snapshot
+                if current is None or latest.layout != metadata.layout:
+                    return  # compaction moved rows meanwhile and reloaded; this build is stale
+                # rows appended while we were building
+                if current.ntotal > built.ntotal:
+                    built.add(latest.vector_rows(built.ntotal, current.ntotal))
+                self._snapshot = (built, latest)
+                self.version += 1
+                if self.shared:
+                    self._publish()
+            with self._gate.reading():
+                _save_ann_cache(built, latest.layout, self.store)
+            logger.debug(f"Rebuilt index as {index_kind(built)}/{index_compression(built)} over {built.ntotal} vectors in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"Index rebuild failed: {e!r}")
+
+    def maybe_compact(self):
+        """Merge small segments / purge mostly-deleted ones on a background thread."""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        if not self.store.needs_compaction(settings.SEGMENT_MAX_COUNT, settings.SEGMENT_SMALL_ROWS,
+                                           settings.SEGMENT_PURGE_RATIO):
+            return
+        self._compaction_thread = Thread(target=self._compact, name="segment-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _compact(self):
+        try:
+            # deletes that land while a round runs are picked up by the next round
+            for _ in range(3):
+                removed, dropped = self.store.compact(settings.SEGMENT_SMALL_ROWS, settings.SEGMENT_PURGE_RATIO)
+                logger.debug(f"Segment compaction merged away {removed} segments and dropped {dropped} deleted rows")
+                if self.shared:
+                    # catch up (reloading if rows moved) and publish it for the other processes
+                    with self._write_lock, self.store.lock:
+                        if self._sync():
+                            self._publish()
+                elif dropped:
+                    # row positions changed: reload metadata and rebuild the index over the surviving rows
+                    with self._write_lock:
+                        self._snapshot = _read_from_disk(self.store)
+                        self.version += 1
+                else:
+                    # refresh the cached ANN index too so the next restart has fewer rows to top up
+                    index, metadata = self._snapshot
+                    if index is not None:
+                        with self._gate.reading():
+                            _save_ann_cache(index, metadata.layout, self.store)
+                if not self.store.needs_compaction(settings.SEGMENT_MAX_COUNT, settings.SEGMENT_SMALL_ROWS,
+                                                   settings.SEGMENT_PURGE_RATIO):
+                    break
+        except Exception as e:
+            logger.error(f"Segment compaction failed: {e!r}")
+
+    def stats(self) -> dict:
+        index, metadata = self.snapshot()
+        manifest = self.store.read_manifest()
+        ntotal = index.ntotal if index is not None else 0
+        dim = index.d if index is not None else manifest["dim"]
+        return {
+            "collection": self.name,
+            "vectors": ntotal,
+            "metadata_entries": len(metadata),
+            "deleted_chunks": metadata.n_deleted,
+            "dim": dim,
+            "index_type": index_kind(index),
+            "configured_index_type": settings.INDEX_TYPE.lower(),
+            "compression": index_compression(index),
+            "configured_compression": settings.VECTOR_COMPRESSION.lower(),
+            "bytes_per_vector": round(bytes_per_vector(index), 1),
+            "index_bytes": int(ntotal * bytes_per_vector(index)),
+            "metadata_bytes": metadata.nbytes(),
+            "documents": len(metadata.live_documents()),
+            "segments": len(manifest["segments"]),
+            "load_seconds": round(self.load_seconds, 4),
+            "version": self.version,
+            "shared": self.shared,
+            "generation": self.generation,
+        }
+
+index_manager = IndexManager()
 
 # The search_index implementation you had looks good; reuse it here
 # (Copy/paste your search_index + helpers or import them). Example:
-def _token_overlap_score(query: str, text: str) -> float:
-    q_toks = re.findall(r"\w+", query.lower())
-    if not q_toks:
-        return 0.0
-    text_toks = set(re.findall(r"\w+", text.lower()))
-    matches = sum(1 for t in q_toks if t in text_toks)
-    return matches / len(q_toks)
-
-def _recency_score_from_timestamp(timestamp: float, recency_halflife_days: float = 7.0) -> float:
-    now = datetime.now().timestamp()
-    age_seconds = max(0.0, now - timestamp)
-    age_days = age_seconds / 86400.0
-    return 1.0 / (1.0 + (age_days / max(recency_halflife_days, 1e-6)))
+def _recency_scores(timestamps: np.ndarray, recency_halflife_days: float = 7.0) -> np.ndarray:
+    age_days = np.maximum(0.0, datetime.now().timestamp() - timestamps) / 86400.0
+    return 1.0 / (1.0 + age_days / max(recency_halflife_days, 1e-6))
+
+def _vector_candidates(index, metadata, qvec: np.ndarray, k: int):
+    """
+    Top-k live (ids, similarities) from FAISS; quantized indexes over-fetch and re-score exactly.
+    Tombstoned rows are dropped, fetching deeper until k live rows are found or the index is exhausted.
+    """
+    k = min(max(k, 1), index.ntotal)
+    compressed = index_compression(index) != "none"
+    want = min(k * max(settings.RESCORE_FACTOR, 1), index.ntotal) if compressed else k
+    fetch_k = min(want + min(metadata.n_deleted, want), index.ntotal)
+    query = np.array([qvec], dtype="float32")
+    while True:
+        D, I = index.search(query, fetch_k)
+        # the index may have grown in place past this snapshot's metadata
+        keep = (I[0] >= 0) & (I[0] < len(metadata))
+        keep[keep] = metadata.is_live(I[0][keep])
+        ids, sims = I[0][keep], D[0][keep]
+        if len(ids) >= want or fetch_k >= index.ntotal:
+            break
+        fetch_k = min(fetch_k * 2, index.ntotal)
+    ids, sims = ids[:want], sims[:want]
+    if compressed:
+        # quantized scores only pick the shortlist; re-score it exactly from the mmapped float32 vectors
+        sims = metadata.vectors(ids) @ qvec
+        order = np.argsort(-sims)[:k]
+        ids, sims = ids[order], sims[order]
+    return ids, sims
 
-def search_index(query: str, index, metadata, top_k: int = 5, alpha: float = 0.5, beta: float = 0.2, gamma: float = 0.3, recency_halflife_days: float = 7.0):
-    if index.ntotal == 0 or not metadata:
-        print("[DEBUG] FAISS index or metadata is empty")
+def _fuse(n_vec: int, sims: np.ndarray, lex_scores: np.ndarray, fusion: str) -> np.ndarray:
+    """
+    Fused relevance in [0, 1] for candidates laid out as the n_vec vector hits followed by
+    lexical-only hits. rrf: reciprocal-rank fusion over the vector ranking and the BM25
+    ranking; weighted: max-normalised cosine and BM25 mixed by HYBRID_LEXICAL_WEIGHT.
+    """
+    if fusion == "weighted":
+        w = settings.HYBRID_LEXICAL_WEIGHT
+        vec_part = np.clip(sims, 0.0, None) / max(float(sims.max()), 1e-6) if len(sims) else sims
+        lex_part = lex_scores / max(float(lex_scores.max()), 1e-6) if len(lex_scores) else lex_scores
+        return (1.0 - w) * vec_part + w * lex_part
+    k = settings.RRF_K
+    vec_rank = np.full(len(sims), np.inf)
+    vec_rank[np.argsort(-sims[:n_vec])] = np.arange(n_vec)
+    n_lex = int(np.count_nonzero(lex_scores))
+    lex_rank = np.full(len(sims), np.inf)
+    lex_rank[np.argsort(-lex_scores, kind="stable")[:n_lex]] = np.arange(n_lex)
+    rrf = 1.0 / (k + 1.0 + vec_rank) + 1.0 / (k + 1.0 + lex_rank)
+    return rrf / (2.0 / (k + 1.0))
+
+def search_index(query: str, index, metadata, top_k: int = 5, alpha: float = None, beta: float = None, gamma: float = None,
+                 recency_halflife_days: float = None, mode: str = None, fusion: str = None, overfetch: int = None,
+                 query_vec: np.ndarray = None, with_vectors: bool = False):
+    """
+    Retrieve top_k * overfetch candidates and rerank them all by
+    alpha * relevance + beta * recency + gamma * query-token overlap.
+
+    mode="vector" uses the FAISS similarity as relevance; mode="hybrid" also pulls
+    BM25 candidates from the lexical index and uses their fused (rrf/weighted) relevance.
+    Recency and overlap come from the precomputed timestamp column and postings, so the
+    rerank is a handful of numpy ops and text is only decoded for the returned hits.
+    Unset weights fall back to the RERANK_* settings. `query_vec` skips embedding
+    the query again when the caller already has it (e.g. fanning out over shards).
+    `with_vectors` adds each hit's exact, normalized "vector" (for MMR over the hits).
+    """
+    if index is None or index.ntotal == 0 or not len(metadata):
+        logger.debug("FAISS index or metadata is empty")
         return []
 
-    vec = get_embedding(query)
+    if query_vec is None:
+        with span("embed_query"):
+            vec = get_embedding(query)
+    else:
+        vec = query_vec
     if vec is None:
-        print("[WARN] Query embedding failed.")
+        logger.warning("Query embedding failed.")
         return []
 
+    alpha = settings.RERANK_ALPHA if alpha is None else alpha
+    beta = settings.RERANK_BETA if beta is None else beta
+    gamma = settings.RERANK_GAMMA if gamma is None else gamma
+    halflife = settings.RECENCY_HALFLIFE_DAYS if recency_halflife_days is None else recency_halflife_days
+    n_cand = max(top_k, 1) * max(overfetch or settings.RERANK_OVERFETCH, 1)
+    mode = (mode or settings.SEARCH_MODE).lower()
+
     qvec = normalize_vec(np.array(vec, dtype="float32"))
-    search_k = min(max(top_k, 1), index.ntotal)
-    D, I = index.search(np.array([qvec], dtype="float32"), search_k)
+    if mode == "hybrid":
+        with span("faiss_search"):
+            vec_ids, _ = _vector_candidates(index, metadata, qvec, n_cand)
+        with span("bm25_search"):
+            bm25_all = metadata.lexical.scores(query)
+            lex_ids, _ = metadata.lexical.search(query, n_cand, live=metadata.live, scores=bm25_all)
+        ids = np.concatenate([vec_ids, lex_ids[~np.isin(lex_ids, vec_ids)]])
+        # exact cosine for every candidate, including ones only BM25 found
+        sims = metadata.vectors(ids) @ qvec
+        bm25 = bm25_all[ids]
+        relevance = _fuse(len(vec_ids), sims, bm25, (fusion or settings.HYBRID_FUSION).lower())
+    else:
+        with span("faiss_search"):
+            ids, sims = _vector_candidates(index, metadata, qvec, n_cand)
+        bm25, relevance = None, sims
+
+    with span("rerank"):
+        timestamps = metadata.timestamps[ids]
+        recency = _recency_scores(timestamps, halflife)
+        match = metadata.lexical.match_fraction(query, ids)
+        final = alpha * relevance + beta * recency + gamma * match
+        order = np.argsort(-final, kind="stable")[:top_k]
+    hit_vectors = metadata.vectors(ids[order]) if with_vectors else None
 
     results = []
-    now = datetime.now().timestamp()
-    for sim, idx in zip(D[0], I[0]):
-        if idx == -1:
-            continue
-        meta = metadata[idx]
-        timestamp = meta.get("timestamp", now)
-        recency = _recency_score_from_timestamp(timestamp, recency_halflife_days)
-        match_score = _token_overlap_score(query, meta.get("text", ""))
-        final_score = alpha * float(sim) + beta * recency + gamma * match_score
-        results.append({
-            "final_score": final_score,
-            "similarity": float(sim),
-            "recency": recency,
-            "match_score": match_score,
-            "text": meta.get("text", ""),
-            "filename": meta.get("filename", "unknown"),
-            "timestamp": timestamp
-        })
-
-    results.sort(key=lambda x: x["final_score"], reverse=True)
-    print(f"[DEBUG] search_index returned {len(results)} hits (requested top_k={top_k})")
-    return results[:top_k]
+    for rank, pos in enumerate(order):
+        idx = int(ids[pos])
+        hit = {
+            "final_score": float(final[pos]),
+            "similarity": float(sims[pos]),
+            "recency": float(recency[pos]),
+            "match_score": float(match[pos]),
+            "text": metadata.text(idx),
+            "filename": metadata.filename(idx),
+            "timestamp": float(timestamps[pos]),
+            "page": int(metadata.pages[idx]),
+            "chunk_id": int(metadata.chunk_ids[idx]),
+            "document_id": metadata.document_id(idx)
+        }
+        start, end = metadata.char_span(idx)
+        if start >= 0:
+            hit["char_start"], hit["char_end"] = start, end
+        if bm25 is not None:
+            hit["bm25"] = float(bm25[pos])
+            hit["fused"] = float(relevance[pos])
+        if hit_vectors is not None:
+            hit["vector"] = hit_vectors[rank]
+        results.append(hit)
+
+    logger.debug(f"search_index ({mode}) returned {len(results)} hits from {len(ids)} candidates")
+    return results
@@ -0,0 +1,243 @@
+# app/workers/job_store.py
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from threading import RLock
+from typing import Callable, Optional, Tuple
+
+JOB_COLUMNS = ("id", "filename", "file_path", "status", "stage", "progress", "error", "result",
+               "attempts", "created_at", "started_at", "finished_at", "collection", "sha256",
+               "owner", "heartbeat")
+
+
+class QueueFullError(Exception):
+    """Raised when INGEST_MAX_QUEUE jobs are already waiting."""
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process named by an owner string ("host:pid") may still run; unknown hosts count as alive."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """
+    Durable ingestion job table in SQLite, shared by every process that ingests. Jobs move
+    queued -> running -> done/failed; a running job carries its owner ("host:pid") and a
+    heartbeat, and is re-queued only once that owner is gone or has stopped beating.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, filename TEXT NOT NULL, file_path TEXT NOT NULL, "
+            "status TEXT NOT NULL, stage TEXT, progress REAL NOT NULL DEFAULT 0, "
+            "error TEXT, result TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "collection TEXT NOT NULL DEFAULT 'default', sha256 TEXT)"
+        )
+        # job tables created before these columns existed
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "collection" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN collection TEXT NOT NULL DEFAULT 'default'")
+        if "sha256" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN sha256 TEXT")
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_sha256 ON jobs(sha256, collection)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+        # re-entrant: the lookups also run inside create_unique's transaction
+        self._lock = RLock()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _row(self, row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, filename: str, file_path: str, collection: str = "default", sha256: str = None) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, filename, file_path, status, stage, progress, created_at, collection, sha256) "
+                "VALUES (?, ?, ?, 'queued', 'queued', 0, ?, ?, ?)",
+                (job_id, filename, file_path, time.time(), collection, sha256),
+            )
+        return self.get(job_id)
+
+    def create_unique(self, filename: str, file_path: str, collection: str = "default", sha256: str = None,
+                      max_queued: int = None, is_indexed: Callable[[dict], bool] = None) -> Tuple[dict, bool]:
+        """
+        Queue a job unless the same content is already queued, running or still indexed in
+        `collection` (a done job counts while it is the filename's latest and `is_indexed(job)`
+        holds). Returns (job, duplicate). The check and the insert run in one BEGIN IMMEDIATE
+        transaction, so concurrent submits from several processes cannot both queue the same
+        content. Raises QueueFullError when `max_queued` jobs are already waiting.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._duplicate(sha256, collection, is_indexed) if sha256 else None
+                if existing is None:
+                    queued = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                    if max_queued is not None and queued >= max_queued:
+                        raise QueueFullError(f"{queued} ingestion jobs already queued")
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, filename, file_path, status, stage, progress, created_at, collection, sha256) "
+                        "VALUES (?, ?, ?, 'queued', 'queued', 0, ?, ?, ?)",
+                        (job_id, filename, file_path, time.time(), collection, sha256),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if existing is not None:
+            return existing, True
+        return self.get(job_id), False
+
+    def _duplicate(self, sha256: str, collection: str, is_indexed) -> Optional[dict]:
+        job = self.find_by_hash(sha256, collection)
+        if job is None or job["status"] != "done":
+            return job
+        # a later upload under the same filename replaced this content
+        latest = self.latest_done(job["filename"], collection)
+        if latest is None or latest["sha256"] != sha256:
+            return None
+        # or the document has been deleted since
+        return job if is_indexed is None or is_indexed(job) else None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def list(self, limit: int = 50, status: str = None) -> list:
+        sql = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        args = []
+        if status:
+            sql += " WHERE status = ?"
+            args.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._row(r) for r in rows]
+
+    def find_by_hash(self, sha256: str, collection: str = "default") -> Optional[dict]:
+        """Most recent queued, running or finished job for this file content in `collection`."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE sha256 = ? AND collection = ? "
+                "AND status != 'failed' ORDER BY created_at DESC LIMIT 1",
+                (sha256, collection),
+            ).fetchone()
+        return self._row(row)
+
+    def latest_done(self, filename: str, collection: str = "default") -> Optional[dict]:
+        """The job that last indexed `filename` into `collection`."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE filename = ? AND collection = ? "
+                "AND status = 'done' ORDER BY finished_at DESC LIMIT 1",
+                (filename, collection),
+            ).fetchone()
+        return self._row(row)
+
+    def claim_next(self) -> Optional[dict]:
+        """Atomically move the oldest queued job to running and return it (None if the queue is empty)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'starting', started_at = ?, "
+                    "attempts = attempts + 1, owner = ?, heartbeat = ? WHERE id = ?",
+                    (now, self.owner, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def update(self, job_id: str, stage: str, progress: float):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET stage = ?, progress = ?, heartbeat = ? WHERE id = ?",
+                               (stage, progress, time.time(), job_id))
+
+    def finish(self, job_id: str, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', stage = 'done', progress = 1, result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def heartbeat(self) -> int:
+        """Mark this process's running jobs as still alive."""
+        with self._lock:
+            cur = self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                                     (time.time(), self.owner))
+        return cur.rowcount
+
+    def requeue_interrupted(self, stale_after: float, include_own: bool = False) -> int:
+        """
+        Re-queue running jobs whose owner has died: a process on this host that no longer
+        exists, or any owner without a heartbeat for `stale_after` seconds. Jobs other live
+        processes are still working on are left alone. `include_own` also takes back this
+        process's own running jobs, for a queue (re)starting with nothing in flight.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute("SELECT id, owner, heartbeat FROM jobs WHERE status = 'running'").fetchall()
+                cutoff = time.time() - stale_after
+                dead = [job_id for job_id, owner, beat in rows
+                        if owner is None or (beat or 0) < cutoff or not _owner_alive(owner)
+                        or (include_own and owner == self.owner)]
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, owner = NULL "
+                    "WHERE id = ? AND status = 'running'", [(j,) for j in dead])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(dead)
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
@@ -1,30 +1,273 @@
-import os
-from app.services import ocr, preprocessing, extraction, embeddings, vectorstore
-from app.models.db_models import insert_document
+# app/workers/processor.py
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from app.config import settings
+from app.services import ocr
+from app.services.chunk_store import document_id
+from app.services.metrics import counter, histogram, observe_stage, span
+from app.workers import stages
+from app.workers.job_store import JobStore, QueueFullError
 
-def process_document(file_path: str, filename: str):
+logger = logging.getLogger(__name__)
+
+
+JOB_SECONDS = histogram("ingest_job_seconds", "End-to-end ingestion job time, by outcome.", ["status"])
+JOBS_TOTAL = counter("ingest_jobs_total", "Ingestion jobs finished, by outcome.", ["status"])
+
+
+def _embed_pdf_pages(job: dict, pool: ProcessPoolExecutor, store: JobStore, workers: int):
+    """
+    Stream (page_no, text) from the pool and chunk / embed each batch of pages as it
+    arrives, so embedding overlaps with extraction of the later pages.
+    Returns (full text, Chunk records, embeddings); chunk offsets index into the full text.
+    """
+    from app.services.chunking import iter_chunks
+    from app.services.embeddings import embed_texts
+
+    n_pages = max(ocr.pdf_page_count(job["file_path"]), 1)
+    texts, chunks, embeddings = [], [], []
+    pending, offset = 0, 0
+    # time spent waiting on extraction, as opposed to chunking / embedding pages already read
+    waited, t0 = 0.0, time.perf_counter()
+    for page_no, page_text in ocr.iter_pdf_pages(job["file_path"], pool=pool, workers=workers):
+        waited += time.perf_counter() - t0
+        texts.append(page_text)
+        with span("chunk"):
+            page_chunks = list(iter_chunks([(page_no, page_text)], settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, offset))
+        if page_text:
+            offset += len(page_text) + 1
+        chunks.extend(page_chunks)
+        pending += len(page_chunks)
+        if pending >= settings.EMBEDDING_BATCH_SIZE:
+            embeddings.extend(embed_texts([c.text for c in chunks[len(embeddings):]]))
+            pending = 0
+        store.update(job["id"], "extract+embed", round(0.1 + 0.6 * page_no / n_pages, 3))
+        t0 = time.perf_counter()
+    observe_stage("extract", waited)
+    embeddings.extend(embed_texts([c.text for c in chunks[len(embeddings):]]))
+    failed = sum(e is None for e in embeddings)
+    logger.debug(f"{job['filename']}: {len(texts)} pages, {len(chunks)} chunks, {len(chunks) - failed} embedded")
+    return "\n".join(t for t in texts if t), chunks, embeddings
+
+
+def process_document(job: dict, pool: ProcessPoolExecutor, store: JobStore, workers: int = 1) -> dict:
+    """
+    Run one ingestion job: extract (OCR) -> clean + entities -> embed -> index -> store.
+    Extraction and entity analysis run in the process pool; PDFs are streamed page by
+    page so embedding starts before the last page is read, and entity analysis overlaps
+    with embedding. Embedding and the index write stay in this process because they
+    share the embedding cache and the live IndexManager.
+    """
+    from app.services.embeddings import embed_document
+    from app.services.shards import collection_manager
+
+    job_id, file_path, filename = job["id"], job["file_path"], job["filename"]
+    collection = job.get("collection") or "default"
+
+    store.update(job_id, "extract", 0.1)
+    analysis = None
+    if filename.lower().endswith(".pdf"):
+        text, chunks, embeddings = _embed_pdf_pages(job, pool, store, workers)
+        if not text.strip():
+            raise ValueError("No extractable text in file.")
+        analysis = pool.submit(stages.analyze_text, text)
+    else:
+        with span("extract"):
+            text = pool.submit(stages.extract_text, file_path, filename).result()
+        if not text or not text.strip():
+            raise ValueError("No extractable text in file.")
+        logger.debug(f"Extracted {len(text)} chars from {filename}")
+        store.update(job_id, "embed", 0.3)
+        analysis = pool.submit(stages.analyze_text, text)
+        chunks, embeddings = embed_document(text, chunk_size=settings.CHUNK_SIZE, overlap=settings.CHUNK_OVERLAP)
+    if not chunks:
+        raise ValueError("No chunks created from document.")
+    indexed = sum(e is not None for e in embeddings)
+    if not indexed:
+        raise ValueError("Embedding failed for all chunks.")
+
+    store.update(job_id, "index", 0.7)
+    with span("index"):
+        collection_manager.get(collection, create=True).add(chunks, embeddings=embeddings, filename=filename)
+
+    store.update(job_id, "store", 0.9)
+    # the document is already searchable; failed entity analysis still gets a record, just without entities
+    result, analysis_error = {}, None
+    try:
+        result = analysis.result()
+    except Exception as e:
+        analysis_error = f"{type(e).__name__}: {e}"
+        logger.warning(f"Entity analysis failed for {filename}: {analysis_error}")
     try:
-        if filename.lower().endswith(".pdf"):
-            text = ocr.extract_text_from_pdf(file_path)
-        else:
-            text = ocr.extract_text_from_image(file_path)
-        clean_text = preprocessing.clean_text(text)
-        entities = extraction.extract_entities(clean_text)
-        patterns = extraction.extract_custom_patterns(clean_text)
-        metadata = {**entities, **patterns}
-        chunks = [clean_text[i:i+settings.CHUNK_SIZE] for i in range(0, len(clean_text), settings.CHUNK_SIZE) if len(clean_text[i:i+settings.CHUNK_SIZE])>20]
-        vectors = [embeddings.get_embedding(c) for c in chunks]
-        # remove any empty vectors
-        vectors = [v for v in vectors if v]
-        vectorstore.add_vectors(vectors)
-        doc = {
+        from app.models.db_models import document_repository
+        # batched with other jobs' records into one bulk_write
+        document_repository.queue({
             "filename": filename,
+            "collection": collection,
+            "sha256": job.get("sha256"),
             "status": "done",
-            "metadata": metadata,
-            "text": clean_text,
-            "chunk_count": len(chunks)
-        }
-        insert_document(doc)
+            "metadata": result.get("metadata", {}),
+            "entities": result.get("entities", []),
+            "analysis_error": analysis_error,
+            # the extracted text as is, so chunk char_start / char_end index into it
+            "text": text,
+            "chunk_count": len(chunks),
+        })
     except Exception as e:
-        print("Error processing document:", e)
+        # nor should a metadata storage failure fail the job
+        logger.warning(f"Could not store document metadata for {filename}: {type(e).__name__}: {e}")
+
+    return {"filename": filename, "collection": collection, "document_id": document_id(filename),
+            "chunks_indexed": indexed}
+
+
+class IngestionQueue:
+    """
+    Bounded, durable ingestion queue. Jobs live in a JobStore so they survive a restart;
+    dispatcher threads claim them one at a time and push the CPU-heavy stages to a
+    shared process pool, keeping OCR and spaCy off the API event loop. Several processes
+    (uvicorn workers) may each run a queue on the same store: claims and submits are
+    transactional, and a heartbeat thread keeps this process's jobs owned while
+    re-queueing those of processes that died.
+    """
+
+    def __init__(self, store: JobStore, workers: int = None, processes: int = None, max_queue: int = None):
+        self.store = store
+        self.workers = max(1, workers or settings.INGEST_WORKERS)
+        self.processes = max(1, processes or settings.INGEST_PROCESSES)
+        self.max_queue = max(1, max_queue or settings.INGEST_MAX_QUEUE)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._threads = []
+        self._wake = threading.Condition()
+        self._halt = threading.Event()
+        self._stopping = False
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that holds FAISS / SQLite / thread-pool state is not safe
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def start(self):
+        if self._threads:
+            return
+        requeued = self.store.requeue_interrupted(settings.INGEST_STALE_SECONDS, include_own=True)
+        if requeued:
+            logger.debug(f"Re-queued {requeued} interrupted ingestion jobs")
+        self._stopping = False
+        self._halt.clear()
+        self._pool = self._new_pool()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="ingest-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop claiming jobs; a job cut short here stays `running` and is re-queued by the next
+        start, or by another process once this one has exited.
+        """
+        self._halt.set()
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Swap in a fresh pool, unless another thread already replaced `broken` or we are stopping."""
+        with self._pool_lock:
+            if self._stopping or self._pool is not broken:
+                return
+            self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _still_indexed(self, job: dict) -> bool:
+        from app.services.shards import collection_manager
+        try:
+            return collection_manager.get(job["collection"]).find_document(document_id(job["filename"])) is not None
+        except KeyError:
+            return False
+
+    def submit(self, filename: str, file_path: str, collection: str = "default", sha256: str = None) -> dict:
+        """
+        Queue a file for ingestion. With `sha256`, content that is already queued, running or
+        indexed in the collection is not processed again: the existing job is returned instead,
+        marked "duplicate". Raises QueueFullError past INGEST_MAX_QUEUE queued jobs.
+        """
+        job, duplicate = self.store.create_unique(filename, file_path, collection, sha256,
+                                                  max_queued=self.max_queue, is_indexed=self._still_indexed)
+        if not duplicate:
+            with self._wake:
+                self._wake.notify()
+        return {**job, "duplicate": duplicate}
+
+    def _heartbeat(self):
+        """Keep this process's running jobs owned and take back the jobs of processes that died."""
+        while not self._halt.wait(settings.INGEST_HEARTBEAT_SECONDS):
+            try:
+                self.store.heartbeat()
+                if self.store.requeue_interrupted(settings.INGEST_STALE_SECONDS):
+                    with self._wake:
+                        self._wake.notify_all()
+            except Exception as e:
+                logger.error(f"Ingestion heartbeat failed: {e!r}")
+
+    def _run(self):
+        while not self._stopping:
+            job = self.store.claim_next()
+            if job is None:
+                with self._wake:
+                    if not self._stopping:
+                        self._wake.wait(timeout=1.0)
+                continue
+            self._process(job)
+
+    def _process(self, job: dict):
+        start = time.time()
+        pool = self._pool
+        try:
+            result = process_document(job, pool, self.store, self.processes)
+            result["seconds"] = round(time.time() - start, 3)
+            self.store.finish(job["id"], result)
+            JOB_SECONDS.observe(time.time() - start, status="done")
+            JOBS_TOTAL.inc(status="done")
+            logger.debug(f"Job {job['id']} done: {result}")
+        except BrokenProcessPool as e:
+            # a pool worker died (e.g. OOM in OCR); replace the pool so later jobs still run
+            logger.exception(f"Job {job['id']} ({job['filename']}) failed: process pool broke")
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+            JOB_SECONDS.observe(time.time() - start, status="failed")
+            JOBS_TOTAL.inc(status="failed")
+            self._replace_pool(pool)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({job['filename']}) failed")
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+            JOB_SECONDS.observe(time.time() - start, status="failed")
+            JOBS_TOTAL.inc(status="failed")
+
+    def stats(self) -> dict:
+        counts = self.store.counts()
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "processes": self.processes,
+        }
+
+
+ingestion_queue = IngestionQueue(JobStore(settings.JOBS_DB_PATH))
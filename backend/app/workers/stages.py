@@ -0,0 +1,71 @@
+# app/workers/stages.py
+"""
+CPU-bound ingestion stages, run in the ingestion process pool. Kept free of the
+FAISS / embedding imports so spawned workers start quickly; spaCy is only loaded
+by processes that actually run entity extraction.
+"""
+import hashlib
+from app.services import ocr, preprocessing
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+
+
+def extract_text(file_path: str, filename: str) -> str:
+    """OCR / text extraction by file type; plain files are decoded as utf-8."""
+    ext = filename.lower()
+    if ext.endswith(".pdf"):
+        # already inside a pool worker: read pages inline rather than nesting another pool
+        return ocr.extract_text_from_pdf(file_path, workers=1)
+    if ext.endswith(IMAGE_EXTS):
+        return ocr.extract_text_from_image(file_path)
+    with open(file_path, "rb") as f:
+        return f.read().decode(errors="ignore")
+
+
+def extract_pages(file_path: str, filename: str) -> list:
+    """(page_no, text) pairs: 1-based pages for PDFs, the whole text as page 0 otherwise."""
+    if filename.lower().endswith(".pdf"):
+        return list(ocr.iter_pdf_pages(file_path))
+    return [(0, extract_text(file_path, filename))]
+
+
+def file_sha256(file_path: str, block: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def prepare_file(file_path: str, filename: str) -> dict:
+    """
+    Everything bulk ingestion needs from one file in a single pool task: content hash,
+    pages and entity analysis. An analysis failure (e.g. no spaCy model) is reported in
+    "analysis_error" rather than failing the file, as the ingestion queue does.
+    """
+    pages = extract_pages(file_path, filename)
+    text = "\n".join(t for _, t in pages if t)
+    analysis, error = None, None
+    if text.strip():
+        try:
+            analysis = analyze_text(text)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return {"sha256": file_sha256(file_path), "pages": pages, "text": text, "analysis": analysis,
+            "analysis_error": error}
+
+
+def analyze_text(text: str) -> dict:
+    """
+    Clean the text and pull out named entities and custom patterns. NER runs on the clean
+    text; "entities" holds the deduplicated entity records with their offsets mapped back
+    into `text` as given, the same body the chunk char_start / char_end index into.
+    """
+    from app.services import extraction
+
+    clean, anchors = preprocessing.clean_text_with_offsets(text)
+    records = extraction.extract_entity_records(clean)
+    for rec in records:
+        rec["offsets"] = [preprocessing.to_raw_span(anchors, s, e) for s, e in rec["offsets"]]
+    patterns = extraction.extract_custom_patterns(clean)
+    return {"clean_text": clean, "metadata": {**extraction.group_entities(records), **patterns}, "entities": records}
@@ -0,0 +1,117 @@
+# benchmarks/corpus.py
+"""
+Deterministic synthetic corpus: documents made of topic-specific vocabulary with
+ALL CAPS section headings (so chunk_text sees real section breaks), short chunk
+texts and clustered unit vectors for index-sized scenarios, and minimal text PDFs.
+Everything is derived from a seed, so two runs see byte-identical input.
+"""
+import numpy as np
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "de", "pa", "zu", "fe", "gro", "tri", "bel", "mon"]
+N_TOPICS = 50
+TOPIC_WORDS = 40
+
+
+def _vocabulary(n: int, rng) -> list:
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))))
+    return sorted(words)
+
+
+class Corpus:
+    def __init__(self, seed: int = 0, vocab_size: int = 5000):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.vocab = np.array(_vocabulary(vocab_size, rng))
+        self.topics = [rng.choice(len(self.vocab), TOPIC_WORDS, replace=False) for _ in range(N_TOPICS)]
+        # measured on a sample (separate seed, so the document stream is unchanged) to size text in tokens
+        self.chars_per_word = len(self.text(np.random.default_rng(seed + 99), 5000, 0)) / 5000
+
+    def text(self, rng, n_words: int, topic: int, section_words: int = 220) -> str:
+        """n_words of prose on `topic`: sentences of 8-16 words, a heading line every ~section_words words."""
+        # a third of the words come from the topic so related documents share vocabulary
+        general = rng.integers(0, len(self.vocab), n_words)
+        on_topic = self.topics[topic][rng.integers(0, TOPIC_WORDS, n_words)]
+        ids = np.where(rng.random(n_words) < 0.33, on_topic, general)
+        words = self.vocab[ids]
+        lines, sentence, since_heading = [], [], 0
+        for i, w in enumerate(words):
+            if since_heading >= section_words:
+                lines.append(f"SECTION {len(lines) + 1} {self.vocab[self.topics[topic][0]].upper()}")
+                since_heading = 0
+            sentence.append(w)
+            since_heading += 1
+            if len(sentence) >= rng.integers(8, 17) or i == len(words) - 1:
+                lines.append(" ".join(sentence).capitalize() + ".")
+                sentence = []
+        return "\n".join(lines)
+
+    def documents(self, n_chunks: int, chunk_tokens: int = None, overlap_tokens: int = None, chunks_per_doc: int = 20):
+        """
+        Yield (filename, text) until the documents add up to about n_chunks chunks of
+        chunk_tokens / overlap_tokens (CHUNK_SIZE / CHUNK_OVERLAP by default), approximate
+        tokens as app.services.chunking counts them.
+        """
+        from app.config import settings
+        from app.services.chunking import CHARS_PER_TOKEN
+
+        chunk_tokens = chunk_tokens or settings.CHUNK_SIZE
+        overlap_tokens = settings.CHUNK_OVERLAP if overlap_tokens is None else overlap_tokens
+        rng = np.random.default_rng(self.seed + 1)
+        stride_chars = max(chunk_tokens - overlap_tokens, 1) * CHARS_PER_TOKEN
+        words_per_stride = stride_chars / self.chars_per_word
+        words_per_doc = max(1, round(chunks_per_doc * words_per_stride))
+        # sections three chunks long, so headings split the text without dictating the chunk count
+        section_words = max(1, round(3 * words_per_stride))
+        for i in range(max(1, -(-n_chunks // chunks_per_doc))):
+            yield f"doc-{i:07d}.txt", self.text(rng, words_per_doc, i % N_TOPICS, section_words)
+
+    def chunk_texts(self, n: int, words: int = 24, start: int = 0):
+        """n short chunk texts; chunk i is on topic i % N_TOPICS."""
+        rng = np.random.default_rng(self.seed + 2 + start)
+        return [self.text(rng, words, (start + i) % N_TOPICS, section_words=10 ** 9) for i in range(n)]
+
+    def vectors(self, n: int, dim: int, start: int = 0, noise: float = 0.35) -> np.ndarray:
+        """
+        Unit vectors for chunks start..start+n: chunk i sits around the centroid of
+        topic i % N_TOPICS, so neighbourhoods are realistic rather than uniform noise.
+        """
+        centroids = np.random.default_rng(self.seed + 3).normal(size=(N_TOPICS, dim)).astype("float32")
+        rng = np.random.default_rng(self.seed + 4 + start)
+        topics = (np.arange(start, start + n) % N_TOPICS)
+        vecs = centroids[topics] + rng.normal(0, noise, (n, dim)).astype("float32")
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs
+
+    def pdf(self, rng, pages: int, topic: int, words_per_page: int = 300) -> bytes:
+        return make_pdf([self.text(rng, words_per_page, topic, section_words=10 ** 9) for _ in range(pages)])
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: list) -> bytes:
+    """A minimal PDF with one Helvetica text page per entry (lines split on newlines)."""
+    n = len(pages)
+    font_id = 3 + 2 * n
+    objs = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>",
+    ]
+    for i, text in enumerate(pages):
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                    f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        lines = "".join(f"BT /F1 9 Tf 36 {760 - 11 * j} Td ({_pdf_escape(line)}) Tj ET\n"
+                        for j, line in enumerate(text.split("\n")[:68]))
+        objs.append(f"<< /Length {len(lines)} >>\nstream\n{lines}endstream")
+    objs.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out, offsets = "%PDF-1.4\n", []
+    for i, obj in enumerate(objs):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
@@ -0,0 +1,131 @@
+# benchmarks/harness.py
+"""
+Measurement helpers and the isolated scenario runner. Each scenario runs in a fresh
+spawned process with its own temporary storage and offline settings, so peak RSS is
+per scenario and no run sees another's index, job queue or caches.
+"""
+import contextlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB (None if the platform can't tell)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, KiB elsewhere
+        return round(peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024, 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / 2 ** 20, 1)
+    except Exception:
+        return None
+
+
+class Latencies:
+    """Collects per-operation wall times: `with lat.time(): ...`."""
+
+    def __init__(self):
+        self.samples = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        yield
+        self.samples.append(time.perf_counter() - start)
+
+    def summary(self, items: int, unit: str, seconds: float = None) -> dict:
+        """Throughput is items per second of measured time (sum of samples) unless `seconds` is given."""
+        seconds = sum(self.samples) if seconds is None else seconds
+        lat = np.array(self.samples) * 1000.0 if self.samples else np.zeros(1)
+        return {
+            "items": items,
+            "unit": unit,
+            "seconds": round(seconds, 3),
+            "throughput": round(items / seconds, 2) if seconds > 0 else None,
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        }
+
+
+def scenario_env(workdir: str, dim: int) -> dict:
+    """Offline, cache-free settings pointing every store at `workdir`; explicit env vars still win."""
+    env = {
+        "EMBEDDING_BACKEND": "fake",
+        "EMBEDDING_FAKE_DIM": str(dim),
+        "EMBEDDING_CACHE_PATH": "",
+        "GENERATION_BACKEND": "fake",
+        "ANSWER_CACHE_SIZE": "0",
+        "INGEST_MAX_QUEUE": str(10 ** 9),
+        "COLLECTION_IDLE_SECONDS": "0",
+        # fail fast when no MongoDB is running: metadata storage then only logs a warning
+        "MONGO_URI": "mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=200",
+    }
+    env = {k: os.environ.get(k, v) for k, v in env.items()}
+    # storage always goes to the scratch directory
+    env.update({
+        "STORAGE_PATH": os.path.join(workdir, "storage"),
+        "SEGMENTS_DIR": os.path.join(workdir, "vectorstore", "segments"),
+        "COLLECTIONS_DIR": os.path.join(workdir, "vectorstore", "collections"),
+        "VECTOR_INDEX_PATH": os.path.join(workdir, "vectorstore", "faiss_index.bin"),
+        "METADATA_PATH": os.path.join(workdir, "vectorstore", "metadata.pkl"),
+        "JOBS_DB_PATH": os.path.join(workdir, "storage", "jobs.sqlite"),
+    })
+    return env
+
+
+def run_scenario(name: str, size: int, opts: dict, quiet: bool = True) -> dict:
+    """Run one scenario in this process (call it in a fresh process for clean numbers)."""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        os.environ.update(scenario_env(workdir, opts["dim"]))
+        if quiet:
+            os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # app settings are read at import time, so the app is only imported from here on
+        from benchmarks import scenarios
+
+        sink = open(os.devnull, "w") if quiet else None
+        try:
+            with contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext():
+                result = scenarios.SCENARIOS[name](size, opts)
+        finally:
+            if sink is not None:
+                sink.close()
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _child(name: str, size: int, opts: dict, quiet: bool, conn):
+    try:
+        conn.send(("ok", run_scenario(name, size, opts, quiet)))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_isolated(name: str, size: int, opts: dict, quiet: bool = True) -> dict:
+    # a plain (non-daemon) process, since the upload scenario starts its own process pool
+    ctx = multiprocessing.get_context("spawn")
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(name, size, opts, quiet, send))
+    proc.start()
+    send.close()
+    try:
+        status, payload = recv.recv()
+    except EOFError:
+        status, payload = "error", f"scenario process exited with code {proc.join() or proc.exitcode}"
+    proc.join()
+    if status != "ok":
+        raise RuntimeError(f"{name} failed:\n{payload}")
+    return payload
@@ -0,0 +1,191 @@
+# benchmarks/run.py
+"""
+Reproducible ingestion and retrieval benchmarks on a synthetic corpus with the fake
+embedder and generator (no network, no Gemini quota). Run from backend/:
+
+    python -m benchmarks.run                                   # every scenario at 1k chunks
+    python -m benchmarks.run --sizes 1k,100k --scenarios search_index,chat
+    python -m benchmarks.run --sizes 1m --dim 128 --scenarios add_to_index,search_index
+    python -m benchmarks.run --save-baseline                   # record benchmarks/baseline.json
+
+Each scenario runs --rounds times, each in its own process on scratch storage, and
+reports the median throughput, p50/p99 latency, peak RSS and (search_index) recall@k,
+plus the spread of every metric across rounds. Medians are compared with the baseline
+JSON; a throughput or recall drop, or a latency / RSS rise, beyond the tolerance (widened
+by the spread both runs measured, so noise alone does not trip it) is flagged and makes
+the exit status non-zero. Settings such as INDEX_TYPE
+or VECTOR_COMPRESSION are taken from the environment as usual.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from benchmarks.harness import run_isolated, run_scenario
+from benchmarks.scenarios import SCENARIOS
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# metric -> whether bigger is better
+METRICS = {"throughput": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False, "recall": True}
+# recall is compared in absolute terms; everything else relative to the baseline
+RECALL_TOLERANCE = 0.01
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    for suffix, mult in (("k", 1000), ("m", 1000 ** 2)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * mult)
+    return int(value)
+
+
+def format_size(n: int) -> str:
+    for suffix, mult in (("m", 1000 ** 2), ("k", 1000)):
+        if n >= mult and n % mult == 0:
+            return f"{n // mult}{suffix}"
+    return str(n)
+
+
+def summarize(rounds: list) -> dict:
+    """
+    One result from several rounds of a scenario: the median of each metric, with
+    "spread" holding (max - min) / median per metric and "rounds" the round count.
+    """
+    result = dict(rounds[0])
+    spread = {}
+    for metric in METRICS:
+        values = [r[metric] for r in rounds if r.get(metric) is not None]
+        if not values:
+            continue
+        mid = statistics.median(values)
+        result[metric] = round(mid, 4)
+        spread[metric] = round((max(values) - min(values)) / mid, 4) if mid else 0.0
+    result["rounds"] = len(rounds)
+    result["spread"] = spread
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    [(key, metric, baseline, current, change)] for every metric that regressed. A relative
+    change only counts once it exceeds both `tolerance` and the round-to-round spread of the
+    baseline and current runs together.
+    """
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == "recall":
+                worse = new < old - RECALL_TOLERANCE
+            elif old <= 0:
+                continue
+            else:
+                change = (new - old) / old
+                allowed = max(tolerance, base.get("spread", {}).get(metric, 0.0) + current.get("spread", {}).get(metric, 0.0))
+                worse = change < -allowed if higher_is_better else change > allowed
+            if worse:
+                regressions.append((key, metric, old, new, (new - old) / old if old else 0.0))
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    cols = ["throughput", "p50_ms", "p99_ms", "peak_rss_mb", "recall"]
+    print(f"{'scenario':>24}  {'unit':>9}  " + "  ".join(f"{c:>20}" for c in cols))
+    for key, r in results.items():
+        base = baseline.get(key, {})
+        cells = []
+        for c in cols:
+            v = r.get(c)
+            if v is None:
+                cells.append(f"{'-':>20}")
+                continue
+            delta = ""
+            if base.get(c):
+                delta = f" ({(v - base[c]) / base[c] * 100:+.0f}%)"
+            cells.append(f"{str(v) + delta:>20}")
+        print(f"{key:>24}  {r.get('unit', ''):>9}  " + "  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma list of {','.join(SCENARIOS)}")
+    parser.add_argument("--sizes", default="1k", help="comma list of corpus sizes in chunks, e.g. 1k,100k,1m")
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBEDDING_FAKE_DIM", 768)),
+                        help="fake embedding dimension (lower it for 1m-chunk runs)")
+    parser.add_argument("--queries", type=int, default=200, help="queries for search_index / chat")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", default="vector", help="search mode for search_index / chat")
+    parser.add_argument("--batch", type=int, default=1000, help="chunks per add_to_index call")
+    parser.add_argument("--pdf-every", type=int, default=5, help="every Nth upload is a PDF (0 = none)")
+    parser.add_argument("--pdf-pages", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per scenario; medians are reported and compared")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change before flagging")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--in-process", action="store_true", help="no per-scenario process (debugging; RSS is shared)")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's [DEBUG] output")
+    args = parser.parse_args()
+
+    names = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    opts = {"dim": args.dim, "queries": args.queries, "k": args.k, "mode": args.mode, "batch": args.batch,
+            "pdf_every": args.pdf_every, "pdf_pages": args.pdf_pages, "seed": args.seed}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    for size in [parse_size(s) for s in args.sizes.split(",") if s]:
+        for name in names:
+            key = f"{name}@{format_size(size)}"
+            print(f"[bench] {key} ...", file=sys.stderr, flush=True)
+            start = time.perf_counter()
+            run = run_scenario if args.in_process else run_isolated
+            results[key] = summarize([run(name, size, opts, not args.verbose) for _ in range(max(args.rounds, 1))])
+            print(f"[bench] {key} done in {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+
+    print_table(results, baseline)
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": opts,
+            "rounds": max(args.rounds, 1),
+            "env": {k: os.environ[k] for k in ("INDEX_TYPE", "VECTOR_COMPRESSION", "SEARCH_MODE") if k in os.environ},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for key, metric, old, new, change in regressions:
+        print(f"REGRESSION {key} {metric}: {old} -> {new} ({change * 100:+.0f}%)")
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# benchmarks/scenarios.py
+"""
+Benchmark scenarios. Each takes the size in chunks and the run options and returns
+a summary dict (see harness.Latencies.summary), plus scenario-specific extras.
+The app is imported inside each scenario, after harness.run_scenario has pointed
+the settings at scratch storage.
+"""
+import time
+import numpy as np
+from benchmarks.corpus import Corpus
+from benchmarks.harness import Latencies
+
+# chunks per synthetic document in the store-building scenarios
+CHUNKS_PER_DOC = 20
+
+
+def _corpus(opts: dict) -> Corpus:
+    return Corpus(seed=opts["seed"])
+
+
+def bench_chunk_text(size: int, opts: dict) -> dict:
+    from app.config import settings
+    from app.services.embeddings import chunk_text
+
+    lat, n = Latencies(), 0
+    for _, text in _corpus(opts).documents(size, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+        with lat.time():
+            n += len(chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+    return {**lat.summary(n, "chunks"), "documents": len(lat.samples)}
+
+
+def bench_embed_document(size: int, opts: dict) -> dict:
+    from app.config import settings
+    from app.services.embeddings import embed_document
+
+    lat, n = Latencies(), 0
+    for _, text in _corpus(opts).documents(size, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+        with lat.time():
+            chunks, _ = embed_document(text, chunk_size=settings.CHUNK_SIZE, overlap=settings.CHUNK_OVERLAP)
+        n += len(chunks)
+    return {**lat.summary(n, "chunks"), "documents": len(lat.samples)}
+
+
+def bench_add_to_index(size: int, opts: dict) -> dict:
+    """add_to_index calls of `batch` chunks with precomputed vectors, growing one index to `size`."""
+    from app.services.vectorstore import add_to_index, load_or_create_index
+
+    corpus, batch, dim = _corpus(opts), opts["batch"], opts["dim"]
+    index, metadata = load_or_create_index(dim)
+    lat = Latencies()
+    for start in range(0, size, batch):
+        n = min(batch, size - start)
+        texts, vecs = corpus.chunk_texts(n, start=start), corpus.vectors(n, dim, start=start)
+        with lat.time():
+            metadata = add_to_index(texts, index, metadata, embeddings=list(vecs), filename=f"batch-{start:08d}.txt")
+    return {**lat.summary(index.ntotal, "chunks"), "batch": batch}
+
+
+def build_store(size: int, opts: dict, batch: int = 50000):
+    """Write `size` chunks straight to the segment store, skipping embedding and index maintenance."""
+    from app.services.vectorstore import segment_store
+
+    corpus, dim = _corpus(opts), opts["dim"]
+    rng = np.random.default_rng(opts["seed"])
+    now = time.time()
+    for start in range(0, size, batch):
+        n = min(batch, size - start)
+        ages = rng.uniform(0, 30 * 86400, n)
+        meta = [{"filename": f"doc-{(start + i) // CHUNKS_PER_DOC:07d}.txt", "text": t, "timestamp": now - a, "page": 0}
+                for i, (t, a) in enumerate(zip(corpus.chunk_texts(n, start=start), ages))]
+        segment_store.append(corpus.vectors(n, dim, start=start), meta)
+
+
+def exact_top_k(parts: list, queries: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force top-k row ids over the stored vectors, one segment at a time."""
+    best_ids = np.full((len(queries), 0), -1, dtype="int64")
+    best_sims = np.zeros((len(queries), 0), dtype="float32")
+    offset = 0
+    for part in parts:
+        sims = queries @ np.asarray(part).T
+        ids = np.broadcast_to(np.arange(offset, offset + len(part)), sims.shape)
+        all_sims = np.concatenate([best_sims, sims], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        keep = np.argsort(-all_sims, axis=1)[:, :k]
+        best_sims = np.take_along_axis(all_sims, keep, axis=1)
+        best_ids = np.take_along_axis(all_ids, keep, axis=1)
+        offset += len(part)
+    return best_ids
+
+
+def _queries(metadata, n: int, seed: int, noise: float = 0.05):
+    """(row ids, query texts, query vectors): stored chunks, their opening words and a perturbed vector."""
+    rng = np.random.default_rng(seed + 10)
+    rows = rng.choice(len(metadata), min(n, len(metadata)), replace=False)
+    texts = [" ".join(metadata[int(r)]["text"].split()[:12]) for r in rows]
+    vecs = metadata.vectors(rows)
+    vecs += rng.normal(0, noise, vecs.shape).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return rows, texts, vecs
+
+
+def bench_search_index(size: int, opts: dict) -> dict:
+    """
+    Latency of search_index with the configured rerank, and recall@k of its pure-similarity
+    ranking (alpha=1, beta=gamma=0) against brute force over the stored vectors.
+    """
+    from app.services.ann_report import recall_at_k
+    from app.services.vectorstore import _read_from_disk, search_index
+
+    k = opts["k"]
+    build_store(size, opts)
+    start = time.perf_counter()
+    index, metadata = _read_from_disk()
+    load_s = time.perf_counter() - start
+    _, texts, qvecs = _queries(metadata, opts["queries"], opts["seed"])
+
+    lat = Latencies()
+    for text, vec in zip(texts, qvecs):
+        with lat.time():
+            search_index(text, index, metadata, top_k=k, mode=opts["mode"], query_vec=vec)
+
+    found = []
+    for text, vec in zip(texts, qvecs):
+        hits = search_index(text, index, metadata, top_k=k, mode="vector", alpha=1.0, beta=0.0, gamma=0.0, query_vec=vec)
+        ids = [h["chunk_id"] for h in hits] + [-1] * (k - len(hits))
+        found.append(ids)
+    truth = exact_top_k(metadata.vector_parts(), qvecs, k)
+    return {
+        **lat.summary(len(texts), "queries"),
+        "recall": round(recall_at_k(truth, np.array(found)), 4),
+        "k": k,
+        "index": type(index).__name__,
+        "load_s": round(load_s, 3),
+    }
+
+
+def bench_chat(size: int, opts: dict) -> dict:
+    """POST /api/chat through the FastAPI test client (fake embedder and generator, answer cache off)."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.vectorstore import _read_from_disk
+
+    build_store(size, opts)
+    _, metadata = _read_from_disk()
+    _, texts, _ = _queries(metadata, opts["queries"], opts["seed"])
+    del metadata
+
+    lat, errors = Latencies(), 0
+    with TestClient(app) as client:
+        for text in texts:
+            with lat.time():
+                r = client.post("/api/chat", json={"query": text, "search_mode": opts["mode"]})
+            errors += r.status_code != 200
+    return {**lat.summary(len(texts), "requests"), "errors": errors}
+
+
+def bench_upload(size: int, opts: dict) -> dict:
+    """
+    POST /api/upload for documents totalling about `size` chunks (every pdf_every-th one a
+    multi-page PDF) and wait for the ingestion queue to index them all. Latencies are per
+    upload request; throughput is indexed chunks per second from first upload to last job done.
+    """
+    from fastapi.testclient import TestClient
+    from app.config import settings
+    from app.main import app
+    from app.services.vectorstore import index_manager
+    from app.workers.processor import ingestion_queue
+
+    corpus = _corpus(opts)
+    rng = np.random.default_rng(opts["seed"] + 20)
+    lat, job_ids = Latencies(), []
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        for i, (name, text) in enumerate(corpus.documents(size, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)):
+            if opts["pdf_every"] and i % opts["pdf_every"] == opts["pdf_every"] - 1:
+                name, data = name.replace(".txt", ".pdf"), corpus.pdf(rng, opts["pdf_pages"], i)
+            else:
+                data = text.encode("utf-8")
+            with lat.time():
+                r = client.post("/api/upload", files={"file": (name, data)})
+            job_ids.append(r.json()["job_id"])
+        while True:
+            counts = ingestion_queue.store.counts()
+            if not counts.get("queued") and not counts.get("running"):
+                break
+            time.sleep(0.05)
+        seconds = time.perf_counter() - start
+        jobs = [ingestion_queue.store.get(j) for j in job_ids]
+        # let background compaction finish before the scratch directory goes away
+        while index_manager.busy():
+            time.sleep(0.05)
+    chunks = sum((j["result"] or {}).get("chunks_indexed", 0) for j in jobs if j["status"] == "done")
+    job_s = [j["finished_at"] - j["created_at"] for j in jobs if j["finished_at"]]
+    summary = lat.summary(chunks, "chunks", seconds)
+    return {
+        **summary,
+        "documents": len(jobs),
+        "failed": sum(j["status"] == "failed" for j in jobs),
+        "docs_per_s": round(len(jobs) / seconds, 2) if seconds > 0 else None,
+        "job_p50_ms": round(float(np.percentile(job_s, 50)) * 1000, 1) if job_s else None,
+        "job_p99_ms": round(float(np.percentile(job_s, 99)) * 1000, 1) if job_s else None,
+    }
+
+
+SCENARIOS = {
+    "chunk_text": bench_chunk_text,
+    "embed_document": bench_embed_document,
+    "add_to_index": bench_add_to_index,
+    "search_index": bench_search_index,
+    "chat": bench_chat,
+    "upload": bench_upload,
+}
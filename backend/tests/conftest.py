@@ -0,0 +1,67 @@
+# tests/conftest.py
+"""
+Offline test setup: the fake embedding and generation backends, an in-process Mongo
+and every on-disk path under one temporary directory. Settings are read when app.config
+is first imported, so the environment is set here, before any test module imports app.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_ROOT = tempfile.mkdtemp(prefix="kap-tests-")
+
+os.environ.update({
+    "EMBEDDING_BACKEND": "fake",
+    "GENERATION_BACKEND": "fake",
+    "MONGO_URI": "mongomock://local",
+    "STORAGE_PATH": os.path.join(_ROOT, "storage"),
+    "VECTOR_INDEX_PATH": os.path.join(_ROOT, "legacy", "faiss_index.bin"),
+    "METADATA_PATH": os.path.join(_ROOT, "legacy", "metadata.pkl"),
+    "SEGMENTS_DIR": os.path.join(_ROOT, "segments"),
+    "COLLECTIONS_DIR": os.path.join(_ROOT, "collections"),
+    "JOBS_DB_PATH": os.path.join(_ROOT, "jobs.sqlite"),
+    "EMBEDDING_CACHE_PATH": "",
+    "ANSWER_CACHE_SIZE": "0",
+    "INDEX_SHARED": "0",
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_ROOT, ignore_errors=True)
+
+
+def make_document(tag: str, n_chunks: int = 3):
+    """Chunks and fake embeddings for a small document whose words are unique to `tag`."""
+    from app.services.chunking import Chunk
+    from app.services.embeddings import embed_texts
+    texts = [f"{tag} section {i} covers {tag} terms and {tag} payment schedule {i}" for i in range(n_chunks)]
+    chunks, offset = [], 0
+    for text in texts:
+        chunks.append(Chunk(text, offset, offset + len(text)))
+        offset += len(text) + 1
+    return chunks, embed_texts(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    from app.services.segment_store import SegmentStore
+    return SegmentStore(str(tmp_path / "segments"))
+
+
+@pytest.fixture
+def manager(store):
+    from app.services.vectorstore import IndexManager
+    m = IndexManager(store=store, name="test", shared=False)
+    yield m
+    wait_idle(m)
+
+
+def wait_idle(manager, timeout: float = 30.0):
+    """Wait for the manager's background compaction and rebuild threads."""
+    import time
+    end = time.time() + timeout
+    while manager.busy():
+        assert time.time() < end, "background index work did not finish"
+        time.sleep(0.02)
@@ -0,0 +1,76 @@
+# tests/test_chat_stream.py
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from conftest import make_document, wait_idle
+from app.api import chat
+from app.services.generation import FakeGenerationBackend, get_generation_backend, set_generation_backend
+from app.services.shards import collection_manager
+
+
+class FailingGenerationBackend(FakeGenerationBackend):
+    """Streams one token, then fails the way a dropped model connection would."""
+
+    async def stream(self, prompt: str):
+        yield "Partial"
+        raise RuntimeError("model connection dropped")
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture(scope="module")
+def client():
+    manager = collection_manager.get("default", create=True)
+    manager.add(*make_document("invoice"), filename="invoice.txt")
+    manager.add(*make_document("contract"), filename="contract.txt")
+    wait_idle(manager)
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api")
+    with TestClient(app) as c:
+        yield c
+    manager.delete_document("invoice.txt")
+    manager.delete_document("contract.txt")
+    wait_idle(manager)
+
+
+@pytest.fixture
+def generation_backend():
+    previous = get_generation_backend()
+    yield set_generation_backend
+    set_generation_backend(previous)
+
+
+def test_stream_sends_tokens_then_sources_then_done(client, generation_backend):
+    generation_backend(FakeGenerationBackend())
+    r = client.post("/api/chat/stream", json={"query": "invoice payment schedule terms"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(r.text)
+    names = [name for name, _ in events]
+    assert names[-2:] == ["sources", "done"]
+    assert len(names) > 3 and set(names[:-2]) == {"token"}
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    assert "invoice.txt" in answer
+    assert "invoice.txt" in {s["filename"] for s in events[-2][1]}
+    assert events[-1][1]["tokens"] == len(names) - 2
+
+
+def test_stream_reports_generation_failure_as_error_event(client, generation_backend):
+    generation_backend(FailingGenerationBackend())
+    r = client.post("/api/chat/stream", json={"query": "contract payment schedule"})
+    assert r.status_code == 200
+
+    events = parse_events(r.text)
+    assert [name for name, _ in events] == ["token", "error"]
+    assert events[0][1] == {"text": "Partial"}
+    assert "model connection dropped" in events[1][1]["detail"]
@@ -0,0 +1,90 @@
+# tests/test_index_manager.py
+import threading
+
+from conftest import make_document, wait_idle
+from app.config import settings
+from app.services.segment_store import SegmentStore
+from app.services.vectorstore import IndexManager, search_index
+
+
+def test_reupload_keeps_only_the_newest_generation(manager):
+    chunks, embs = make_document("alpha", 3)
+    manager.add(chunks, embeddings=embs, filename="alpha.txt")
+    manager.add(*make_document("beta", 2), filename="beta.txt")
+    new_chunks, new_embs = make_document("alphanew", 4)
+    manager.add(new_chunks, embeddings=new_embs, filename="alpha.txt")
+    wait_idle(manager)
+
+    index, metadata = manager.snapshot()
+    assert sorted(metadata.live_documents()) == ["alpha.txt", "beta.txt"]
+    assert [metadata.text(int(i)) for i in metadata.live_rows_of("alpha.txt")] == [c.text for c in new_chunks]
+    hits = search_index("alpha section 0 covers alpha terms", index, metadata, top_k=10)
+    assert all(h["text"] in {c.text for c in new_chunks} for h in hits if h["filename"] == "alpha.txt")
+
+
+def test_delete_then_reload_from_disk(manager, store):
+    manager.add(*make_document("gamma"), filename="gamma.txt")
+    manager.add(*make_document("delta"), filename="delta.txt")
+    assert manager.delete_document("gamma.txt") == 3
+    assert manager.delete_document("gamma.txt") == 0
+    wait_idle(manager)
+
+    reloaded = IndexManager(store=SegmentStore(store.root), name="reloaded", shared=False)
+    index, metadata = reloaded.snapshot()
+    assert metadata.live_documents() == ["delta.txt"]
+    hits = search_index("gamma section 1 covers gamma terms", index, metadata, top_k=5)
+    assert {h["filename"] for h in hits} == {"delta.txt"}
+
+    assert manager.unload()
+    _, metadata = manager.snapshot()
+    assert metadata.live_documents() == ["delta.txt"]
+
+
+def test_compaction_racing_add_and_search(manager, store, monkeypatch):
+    # every add is its own small segment and every re-upload tombstones one: compaction keeps firing
+    monkeypatch.setattr(settings, "SEGMENT_MAX_COUNT", 3)
+    monkeypatch.setattr(settings, "SEGMENT_SMALL_ROWS", 64)
+    docs = {f"doc{i}.txt": make_document(f"doc{i}") for i in range(30)}
+    manager.add(*docs["doc0.txt"], filename="doc0.txt")
+
+    stop = threading.Event()
+    errors = []
+
+    def searcher():
+        while not stop.is_set():
+            try:
+                with manager.searching() as (index, metadata):
+                    for hit in search_index("doc3 section 1 payment schedule", index, metadata, top_k=5):
+                        assert hit["filename"] in docs
+            except Exception as e:  # surfaced below; a thread cannot fail the test itself
+                errors.append(repr(e))
+                return
+
+    threads = [threading.Thread(target=searcher) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        for round_ in range(2):
+            for name, (chunks, embs) in docs.items():
+                if round_ == 0 and name == "doc0.txt":
+                    continue
+                manager.add(chunks, embeddings=embs, filename=name)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    wait_idle(manager)
+
+    assert errors == []
+    index, metadata = manager.snapshot()
+    assert sorted(metadata.live_documents()) == sorted(docs)
+    assert all(len(metadata.live_rows_of(name)) == 3 for name in docs)
+    # one segment per add without compaction
+    assert len(store.read_manifest()["segments"]) < 2 * len(docs) - 1
+    hits = search_index("doc7 section 2 covers doc7 terms", index, metadata, top_k=1)
+    assert hits[0]["filename"] == "doc7.txt"
+
+    reloaded = IndexManager(store=SegmentStore(store.root), name="reloaded", shared=False)
+    _, on_disk = reloaded.snapshot()
+    assert sorted(on_disk.live_documents()) == sorted(docs)
+    assert len(on_disk) - on_disk.n_deleted == 3 * len(docs)
@@ -0,0 +1,55 @@
+# tests/test_shared_index.py
+import os
+import subprocess
+import sys
+
+from app.services.segment_store import SegmentStore
+from app.services.vectorstore import IndexManager, _read_generation, search_index
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WRITER = """
+import sys, time
+from app.services.embeddings import embed_texts
+from app.services.segment_store import SegmentStore
+from app.services.vectorstore import IndexManager
+
+root, tag, n = sys.argv[1], sys.argv[2], int(sys.argv[3])
+manager = IndexManager(store=SegmentStore(root), name=tag, shared=True)
+for i in range(n):
+    doc = f"{tag}{i}"
+    texts = [f"{doc} section {j} covers {doc} terms and {doc} payment schedule {j}" for j in range(3)]
+    manager.add(texts, embeddings=embed_texts(texts), filename=f"{tag}-{i}.txt")
+    if i % 3 == 2:
+        manager.delete_document(f"{tag}-{i - 1}.txt")
+while manager.busy():
+    time.sleep(0.02)
+"""
+
+
+def test_two_processes_converge_on_one_manifest(tmp_path):
+    root = str(tmp_path / "segments")
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+    n = 12
+    writers = [subprocess.Popen([sys.executable, "-c", WRITER, root, tag, str(n)], env=env, cwd=BACKEND_DIR)
+               for tag in ("a", "b")]
+    assert [w.wait(timeout=300) for w in writers] == [0, 0]
+
+    expected = sorted(f"{tag}-{i}.txt" for tag in ("a", "b") for i in range(n) if i % 3 != 1)
+    store = SegmentStore(root)
+    gen = _read_generation(store)
+    assert gen is not None
+    assert gen["manifest"]["version"] == store.read_manifest()["version"]
+
+    reader = IndexManager(store=store, name="reader", shared=True)
+    index, metadata = reader.snapshot()
+    assert reader.generation == gen["generation"]
+    assert index.ntotal == len(metadata)
+    assert sorted(metadata.live_documents()) == expected
+    for name in ("a-0.txt", "b-11.txt"):
+        tag = name.split(".")[0].replace("-", "")
+        hits = search_index(f"{tag} section 1 covers {tag} terms", index, metadata, top_k=1)
+        assert hits[0]["filename"] == name
+
+    rebuilt = IndexManager(store=SegmentStore(root), name="rebuilt", shared=False)
+    assert sorted(rebuilt.snapshot()[1].live_documents()) == expected